@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+
+"""
+benchmarks.run_benchmarks
+-------------------
+
+Time the stages of the InterVA5 pipeline on synthetic cohorts created by
+resampling the example input (randomva5.csv), and compare the throughput
+with a stored baseline.
+
+Each cohort is run in a separate process, so that the peak resident memory
+(RSS) reported for a cohort only includes that cohort.  The stages are
+those of InterVA5.run() (interva.metrics.STAGES): (load) reading the input
+CSV file; (recode) recoding the input and finding the invalid records;
+(datacheck) the data consistency checks; (scoring) the calculation of the
+propensities; (interpretation) assigning the causes; (write) writing the
+results to a CSV file; and (assembly) building the results; followed by
+the get_csmf(), get_indiv_prob() and utils.csmf() methods.
+
+Usage (from the root of the repository):
+
+    python benchmarks/run_benchmarks.py --sizes 1000 10000
+    python benchmarks/run_benchmarks.py --sizes 1000 --save
+
+The script exits with status 1 if the throughput of any stage is lower than
+the baseline by more than the threshold (25% by default).
+"""
+
+from __future__ import annotations
+from typing import Union
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from multiprocessing import get_context
+from os import path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+import json
+import platform
+import sys
+
+from numpy import nan
+from numpy.random import default_rng
+from pandas import DataFrame, read_csv
+
+import interva
+from interva.data.causetext import CAUSETEXTV5
+from interva.interva5 import (InterVA5, get_example_input, _check_records,
+                              _interpret_records, _score_records)
+from interva.metrics import STAGES as RUN_STAGES
+from interva.preprocessing import recode, validity_masks
+from interva.probbase import compile_probbase
+from interva.utils import csmf
+from interva.writers import CSVWriter
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+STAGES = RUN_STAGES + ["get_csmf", "get_indiv_prob", "utils.csmf"]
+DEFAULT_BASELINE = path.join(path.dirname(path.abspath(__file__)),
+                             "baseline.json")
+
+
+def make_cohort(n: int, seed: int = 0) -> DataFrame:
+    """Return n VA records sampled (with replacement) from the example
+    input, with new IDs."""
+
+    example_input = get_example_input()
+    rng = default_rng(seed)
+    rows = rng.integers(0, example_input.shape[0], size=n)
+    cohort = example_input.iloc[rows].reset_index(drop=True)
+    cohort["ID"] = ["d" + str(i + 1) for i in range(n)]
+    return cohort
+
+
+@contextmanager
+def _timer(timings: dict, stage: str):
+    start = perf_counter()
+    yield
+    timings[stage] = perf_counter() - start
+
+
+def _peak_rss_mb() -> Union[float, None]:
+    """Return the peak RSS of the current process in MB (None if it is not
+    available)."""
+
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return peak / 2**20  # bytes
+    return peak / 2**10  # kilobytes
+
+
+def run_stages(n: int, seed: int = 0, output: str = "classic",
+               scoring: str = "sequential") -> dict:
+    """Run each stage of the pipeline on a cohort of n records and return
+    the elapsed time (in seconds) of each stage and the peak RSS."""
+
+    timings = {}
+    with TemporaryDirectory() as directory:
+        input_file = path.join(directory, "cohort.csv")
+        make_cohort(n, seed).to_csv(input_file, index=False)
+
+        with _timer(timings, "load"):
+            va_input = read_csv(input_file)
+
+        # set up the run as InterVA5.run() does (not timed)
+        iv5 = InterVA5(va_input, hiv="h", malaria="l", write=False)
+        probbaseV5 = compile_probbase()
+        cause_prior = probbaseV5.prior(iv5.hiv, iv5.malaria)
+        prob_names = DataFrame(CAUSETEXTV5).transpose().iloc[:, 0].copy()
+        va_input_names = va_input.columns
+
+        with _timer(timings, "recode"):
+            codes = recode(va_input)
+            valid = validity_masks(codes)
+
+        with _timer(timings, "datacheck"):
+            checked = _check_records(va_input.iloc[:, 0], codes, valid,
+                                     va_input_names, probbaseV5,
+                                     return_checked_data=False)
+
+        with _timer(timings, "scoring"):
+            prob_all = _score_records(checked["symptoms"], probbaseV5,
+                                      cause_prior, scoring)
+
+        with _timer(timings, "interpretation"):
+            chunk_out = _interpret_records(checked, prob_all, prob_names,
+                                           iv5.malaria, iv5.hiv)
+
+        with _timer(timings, "assembly"):
+            ID_list = [va_id if len(va_result) > 0 else nan
+                       for va_id, va_result in zip(chunk_out["ID"],
+                                                   chunk_out["VA5"])]
+            iv5._assemble_results(ID_list, chunk_out["VA5"],
+                                  [chunk_out["prob"]],
+                                  chunk_out["checked_data"],
+                                  [chunk_out["dem_group"]], va_input_names,
+                                  prob_names)
+
+        with _timer(timings, "write"):
+            with CSVWriter(path.join(directory, "VA5_result.csv"),
+                           output=output,
+                           cause_names=list(prob_names)) as result_writer:
+                chunk_prob = iter(chunk_out["prob"])
+                for va_result in chunk_out["VA5"]:
+                    if len(va_result) > 0:
+                        result_writer.write(va_result, next(chunk_prob))
+
+        with _timer(timings, "get_csmf"):
+            iv5.get_csmf()
+
+        with _timer(timings, "get_indiv_prob"):
+            iv5.get_indiv_prob()
+
+        with _timer(timings, "utils.csmf"):
+            csmf(iv5, top=10)
+
+    return {"timings": timings, "peak_rss_mb": _peak_rss_mb()}
+
+
+def benchmark(n: int, repeat: int = 1, seed: int = 0,
+              output: str = "classic", scoring: str = "sequential") -> dict:
+    """Run the stages on a cohort of n records (each repetition in a new
+    process) and return the best time, the throughput (records/s) of each
+    stage, and the largest peak RSS."""
+
+    runs = []
+    for _ in range(repeat):
+        with ProcessPoolExecutor(max_workers=1,
+                                 mp_context=get_context("spawn")) as executor:
+            runs.append(executor.submit(run_stages, n, seed, output,
+                                        scoring).result())
+    stages = {}
+    for stage in STAGES:
+        seconds = min(x["timings"][stage] for x in runs)
+        stages[stage] = {"seconds": seconds,
+                         "records_per_s": n / seconds if seconds > 0 else None}
+    peak_rss = [x["peak_rss_mb"] for x in runs if x["peak_rss_mb"] is not None]
+    return {"stages": stages,
+            "peak_rss_mb": max(peak_rss) if len(peak_rss) > 0 else None}
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """Return the (size, stage, baseline, current) throughputs that are lower
+    than the baseline by more than the threshold (a fraction)."""
+
+    regressions = []
+    for size, result in results.items():
+        base_stages = baseline.get(size, {}).get("stages", {})
+        for stage, values in result["stages"].items():
+            base = base_stages.get(stage, {}).get("records_per_s")
+            current = values["records_per_s"]
+            if base is None or current is None:
+                continue
+            if current < base * (1 - threshold):
+                regressions.append((size, stage, base, current))
+    return regressions
+
+
+def report(results: dict, baseline: dict, threshold: float) -> None:
+    """Print the throughput of each stage and the change from the
+    baseline."""
+
+    for size, result in results.items():
+        peak_rss = result["peak_rss_mb"]
+        print(f"\n{size} records (peak RSS: "
+              f"{'n/a' if peak_rss is None else f'{peak_rss:.0f} MB'})")
+        print(f"{'stage':<16}{'seconds':>10}{'records/s':>14}"
+              f"{'baseline':>14}{'change':>9}")
+        base_stages = baseline.get(size, {}).get("stages", {})
+        for stage, values in result["stages"].items():
+            current = values["records_per_s"]
+            base = base_stages.get(stage, {}).get("records_per_s")
+            line = (f"{stage:<16}{values['seconds']:>10.3f}"
+                    f"{current or 0:>14.0f}")
+            if base is not None and current is not None:
+                change = current / base - 1
+                line = line + f"{base:>14.0f}{change:>+9.0%}"
+                if change < -threshold:
+                    line = line + "  REGRESSION"
+            print(line)
+
+
+def main(args: Union[list, None] = None) -> int:
+    parser = ArgumentParser(
+        description="Benchmark the stages of the InterVA5 pipeline.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000],
+                        help="number of records in each cohort (e.g., 1000 "
+                             "10000 100000 1000000)")
+    parser.add_argument("--repeat", type=int, default=1,
+                        help="number of runs of each cohort (the best time "
+                             "of each stage is kept)")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="seed used to resample the example input")
+    parser.add_argument("--output", default="classic",
+                        choices=["classic", "extended"],
+                        help="format of the CSV results")
+    parser.add_argument("--scoring", default="sequential",
+                        choices=["sequential", "log"],
+                        help="scoring engine")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE,
+                        help="JSON file with the baseline results")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="largest accepted drop in throughput, as a "
+                             "fraction of the baseline")
+    parser.add_argument("--save", action="store_true",
+                        help="store the results in the baseline file")
+    args = parser.parse_args(args)
+
+    baseline = {}
+    if path.isfile(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f).get("results", {})
+
+    results = {}
+    for n in args.sizes:
+        print(f"Running {n} records...")
+        results[str(n)] = benchmark(n, repeat=args.repeat, seed=args.seed,
+                                    output=args.output, scoring=args.scoring)
+    report(results, baseline, args.threshold)
+
+    if args.save:
+        baseline.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump({"interva": interva.__version__,
+                       "python": platform.python_version(),
+                       "platform": platform.platform(),
+                       "results": baseline}, f, indent=2)
+            f.write("\n")
+        print(f"\nBaseline saved to {args.baseline}")
+        return 0
+
+    regressions = compare(results, baseline, args.threshold)
+    if len(regressions) > 0:
+        print(f"\n{len(regressions)} stage(s) slower than the baseline by "
+              f"more than {args.threshold:.0%}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
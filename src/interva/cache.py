@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+
+"""
+interva.cache
+-------------------
+
+This module contains the cache of the data consistency checks, which lets
+InterVA5 skip the checks of records that have already been checked (e.g.,
+when a cumulative dataset is processed again).
+"""
+
+from __future__ import annotations
+from typing import Union
+from collections import OrderedDict
+from hashlib import sha256
+from os import replace
+from os.path import isfile
+from threading import Lock
+from numpy import int8, ndarray, isnan
+import pickle
+
+from interva.preprocessing import MISSING
+
+# default maximum number of records kept in a DatacheckCache
+MAX_RECORDS = 1000000
+
+
+class DatacheckCache:
+    """Output of the data consistency checks (checked values, and first and
+    second pass messages) of each record, keyed by a
+    hash of the record (its ID and recoded values) and of the probbase.  The
+    max_records most recently used records are kept.
+
+    If path is given and the file exists, the cache is loaded from it, and
+    save() writes the cache back to it (so it can be reused by later
+    processes).
+
+    :param max_records: maximum number of records kept in the cache
+    :type max_records: int
+    :param path: path to the file that stores the cache
+    :type path: str
+    """
+
+    def __init__(self, max_records: int = MAX_RECORDS,
+                 path: Union[str, None] = None):
+
+        self.max_records = max_records
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = Lock()
+        if path is not None and isfile(path):
+            with open(path, "rb") as f:
+                self._entries = pickle.load(f)
+            self._evict()
+
+    def __repr__(self):
+        return (f"interva.cache.DatacheckCache(records = {len(self)}, "
+                f"max_records = {self.max_records}, path = {self.path})")
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __getstate__(self) -> dict:
+        # (the lock cannot be pickled, e.g., to send the cache to the
+        # worker processes)
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._lock = Lock()
+
+    @staticmethod
+    def key(probbase_key: str, va_id: str, codes: ndarray) -> bytes:
+        """Return the key of a record: a hash of the probbase key, the
+        record ID, and the recoded values (see
+        interva.preprocessing.recode) without the ID column."""
+
+        digest = sha256(probbase_key.encode())
+        digest.update(str(va_id).encode())
+        digest.update(b"\0")
+        digest.update(codes.astype(int8).tobytes())
+        return digest.digest()
+
+    def get(self, key: bytes) -> Union[tuple, None]:
+        """Return the entry of a record (see put()), or None if it is not
+        in the cache."""
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses = self.misses + 1
+            else:
+                self.hits = self.hits + 1
+                self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key: bytes, entry: tuple) -> None:
+        """Add the entry of a record: a tuple with the checked values
+        (recoded as with interva.preprocessing.recode) and the first and
+        second pass messages (see make_entry())."""
+
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            self._evict()
+
+    def update(self, entries: dict) -> None:
+        """Add the entries in a dictionary (key: entry)."""
+
+        with self._lock:
+            for key, entry in entries.items():
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+            self._evict()
+
+    def clear(self) -> None:
+        """Remove all records from the cache."""
+
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def save(self, path: Union[str, None] = None) -> None:
+        """Write the cache to a file (by default, the path given when the
+        cache was created)."""
+
+        if path is None:
+            path = self.path
+        if path is None:
+            raise IOError("error: please provide a path to save the cache")
+        with self._lock:
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump(self._entries, f,
+                            protocol=pickle.HIGHEST_PROTOCOL)
+            replace(tmp_path, path)
+
+    def _evict(self) -> None:
+        """Remove the least recently used records beyond max_records."""
+
+        while len(self._entries) > self.max_records:
+            self._entries.popitem(last=False)
+
+
+def make_entry(checked_values: ndarray, first_pass: list,
+               second_pass: list) -> tuple:
+    """Return the cache entry of a record from the checked values (a float
+    array with NaN for missing values, without the ID column) and the other
+    outputs of the data checks."""
+
+    codes = checked_values.astype(float)
+    missing = isnan(codes)
+    codes[missing] = MISSING
+    return codes.astype(int8), list(first_pass), list(second_pass)
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+
+"""
+interva.csmf
+-------------------
+
+This module contains an accumulator of the cause-specific mortality
+fractions (CSMF) that is updated as the VA records are scored, instead of
+recalculating the CSMF from all of the results.
+"""
+
+from __future__ import annotations
+from typing import Union, TYPE_CHECKING
+from pandas import DataFrame, Index, Series
+from numpy import asarray, float64, zeros
+
+from interva.exceptions import ArgumentException
+from interva.results import get_propensities
+from interva.utils import _cause_index, _csmf_dist, _normalize_csmf, _top_csmf
+if TYPE_CHECKING:
+    import interva.interva5
+
+
+class CSMFAccumulator:
+    """Running totals of the population distribution of the causes (see
+    interva.utils.csmf) for all records and for each age and sex group.
+    The totals are updated with the propensities of one record or a batch
+    of records at a time, and accumulators of different subsets of the
+    records (e.g., from parallel workers) can be merged.  The CSMF is the
+    same as utils.csmf() for the same records, up to the rounding errors of
+    the order in which the propensities are added.
+
+    :param cause_names: names of the causes (e.g.,
+    InterVA5.results["cause_names"])
+    :type cause_names: pandas.Index
+    :param interva_rule: If True, only the top 3 causes reported
+    by InterVA are used in the calculation of the CSMF; the rest
+    of the propensity is assigned to "Undetermined".
+    :type interva_rule: bool
+    :param top_aggregate: Integer indicating how many causes from the top need
+    to go into the summary (only used if interva_rule is False).
+    :type top_aggregate: Union[int, None]
+    """
+
+    def __init__(self, cause_names: Index, interva_rule: bool = True,
+                 top_aggregate: Union[int, None] = None):
+
+        self.cause_names = Index(cause_names)
+        self.interva_rule = interva_rule
+        cause_index, self._include_prob_ac = _cause_index(self.cause_names)
+        if top_aggregate is None:
+            top_aggregate = len(cause_index)
+        self.top_aggregate = top_aggregate
+        self._total = self._new_totals()
+        self._groups: dict = {}
+
+    def __repr__(self):
+        return (f"interva.csmf.CSMFAccumulator(n_records = {self.n_records}, "
+                f"interva_rule = {self.interva_rule}, "
+                f"top_aggregate = {self.top_aggregate})")
+
+    @property
+    def n_records(self) -> int:
+        """Number of records added to the accumulator."""
+
+        return self._total["n_records"]
+
+    @property
+    def groups(self) -> list:
+        """The (age, sex) groups of the records added with dem_group."""
+
+        return list(self._groups)
+
+    def update(self, prob, dem_group=None) -> CSMFAccumulator:
+        """Add the propensities of one record or a batch of records.
+
+        :param prob: propensities of the causes for one record, or for each
+        record (rows) of a batch
+        :type prob: numpy.ndarray
+        :param dem_group: the age and sex group of the record (a dict with
+        the keys "age" and "sex") or of each record of the batch (a
+        DataFrame with the columns "age" and "sex", in the order of the rows
+        of prob, e.g., InterVA5.dem_group).  If None, the records are only
+        added to the total.
+        :type dem_group: dict or pandas.DataFrame
+        :return: the accumulator
+        :rtype: CSMFAccumulator
+        """
+
+        prob = asarray(prob, dtype=float64)
+        if prob.ndim == 1:
+            prob = prob.reshape(1, -1)
+            if isinstance(dem_group, dict):
+                dem_group = DataFrame([dem_group])
+        if prob.shape[1] != len(self.cause_names):
+            raise ArgumentException(
+                "The propensities must have one column per cause "
+                f"({len(self.cause_names)})")
+        if dem_group is None:
+            _add_totals(self._total, self._batch_totals(prob))
+            return self
+        dem_group = DataFrame(dem_group)
+        if dem_group.shape[0] != prob.shape[0]:
+            raise ArgumentException(
+                "dem_group must have one row per record")
+        groups = dem_group.groupby(["age", "sex"], sort=False,
+                                   observed=True).indices
+        for key, rows in groups.items():
+            batch = self._batch_totals(prob[rows])
+            if key not in self._groups:
+                self._groups[key] = self._new_totals()
+            _add_totals(self._groups[key], batch)
+            _add_totals(self._total, batch)
+        return self
+
+    def add_results(self, iva5: interva.interva5.InterVA5
+                    ) -> CSMFAccumulator:
+        """Add the records of the results of InterVA5.run() (with their age
+        and sex groups)."""
+
+        if len(iva5.results) == 0:
+            raise ArgumentException("No results (need to use run() method).")
+        if iva5.results["VA5"] is None:
+            return self
+        _, prob, _ = get_propensities(iva5.results)
+        return self.update(prob, iva5.dem_group)
+
+    def merge(self, other: CSMFAccumulator) -> CSMFAccumulator:
+        """Add the totals of another accumulator (with the same causes and
+        settings) to this one."""
+
+        if (not self.cause_names.equals(other.cause_names) or
+                self.interva_rule != other.interva_rule or
+                self.top_aggregate != other.top_aggregate):
+            raise ArgumentException(
+                "Only accumulators with the same causes, interva_rule and "
+                "top_aggregate can be merged")
+        _add_totals(self._total, other._total)
+        for key, totals in other._groups.items():
+            if key not in self._groups:
+                self._groups[key] = self._new_totals()
+            _add_totals(self._groups[key], totals)
+        return self
+
+    def csmf(self, top: int = 10, age: Union[None, str] = None,
+             sex: Union[None, str] = None) -> Series:
+        """Return top causes in cause-specific mortality fraction (CSMF) of
+        all records or of the records in an age and/or sex group.
+
+        :param top: number of top causes in the CSMF to be determined.
+        :type top: int
+        :param age: Name of age group to obtain group-specific results (e.g.,
+        "adult", "child", or "neonate").  If None, then all groups are
+        combined.
+        :type age: str
+        :param sex: Either "female" or "male" to obtain sex-specific results.
+        If None, then these groups are combined.
+        :type sex: str
+        :return: the top causes in CSMF with their values.
+        :rtype: pandas.series
+        """
+
+        if age is None and sex is None:
+            totals = self._total
+        else:
+            totals = self._new_totals()
+            for (group_age, group_sex), group_totals in self._groups.items():
+                if ((age is None or group_age == age.lower()) and
+                        (sex is None or group_sex == sex.lower())):
+                    _add_totals(totals, group_totals)
+        if totals["n_records"] == 0:
+            raise ArgumentException("No VA results found.")
+        dist_cod = _normalize_csmf(totals["dist"], totals["undetermined"],
+                                   self.cause_names, self.interva_rule)
+        return _top_csmf(dist_cod, top)
+
+    def _new_totals(self) -> dict:
+        return {"dist": zeros(len(self.cause_names)), "undetermined": 0.0,
+                "n_records": 0}
+
+    def _batch_totals(self, prob) -> dict:
+        """Return the population distribution of the records in prob."""
+
+        dist, undetermined = _csmf_dist(prob, self._include_prob_ac,
+                                        interva_rule=self.interva_rule,
+                                        top_aggregate=self.top_aggregate)
+        return {"dist": dist, "undetermined": undetermined,
+                "n_records": prob.shape[0]}
+
+
+def _add_totals(totals: dict, other: dict) -> None:
+    """Add the totals in other to those in totals."""
+
+    totals["dist"] = totals["dist"] + other["dist"]
+    totals["undetermined"] = totals["undetermined"] + other["undetermined"]
+    totals["n_records"] = totals["n_records"] + other["n_records"]
@@ -148,3 +148,9 @@ CAUSETEXTV5 = {
     "c_resr": {"cause": "Resources",
                "code": "Resources"}
 }
+
+# the cause text as a table: one (cause, code) row per cause, in the order
+# of the causes (see interva.registry)
+CAUSETEXTV5_INDEX = tuple(CAUSETEXTV5)
+CAUSETEXTV5_ROWS = tuple((text["cause"], text["code"])
+                         for text in CAUSETEXTV5.values())
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+
+"""
+interva.data.valabels
+~~~~~~~~~~~~~~
+This module contains the standard column names of the InterVA5 input (the
+columns of data/randomva5.csv).
+"""
+
+VALABELS = (
+    "ID", "i004a", "i004b", "i019a", "i019b", "i022a", "i022b", "i022c",
+    "i022d", "i022e", "i022f", "i022g", "i022h", "i022i", "i022j", "i022k",
+    "i022l", "i022m", "i022n", "i059o", "i077o", "i079o", "i082o", "i083o",
+    "i084o", "i085o", "i086o", "i087o", "i089o", "i090o", "i091o", "i092o",
+    "i093o", "i094o", "i095o", "i096o", "i098o", "i099o", "i100o", "i104o",
+    "i105o", "i106a", "i107o", "i108a", "i109o", "i110o", "i111o", "i112o",
+    "i113o", "i114o", "i115o", "i116o", "i120a", "i120b", "i123o", "i125o",
+    "i127o", "i128o", "i129o", "i130o", "i131o", "i132o", "i133o", "i134o",
+    "i135o", "i136o", "i137o", "i138o", "i139o", "i140o", "i141o", "i142o",
+    "i143o", "i144o", "i147o", "i148a", "i148b", "i148c", "i149o", "i150a",
+    "i151a", "i152o", "i153o", "i154a", "i154b", "i155o", "i156o", "i157o",
+    "i158o", "i159o", "i161a", "i165a", "i166o", "i167a", "i167b", "i168o",
+    "i169a", "i169b", "i170o", "i171o", "i172o", "i173a", "i174o", "i175o",
+    "i176a", "i178a", "i181o", "i182a", "i182b", "i182c", "i183a", "i184a",
+    "i185o", "i186o", "i187o", "i188o", "i189o", "i190o", "i191o", "i192o",
+    "i193o", "i194o", "i195o", "i197a", "i197b", "i199a", "i199b", "i200o",
+    "i201a", "i201b", "i203a", "i204o", "i205a", "i205b", "i207o", "i208o",
+    "i209a", "i209b", "i210o", "i211a", "i212o", "i213o", "i214o", "i215o",
+    "i216a", "i217o", "i218o", "i219o", "i220o", "i221a", "i221b", "i222o",
+    "i223o", "i224o", "i225o", "i226o", "i227o", "i228o", "i229o", "i230o",
+    "i231o", "i232a", "i233o", "i234a", "i234b", "i235a", "i235b", "i235c",
+    "i235d", "i236o", "i237o", "i238o", "i239o", "i240o", "i241o", "i242o",
+    "i243o", "i244o", "i245o", "i246o", "i247o", "i248a", "i249o", "i250a",
+    "i251o", "i252o", "i253o", "i254o", "i255o", "i256o", "i257o", "i258o",
+    "i259o", "i260a", "i260b", "i260c", "i260d", "i260e", "i260f", "i260g",
+    "i261o", "i262a", "i263a", "i263b", "i264o", "i265o", "i266a", "i267o",
+    "i268o", "i269o", "i270o", "i271o", "i272o", "i273o", "i274a", "i275o",
+    "i276o", "i277o", "i278o", "i279o", "i281o", "i282o", "i283o", "i284o",
+    "i285a", "i286o", "i287o", "i288o", "i289o", "i290o", "i294o", "i295o",
+    "i296o", "i297o", "i298o", "i299o", "i300o", "i301o", "i302o", "i303a",
+    "i304o", "i305o", "i306o", "i309o", "i310o", "i312o", "i313o", "i314o",
+    "i315o", "i316o", "i317o", "i318o", "i319a", "i319b", "i320o", "i321o",
+    "i322o", "i323o", "i324o", "i325o", "i326o", "i327o", "i328o", "i329o",
+    "i330o", "i331o", "i332a", "i333o", "i334o", "i335o", "i336o", "i337a",
+    "i337b", "i337c", "i338o", "i340o", "i342o", "i343o", "i344o", "i347o",
+    "i354o", "i355a", "i356o", "i357o", "i358a", "i360a", "i360b", "i360c",
+    "i361o", "i362o", "i363o", "i364o", "i365o", "i367a", "i367b", "i367c",
+    "i368o", "i369o", "i370o", "i371o", "i372o", "i373o", "i376o", "i377o",
+    "i382a", "i383o", "i384o", "i385a", "i387o", "i388o", "i389o", "i391o",
+    "i393o", "i394a", "i394b", "i395o", "i396o", "i397o", "i398o", "i399o",
+    "i400o", "i401o", "i402o", "i403o", "i404o", "i405o", "i406o", "i408o",
+    "i411o", "i412o", "i413o", "i414a", "i415a", "i418o", "i419o", "i420o",
+    "i421o", "i422o", "i423o", "i424o", "i425o", "i426o", "i427o", "i428o",
+    "i450o", "i451o", "i452o", "i453o", "i454o", "i455o", "i456o", "i457o",
+    "i458o", "i459o",
+)
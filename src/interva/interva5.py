@@ -7,25 +7,49 @@ interva.interva5
 This module contains the class for the InterVA5 algorithm.
 """
 from __future__ import annotations
-from typing import Union, TYPE_CHECKING
+from typing import (AsyncIterator, Callable, Iterable, Iterator, Union,
+                    TYPE_CHECKING)
 if TYPE_CHECKING:
     import PyQt5
-from pandas import (DataFrame, Index, Series, read_csv, read_excel, to_numeric,
-                    isna, set_option)
-from numpy import (ndarray, nan, nansum, nanmax, argsort, array, delete, where,
-                   concatenate, copy)
-from decimal import Decimal
-from math import isclose
-from os import path, chdir, getcwd, mkdir
-from logging import INFO, FileHandler, getLogger
-from csv import writer
+from pandas import (DataFrame, Index, Series, concat, read_csv, read_parquet,
+                    isna)
+from pandas.util import hash_pandas_object
+from numpy import (ndarray, nan, nansum, nanmax, array, asarray, inf, where,
+                   concatenate, copy, empty, float64, isnan)
+from math import ceil
+from collections import deque
+from asyncio import get_running_loop, wait
+from concurrent.futures import Executor, ProcessPoolExecutor
+from inspect import isawaitable
+from itertools import chain
+from os import path, cpu_count, getcwd, mkdir, remove, stat
+from logging import INFO, FileHandler, Logger, getLogger
 import datetime
-from pkgutil import get_data
-from io import BytesIO
+from hashlib import sha256
+from threading import Event
+from time import perf_counter, thread_time
+from tempfile import TemporaryFile
 import warnings
 
-from interva.data.causetext import CAUSETEXTV5
-from interva.utils import _get_dem_groups
+from interva.cache import DatacheckCache, make_entry
+from interva.data.valabels import VALABELS
+from interva.exceptions import ArgumentException
+from interva.metrics import (add_to, new_counts, new_timings, timed,
+                             timed_iter)
+from interva.preprocessing import (MISSING, recode, to_object,
+                                   validity_masks)
+from interva.probbase import CompiledProbbase, compile_probbase
+# (re-exported: get_probbase() was moved to interva.probbase, and is still
+# imported from interva.interva5)
+from interva.probbase import get_probbase  # noqa: F401
+from interva.registry import get_asset
+from interva.results import Results, get_propensities
+from interva.scoring import score_batch, score_batch_log
+from interva.sparse import SymptomMatrix
+from interva.writers import (ID_INDEX_SUFFIX, CSVWriter, IDIndex,
+                             ParquetWriter)
+from interva.utils import (_csmf_dist, _get_age_group_all_frame,
+                           _get_dem_groups_frame, _indiv_cod)
 from vacheck.datacheck5 import datacheck5
 
 
@@ -33,7 +57,8 @@ class InterVA5:
     """InterVA5 algorithm for assigning cause of death.
 
     :param va_input: Verbal Autopsy data
-    :type va_input: pandas DataFrame or path to CSV file
+    :type va_input: pandas DataFrame, path to CSV or Parquet file, or an
+    iterable of pandas DataFrames (chunks of records)
     :param hiv: likelihood of HIV as a cause of death.  Possible values are
     "H" for high (~ 1:100 deaths), "L" for low (~ 1:1000), or "V" for very
     low (~ 1:10000)
@@ -48,7 +73,9 @@ class InterVA5:
     :param directory: The directory to store the output from InterVA5.
     It should either be an existing valid directory, or a new folder to be
     created.  If no path is given and the parameter for "write" is True, then
-    the function stops and an error message is produced.
+    the function stops and an error message is produced.  The output files
+    are written in this directory without changing the working directory
+    (a relative path given as va_input is relative to this directory).
     :type directory: directory or string
     :param filename: the filename the user wishes to save the output.
     No extension needed. The output is in .csv format by default.
@@ -56,7 +83,9 @@ class InterVA5:
     :param output: the format of the output. Possible Values are
     "classic": the same delimited output format as InterVA5, or
     "extended": delimited output followed by full distribution of cause of
-    death probability
+    death probability, or "parquet": the same columns as "extended" written
+    to a Parquet file (filename.parquet) with typed columns (requires the
+    pyarrow package)
     :type output: string
     :param append: a logical value indicating whether or not the new output
     should be appended to the existing file.
@@ -65,14 +94,86 @@ class InterVA5:
     will be included in the output causes.
     :type groupcode: boolean
     :param sci: an array containing the symptom-cause-information
-    (aka Probbase) that InterVA uses to assign a cause of death.
+    (aka Probbase) that InterVA uses to assign a cause of death.  The
+    numeric form of the probbase is compiled once and cached (see
+    interva.probbase.compile_probbase).
     :type sci: pandas DataFrame or numpy ndarray
     :param return_checked_data: a logical value indicating if the checked data
     (i.e., the data that have been modified by the consistency checks) should
     be returned.
     :type return_checked_data: boolean
     :param openva_app: instance of the openva_app (used for updating progress
-    bar, which requires the PyQt5 package to be installed).
+    bar, which requires the PyQt5 package to be installed).  The progress
+    (in percent) is only emitted when it changes.
+    :param gui_ctrl: a dictionary whose "break" value is checked after each
+    record; run() stops (raising a RuntimeError) when it is True.  If None,
+    a new dictionary is created for the instance.
+    :type gui_ctrl: dict
+    :param chunksize: number of records that are read, checked, scored, and
+    written at a time.  If va_input is the path to a CSV file, the file is
+    read in chunks of this size, so the input does not need to fit in memory.
+    If None, all of the records are processed at once.
+    :type chunksize: int
+    :param n_jobs: number of worker processes used to check and score the
+    records (-1 uses all of the CPUs).  The records are split into chunks
+    that are processed in parallel, and the results are combined in the
+    original order, so the output does not depend on the number of workers.
+    If None (default), all records are processed in the calling process.
+    Note that the worker processes re-import the calling script on
+    platforms that do not use fork (e.g., Windows and macOS), so it needs
+    the usual if __name__ == "__main__" guard.
+    :type n_jobs: int
+    :param write_buffer_size: number of VA results collected before they are
+    written to the output file (which is kept open while the records are
+    processed).
+    :type write_buffer_size: int
+    :param metrics: a function that is called with a dictionary describing
+    each chunk of records after it has been processed ("event": "chunk") and
+    the whole run at the end ("event": "run").  The dictionary includes
+    "timings", the wall and CPU time (in seconds) spent in each stage of the
+    pipeline (see interva.metrics.STAGES), and "counts", the number of
+    records that were processed, were valid, or were excluded because the
+    age, the sex, or all of the symptoms were missing, the number of values
+    changed by the data consistency checks, and the number of records whose
+    checks were taken from datacheck_cache.  The timings of the
+    records checked and scored by worker processes (n_jobs > 1) are the
+    sum over the workers.
+    :type metrics: callable
+    :param verbose: a logical value indicating whether run() prints its
+    progress and messages to stdout.
+    :type verbose: boolean
+    :param cache_checked: a logical value indicating whether the output of
+    the data checks is kept after run(), so that calling run() again after
+    changing the HIV or malaria levels (e.g., with set_hiv() and
+    set_malaria()) only scores the records again.  The output is reused if
+    the VA input (a pandas DataFrame with the same content, or a file that
+    has not been modified), the probbase, and return_checked_data have not
+    changed; an iterator of chunks is always checked again.  This is off by
+    default because each run then hashes the whole VA input and keeps the
+    checked symptoms of every record in memory until the next run.
+    :type cache_checked: boolean
+    :param scoring: the engine used to calculate the propensities.
+    "sequential" (default) multiplies the likelihoods of the symptoms one at
+    a time, renormalizing after each one, and reproduces the original
+    algorithm exactly; "log" sums the log-likelihoods with a matrix product
+    and normalizes once, which is faster and gives propensities that differ
+    by less than interva.scoring.LOG_SCORING_TOLERANCE (1e-12) from the
+    sequential ones (so a result can change only if a propensity is within
+    this distance of a cutoff or a tie).
+    :type scoring: string
+    :param datacheck_cache: a cache of the output of the data checks (or the
+    path to the file that stores it), so that records that have already been
+    checked (with the same ID, values, and probbase) are not checked again.
+    If a path is given, the cache is loaded from the file (if it exists) at
+    the start of run() and saved to it at the end.
+    :type datacheck_cache: interva.cache.DatacheckCache or string
+    :param incremental: a logical value indicating whether only the records
+    with IDs that are not already in the output file are processed (their
+    results are appended to the output file and their messages to the error
+    log).  The IDs of the processed records are kept in a file next to the
+    output (filename + "_ids.txt"), or read from the output file if it does
+    not exist.  The results of run() only include the new records.
+    :type incremental: boolean
     """
 
     def __init__(self, va_input: Union[DataFrame, str], hiv: str, malaria: str,
@@ -83,7 +184,16 @@ class InterVA5:
                  return_checked_data: bool = False,
                  openva_app: Union[None,
                                    PyQt5.QtWidgets.QWidget] = None,
-                 gui_ctrl: dict = {"break": False}) -> dict:
+                 gui_ctrl: Union[dict, None] = None,
+                 chunksize: Union[int, None] = None,
+                 n_jobs: Union[int, None] = None,
+                 write_buffer_size: int = 1000,
+                 metrics: Union[Callable, None] = None,
+                 verbose: bool = True,
+                 cache_checked: bool = False,
+                 scoring: str = "sequential",
+                 datacheck_cache: Union[DatacheckCache, str, None] = None,
+                 incremental: bool = False) -> dict:
 
         self.va_input = va_input
         self.hiv = hiv
@@ -99,8 +209,29 @@ class InterVA5:
         self.openva_app = openva_app
         self.checked_data: Union[DataFrame, str] = ""
         self.results: dict = {}
+        if gui_ctrl is None:
+            gui_ctrl = {"break": False}
         self.gui_ctrl = gui_ctrl
         self.dem_group: DataFrame = DataFrame({})
+        # detailed age group of the records in dem_group (see
+        # utils.stratified_csmf)
+        self._detailed_age: Series = Series(dtype=object)
+        self.chunksize = chunksize
+        self.n_jobs = n_jobs
+        self.write_buffer_size = write_buffer_size
+        self.metrics = metrics
+        self.verbose = verbose
+        self.cache_checked = cache_checked
+        self.scoring = scoring
+        self.datacheck_cache = datacheck_cache
+        self.incremental = incremental
+        self._checked: Union[dict, None] = None
+        self.n_records: int = 0
+        # progress of the current run: records processed and total (None if
+        # not known in advance), and the event set to cancel the run
+        self._progress: tuple = (0, None)
+        self._emitted: Union[int, None] = None
+        self._cancel: Union[Event, None] = None
 
     def __repr__(self):
         sci_msg = "None\n"
@@ -119,14 +250,23 @@ class InterVA5:
                f"sci = " + sci_msg +
                f"return_checked_data = {self.return_checked_data}\n"
                f"openva_app = {self.openva_app}\n"
-               f"gui_ctrl = {self.gui_ctrl}\n" + ")")
+               f"gui_ctrl = {self.gui_ctrl}\n"
+               f"chunksize = {self.chunksize}\n"
+               f"n_jobs = {self.n_jobs}\n"
+               f"write_buffer_size = {self.write_buffer_size}\n"
+               f"metrics = {self.metrics}\n"
+               f"verbose = {self.verbose}\n"
+               f"cache_checked = {self.cache_checked}\n"
+               f"scoring = {self.scoring}\n"
+               f"datacheck_cache = {self.datacheck_cache}\n"
+               f"incremental = {self.incremental}\n" + ")")
         return msg
 
     def __str__(self):
         if len(self.results) == 0:
             if isinstance(self.va_input, DataFrame):
                 data_msg = f"{self.va_input.shape[0]} VA records loaded\n"
-            elif isinstance(self.va_input, DataFrame):
+            elif isinstance(self.va_input, str):
                 data_msg = f"VA records from {self.va_input}\n"
             else:
                 data_msg = "No VA records!\n"
@@ -136,17 +276,18 @@ class InterVA5:
                          "No results (need to use run() method).")
             return msg
         else:
-            n_processed = self.va_input.shape[0]
-            n_undetermined = sum(
-                self.results["VA5"]["CAUSE1"] == " ")
-            n_miss = n_processed - self.results["VA5"].shape[0]
+            n_processed = self.n_records
+            # (dict.get avoids building the WHOLEPROB column of VA5)
+            va5 = dict.get(self.results, "VA5")
+            n_undetermined = sum(va5["CAUSE1"] == " ")
+            n_miss = n_processed - va5.shape[0]
             n_male = sum(self.dem_group["sex"] == "male")
             n_female = sum(self.dem_group["sex"] == "female")
             n_adult = sum(self.dem_group["age"] == "adult")
             n_child = sum(self.dem_group["age"] == "child")
             n_neo = sum(self.dem_group["age"] == "neonate")
             msg = ("InterVA5:\n"
-                   f"{self.va_input.shape[0]} VA records loaded\n"
+                   f"{n_processed} VA records loaded\n"
                    f"HIV parameter is {self.hiv}\n"
                    f"Malaria parameter is {self.malaria}\n\n"
                    f"{n_processed} VA records processed:\n"
@@ -169,38 +310,12 @@ class InterVA5:
              preglik: Union[str, int], cause1: str, lik1: Union[str, int],
              cause2: str, lik2: Union[str, int], cause3: str,
              lik3: Union[str, int], indet: int, comcat: str,
-             comnum: Union[str, int], wholeprob: Series) -> list:
-        """ Returns an individual VA result. """
+             comnum: Union[str, int]) -> list:
+        """ Returns an individual VA result (without the propensities). """
 
         return [id, str(malprev), str(hivprev), pregstat, preglik,
                 cause1, lik1, cause2, lik2, cause3, lik3, indet,
-                str(comcat), comnum, wholeprob]
-
-    @staticmethod
-    def _save_va5(x: list, filename: str, write: bool) -> None:
-        """ Saves the VA5 result to csv, without propensities. """
-
-        if not write:
-            return ()
-        del x[14]
-        filename = filename + ".csv"
-        with open(filename, 'a', newline="") as csvfile:
-            csv_writer = writer(csvfile)
-            csv_writer.writerow(x)
-
-    @staticmethod
-    def _save_va5_prob(x: list, filename: str, write: bool) -> None:
-        """ Saves the VA5 result to csv, with propensities. """
-
-        if not write:
-            return ()
-        prob = x.pop(14)
-        x = array(x)
-        filename = filename + ".csv"
-        x = concatenate((x, prob))
-        with open(filename, "a", newline="") as csvfile:
-            csv_writer = writer(csvfile)
-            csv_writer.writerow(x)
+                str(comcat), comnum]
 
     def run(self) -> None:
         """Assign causes of death to valid VA records.
@@ -208,103 +323,495 @@ class InterVA5:
         Results are stored as a dictionary in the attribute out, which includes
         the keys: (ID) pandas.Series of VA input IDs; (VA5) pandas.DataFrame
         of VA results with cause assignments and likelihoods for valid VA
-        records (or None if there are no valid records); (Malaria) a str
+        records (or None if there are no valid records); (propensities) a
+        numpy.ndarray with the propensities of the 70 causes (columns) for
+        each record in VA5 (rows); (cause_names) pandas.Index with the names
+        of the 70 causes; (Malaria) a str
         indicating the likelihood of malaria as causes of death; (HIV) a str
         indicating the likelihood of HIV as causes of death; and (checked_data)
         a pandas.DataFrame containing the cleaned data from data consistency
-        checks.
+        checks; (timings) a dict with the wall and CPU time (in seconds) of
+        each stage of the pipeline and of the whole run ("total"); and
+        (counts) a dict with the record counts (see the metrics parameter).
 
         If there are no valid VA records then the out["VA5"] value is None.
         Note that the data checks identify records as invalid (if the age or
         sex indicators are missing, or if all the symptoms have missing
-        values).
+        values).  The WHOLEPROB column of out["VA5"], with the propensities of
+        each record as a pandas.Series, is only created when out["VA5"] is
+        first accessed; the propensities of all records are available in
+        out["propensities"].
 
         :return: None
         """
 
+        for _ in self._run(stream=False):
+            pass
+
+    def iter_results(self) -> Iterator[Results]:
+        """Assign causes of death to valid VA records, yielding the results
+        of each chunk of records (see the chunksize parameter) as soon as it
+        has been processed.
+
+        The records are processed as with run(): the output file, the error
+        log, metrics, and datacheck_cache are the same.  The results of each
+        chunk are yielded as a Results dictionary with the keys of
+        InterVA5.results for the valid records of the chunk, and: (dem_group)
+        a pandas.DataFrame with the age and sex group of each valid record;
+        (excluded) the error messages of the records excluded from
+        processing; (first_pass) and (second_pass) the messages of the data
+        checks; and (timings) and (counts) for the chunk.  The results are not
+        kept (InterVA5.results is left empty and the output of the data checks
+        is not kept for cache_checked), so the memory used does not grow
+        with the number of records.
+
+        :return: an iterator of the results of each chunk
+        :rtype: iterator of interva.results.Results
+        """
+
+        return self._run(stream=True)
+
+    async def run_async(self, progress: Union[Callable, None] = None,
+                        progress_interval: float = 0.5,
+                        executor: Union[Executor, None] = None) -> None:
+        """Run run() in an executor (by default, the thread pool of the event
+        loop), so that the event loop is not blocked.  The results are stored
+        as with run().
+
+        If the task is cancelled, the run stops after the record being
+        processed (the output written so far is kept) and the cancellation
+        is propagated.
+
+        :param progress: a function called in the event loop with the number
+        of records processed and the total number of records (None if it is
+        not known in advance), at most every progress_interval seconds and
+        at the end of the run.  If it returns an awaitable, it is awaited.
+        :type progress: callable
+        :param progress_interval: minimum time (in seconds) between two
+        calls to progress.
+        :type progress_interval: float
+        :param executor: the executor that runs the records.
+        :type executor: concurrent.futures.Executor
+        :return: None
+        """
+
+        async for _ in self._drive(self._run(stream=False), progress,
+                                   progress_interval, executor):
+            pass
+
+    async def aiter_results(self, progress: Union[Callable, None] = None,
+                            progress_interval: float = 0.5,
+                            executor: Union[Executor, None] = None
+                            ) -> AsyncIterator[Results]:
+        """Asynchronous version of iter_results(): each chunk of records is
+        processed in an executor and its results are yielded to the event
+        loop (see run_async() for the parameters and cancellation)."""
+
+        chunks = self._drive(self._run(stream=True), progress,
+                             progress_interval, executor)
+        try:
+            async for chunk in chunks:
+                yield chunk
+        finally:
+            # (if the caller stopped iterating, stop the run now rather than
+            # when the generator is garbage collected)
+            await chunks.aclose()
+
+    async def _drive(self, chunks: Iterator, progress: Union[Callable, None],
+                     progress_interval: float,
+                     executor: Union[Executor, None]) -> AsyncIterator:
+        """Advance the generator of a run in an executor, one chunk at a
+        time, reporting the progress while each chunk is processed."""
+
+        loop = get_running_loop()
+        self._cancel = Event()
+        reported = None
+        future = None
+        try:
+            while True:
+                future = loop.run_in_executor(executor, next, chunks,
+                                              _END_OF_RUN)
+                done = False
+                while not done:
+                    finished, _ = await wait({future},
+                                             timeout=progress_interval)
+                    done = len(finished) > 0
+                    if progress is not None and self._progress != reported:
+                        reported = self._progress
+                        out = progress(*reported)
+                        if isawaitable(out):
+                            await out
+                chunk = future.result()
+                if chunk is _END_OF_RUN:
+                    break
+                yield chunk
+        except BaseException:
+            # (cancelled, or the caller stopped iterating): stop the run at
+            # the next record and close it
+            self._cancel.set()
+            if future is not None:
+                await wait({future})
+                if not future.cancelled():
+                    future.exception()
+            # (closing waits for the worker processes if n_jobs > 1)
+            await loop.run_in_executor(executor, chunks.close)
+            raise
+        finally:
+            self._cancel = None
+
+    def _run(self, stream: bool = False) -> Iterator[Results]:
+        """Process the VA records (see run() and iter_results()).  If stream
+        is True, the results of each chunk are yielded instead of being
+        collected in the results attribute."""
+
+        wall_start = perf_counter()
+        # (CPU time of the threads that advance the run, see metrics.timed)
+        cpu_start = thread_time()
+        cpu_total = 0.0
+        timings = new_timings()
+        counts = new_counts()
+        self._progress = (0, None)
+        self._emitted = None
         if self.directory is None and self.write:
             raise IOError(
                 "error: please provide a directory " +
                 "(required when write = True)")
+        if self.write and self.append and self.output == "parquet":
+            raise IOError("error: append is not available for the parquet "
+                          "output")
+        if self.incremental and (not self.write or
+                                 self.output == "parquet"):
+            raise IOError("error: incremental is only available when write "
+                          "= True with the classic or extended output")
+        if self.scoring not in SCORING_ENGINES:
+            raise IOError("error: scoring should be one of: " +
+                          ", ".join(f"'{x}'" for x in SCORING_ENGINES))
+        datacheck_cache = self.datacheck_cache
+        if isinstance(datacheck_cache, str):
+            datacheck_cache = DatacheckCache(
+                path=path.abspath(datacheck_cache))
         if self.directory is None:
             self.directory = getcwd()
         if not path.isdir(self.directory):
             mkdir(self.directory)
-        global_dir = getcwd()
-        if global_dir != self.directory:
-            chdir(self.directory)
-
-        probbaseV5 = None
-        if self.sci is None:
-            probbase_df = get_probbase(version="19").copy()
-            probbaseV5 = probbase_df.to_numpy()
-        if self.sci is not None:
-            valid_sci = True
-            if not isinstance(self.sci, DataFrame) and \
-                    not isinstance(self.sci, ndarray):
-                valid_sci = False
-            if self.sci.shape[0] != 354 or self.sci.shape[1] != 87:
-                valid_sci = False
-            if not valid_sci:
-                raise IOError(
-                    "Error: Invalid SCI (must be Pandas DataFrame or "
-                    "Numpy ndarray with 354 rows and 87 columns).")
-            if isinstance(self.sci, DataFrame):
-                probbase_df = self.sci.copy()
-                self.sci = self.sci.to_numpy()
-            probbaseV5 = self.sci
-
-        pb_for_datacheck = probbase_df.fillna(".")
-        pb_for_datacheck["qdesc"] = ""
-        pb_for_datacheck = pb_for_datacheck.to_numpy(dtype=str)
-
-        self.probbaseV5Version = probbaseV5[0, 2]
-        print(f"Using Probbase version: {self.probbaseV5Version}")
-        causetextV5_horizontal = DataFrame(CAUSETEXTV5)
-        self.causetextV5 = causetextV5_horizontal.transpose()
-        if self.groupcode:
-            # adding groupcode to cause
-            for i in range(3, 64):
-                cause = str(self.causetextV5.iloc[i, 0])
-                code = str(self.causetextV5.iloc[i, 1])
-                self.causetextV5.iloc[i, 1] = code + " " + cause
-            self.causetextV5.drop(self.causetextV5.columns[0],
-                                  axis=1, inplace=True)
+        # the output files are given by their full paths (the working
+        # directory is not changed, so that runs in threads do not interfere)
+        directory = path.abspath(self.directory)
+        output_path = path.join(directory, self.filename)
+        if isinstance(self.va_input, str) and not path.isabs(self.va_input):
+            # (relative to the directory, as when run() changed to it)
+            self.va_input = path.join(directory, self.va_input)
+
+        logger = _run_logger()
+        file_handler = None
+        try:
+            probbaseV5 = compile_probbase(sci=self.sci)
+
+            self.probbaseV5Version = probbaseV5.version
+            if self.verbose:
+                print(f"Using Probbase version: {self.probbaseV5Version}")
+            self.causetextV5 = _causetext(self.groupcode)
+            id_index = None
+            append = self.append
+            if self.incremental:
+                id_index = IDIndex(output_path)
+                append = append or path.isfile(output_path + ".csv")
+            elif (self.write and self.output != "parquet" and
+                  not self.append and
+                  path.isfile(output_path + ID_INDEX_SUFFIX)):
+                # the output is replaced, so the IDs of the processed records
+                # are no longer valid
+                remove(output_path + ID_INDEX_SUFFIX)
+            if self.write:
+                file_handler = FileHandler(
+                    path.join(directory, "errorlogV5.txt"),
+                    mode="a" if self.incremental else "w")
+                logger.addHandler(file_handler)
+                now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                logger.info(f"Error & warning log built for InterVA5 {now}\n")
+            rescore = (self.cache_checked and self._checked is not None and
+                       not self.incremental and not stream and
+                       self._checked["key"] == self._input_key(probbaseV5.key))
+            if rescore:
+                # only the priors can have changed: reuse the data checks
+                input_names = self._checked["input_names"]
+                N = self._checked["n_records"]
+            else:
+                input_names, N, va_chunks = self._open_input(probbaseV5,
+                                                             timings)
+            if id_index is not None:
+                va_chunks = _new_records(va_chunks, id_index)
+                if N is not None:
+                    N = N - int(self.va_input.iloc[:, 0].astype(str).isin(
+                        id_index.ids).sum())
+            va_input_names = self._standard_names(input_names, logger)
+            self.hiv = self.hiv.lower()
+            self.malaria = self.malaria.lower()
+            hlv_set = ["h", "l", "v"]
+            if self.hiv not in hlv_set or self.malaria not in hlv_set:
+                raise IOError("error: the HIV and Malaria indicator "
+                              "should be one of the three: 'h', 'l', 'v'")
+            cause_prior = probbaseV5.prior(self.hiv, self.malaria)
+            prob_names = self.causetextV5.iloc[:, 0].copy()
+
+            result_writer = None
+            if self.write and self.output == "parquet":
+                result_writer = ParquetWriter(
+                    output_path + ".parquet", cause_names=list(prob_names),
+                    buffer_size=self.write_buffer_size)
+            elif self.write:
+                result_writer = CSVWriter(output_path + ".csv",
+                                          output=self.output,
+                                          cause_names=list(prob_names),
+                                          append=append,
+                                          buffer_size=self.write_buffer_size)
+
+            first_pass = second_pass = None
+            if self.write:
+                logger.info("\nThe following records are incomplete and "
+                            "excluded from further processing:\n")
+                # the data check messages are logged after all of the records,
+                # so they are spooled to temporary files in the meantime
+                first_pass = TemporaryFile(mode="w+", encoding="utf-8")
+                second_pass = TemporaryFile(mode="w+", encoding="utf-8")
+
+            ID_list = []
+            VA_result = []
+            list_prob = []
+            list_checked_data = []
+            list_dem_group = []
+            n_records = 0
+
+            chunk_kwargs = {"va_input_names": va_input_names,
+                            "probbaseV5": probbaseV5,
+                            "cause_prior": cause_prior,
+                            "prob_names": prob_names,
+                            "malaria": self.malaria,
+                            "hiv": self.hiv,
+                            "return_checked_data": self.return_checked_data,
+                            "cache_checked": self.cache_checked,
+                            "scoring": self.scoring,
+                            "datacheck_cache": datacheck_cache}
+            if rescore:
+                chunk_outs = self._rescore_chunks(self._checked["chunks"],
+                                                  chunk_kwargs, N)
+            else:
+                chunk_outs = self._map_chunks(va_chunks, chunk_kwargs, N)
+            keep_checked = self.cache_checked and not stream
+            if not stream:
+                self._checked = None
+            checked_chunks = []
+            try:
+                for chunk_out in chunk_outs:
+                    n_records = n_records + len(chunk_out["ID"])
+                    if N is None and self.verbose:
+                        print(f"{n_records} records processed")
+                    add_to(timings, chunk_out["timings"])
+                    add_to(counts, chunk_out["counts"])
+                    if datacheck_cache is not None:
+                        datacheck_cache.update(chunk_out["new_checks"])
+                    with timed(timings, "write"):
+                        chunk_prob = iter(chunk_out["prob"])
+                        for va_id, va_result in zip(chunk_out["ID"],
+                                                    chunk_out["VA5"]):
+                            if len(va_result) == 0:
+                                if self.write:
+                                    logger.info(va_id)
+                                ID_list.append(nan)
+                                continue
+                            ID_list.append(va_id)
+                            prob = next(chunk_prob)
+                            if self.write:
+                                result_writer.write(va_result, prob)
+                        if self.write:
+                            result_writer.flush()
+                            for item in chunk_out["first_pass"]:
+                                for k in item:
+                                    first_pass.write(k + "\n")
+                            for item in chunk_out["second_pass"]:
+                                for k in item:
+                                    second_pass.write(k + "\n")
+                        if id_index is not None:
+                            # (once the rows are in the output, so that a
+                            # failed run is resumed after this chunk)
+                            id_index.save(1)
+                    if self.metrics is not None:
+                        self.metrics({"event": "chunk",
+                                      "timings": chunk_out["timings"],
+                                      "counts": chunk_out["counts"]})
+                    if stream:
+                        cpu_total = cpu_total + thread_time() - cpu_start
+                        yield _chunk_results(chunk_out, va_input_names,
+                                             prob_names, self.malaria,
+                                             self.hiv,
+                                             self.return_checked_data)
+                        # (the next chunk can be run in another thread)
+                        cpu_start = thread_time()
+                        continue
+                    VA_result.extend(chunk_out["VA5"])
+                    list_prob.append(chunk_out["prob"])
+                    list_checked_data.extend(chunk_out["checked_data"])
+                    list_dem_group.append(chunk_out["dem_group"])
+                    if keep_checked:
+                        checked_chunks.append(chunk_out["checked"])
+            finally:
+                if result_writer is not None:
+                    result_writer.close()
+            self.n_records = n_records
+
+            if self.write:
+                with timed(timings, "write"):
+                    logger.info("\nThe following data discrepancies were "
+                                "identified and handled:\n")
+                    first_pass.seek(0)
+                    for k in first_pass:
+                        logger.info(k[:-1])
+                    first_pass.close()
+                    logger.info("\nSecond pass\n")
+                    second_pass.seek(0)
+                    for k in second_pass:
+                        logger.info(k[:-1])
+                    second_pass.close()
+            if id_index is not None:
+                with timed(timings, "write"):
+                    id_index.save()
+            if isinstance(self.datacheck_cache, str):
+                with timed(timings, "write"):
+                    datacheck_cache.save()
+            if stream:
+                self.results = {}
+            else:
+                with timed(timings, "assembly"):
+                    self._assemble_results(ID_list, VA_result, list_prob,
+                                           list_checked_data, list_dem_group,
+                                           va_input_names, prob_names)
+            if keep_checked and not self.incremental:
+                input_key = self._input_key(probbaseV5.key)
+                if input_key is not None:
+                    self._checked = {"key": input_key,
+                                     "input_names": input_names,
+                                     "n_records": n_records,
+                                     "chunks": checked_chunks}
+            timings["total"] = {"wall": perf_counter() - wall_start,
+                                "cpu": cpu_total + thread_time() - cpu_start}
+            if not stream:
+                self.results["timings"] = timings
+                self.results["counts"] = counts
+            if self.metrics is not None:
+                self.metrics({"event": "run", "timings": timings,
+                              "counts": counts})
+        finally:
+            if file_handler is not None:
+                logger.removeHandler(file_handler)
+                file_handler.close()
+
+    def _assemble_results(self, ID_list: list, VA_result: list,
+                          list_prob: list, list_checked_data: list,
+                          list_dem_group: list, va_input_names: Index,
+                          prob_names: Series) -> None:
+        """Store the outputs of the chunks (concatenated) in the results,
+        checked_data and dem_group attributes."""
+
+        if not self.return_checked_data:
+            self.checked_data = "return_checked_data = False"
         else:
-            self.causetextV5.drop(self.causetextV5.columns[1],
-                                  axis=1, inplace=True)
-        logger = None
-        if self.write:
-            logger = getLogger(__name__)
-            logger.setLevel(INFO)
-            file_handler = FileHandler("errorlogV5.txt", mode="w")
-            logger.addHandler(file_handler)
-            now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            logger.info(f"Error & warning log built for InterVA5 {now}\n")
-        if isinstance(self.va_input, str) and self.va_input[-4:] == ".csv":
-            self.va_input = read_csv(self.va_input)
-        if "i183o" in self.va_input.columns:
+            self.checked_data = DataFrame(list_checked_data)
+            self.checked_data.columns = va_input_names
+
+        ID_list = Series(ID_list, name="ID")
+        nan_indices = where(ID_list.isna())[0]
+        ID_list.drop(nan_indices, inplace=True)
+
+        if len(ID_list) > 0:
+            VA_result = DataFrame(VA_result)
+            VA_result.columns = VA5_COLUMNS
+            VA_result.drop(nan_indices, axis=0, inplace=True)
+        elif self.n_records == 0:
+            # (no new records with incremental = True)
+            VA_result = None
+        else:
+            # TODO: add get_errors() function (similar to pyinsilicova)
+            warnings.warn(
+                "NO VALID VA RECORDS (datacheck procedure invalidated all "
+                "deaths)!  Check error log for more details."
+            )
+            VA_result = None
+
+        if len(list_dem_group) > 0:
+            dem_group = concat(list_dem_group, ignore_index=True)
+            if dem_group.shape[0] > 0:
+                dem_group = dem_group.set_index("ID")
+                self._detailed_age = dem_group.pop("detailed_age")
+                self.dem_group = dem_group
+
+        self.results = Results({"ID": ID_list,
+                                "VA5": VA_result,
+                                "propensities": concatenate(
+                                    list_prob + [empty((0, len(prob_names)))]),
+                                "cause_names": Index(prob_names),
+                                "Malaria": self.malaria,
+                                "HIV": self.hiv,
+                                "checked_data": self.checked_data})
+
+    def _input_key(self, probbase_key: str) -> Union[tuple, None]:
+        """Return a key identifying the VA input and the settings of the
+        data checks, or None if the input cannot be identified (e.g., an
+        iterator of chunks)."""
+
+        va_input = self.va_input
+        if isinstance(va_input, DataFrame):
+            content = hash_pandas_object(va_input).to_numpy().tobytes()
+            names = "\t".join(str(x) for x in va_input.columns).encode()
+            data_key = sha256(content + names).hexdigest()
+        elif isinstance(va_input, str) and path.isfile(va_input):
+            file_stat = stat(va_input)
+            data_key = (path.abspath(va_input), file_stat.st_size,
+                        file_stat.st_mtime_ns)
+        else:
+            return None
+        return data_key, probbase_key, self.return_checked_data
+
+    def _open_input(self, probbaseV5: CompiledProbbase,
+                    timings: dict) -> tuple:
+        """Check the VA input and return its column names, the number of
+        records (None if it is not known in advance), and an iterator of
+        chunks of records."""
+
+        if isinstance(self.va_input, str) and self.chunksize is None:
+            with timed(timings, "load"):
+                if self.va_input[-4:] == ".csv":
+                    self.va_input = read_csv(self.va_input)
+                elif self.va_input[-8:] == ".parquet":
+                    self.va_input = read_parquet(self.va_input)
+        if isinstance(self.va_input, DataFrame) and \
+                "i183o" in self.va_input.columns:
             self.va_input.rename(columns={"i183o": "i183a"}, inplace=True)
-            print(
-                "Due to the inconsistent names in the early version of "
-                "InterVA5, the indicator 'i183o' has been renamed as 'i183a'.")
-
-        va_data = self.va_input.copy()
-        va_input_names = va_data.columns
-        id_inputs = va_data.iloc[:, 0]
-        va_data = va_data.to_numpy()
-        if va_data.shape[0] < 1:
+            if self.verbose:
+                print("Due to the inconsistent names in the early version of "
+                      "InterVA5, the indicator 'i183o' has been renamed as "
+                      "'i183a'.")
+        N = None
+        if isinstance(self.va_input, DataFrame):
+            N = self.va_input.shape[0]
+        va_chunks = timed_iter(self._iter_input(), timings, "load")
+        va_chunk = next(va_chunks, None)
+        if va_chunk is None or va_chunk.shape[0] < 1:
             raise IOError("error: no data input")
-        N = va_data.shape[0]
-        S = va_data.shape[1]
-        if S != probbaseV5.shape[0]:
+        va_input_names = va_chunk.columns
+        S = va_chunk.shape[1]
+        if S != probbaseV5.datacheck.shape[0]:
             raise IOError(
                 "error: invalid data input format. Number of values incorrect")
         if va_input_names[S-1].lower() != "i459o":
             raise IOError("error: the last variable should be 'i459o'")
-        va_data_csv = get_data("interva", "data/randomva5.csv")
-        randomVA5 = read_csv(BytesIO(va_data_csv))
-        valabels = randomVA5.columns
+        return va_input_names, N, chain([va_chunk], va_chunks)
+
+    def _standard_names(self, va_input_names: Index, logger) -> Index:
+        """Return the standard InterVA5 column names if the input column
+        names do not match them (the differences are logged)."""
+
+        S = len(va_input_names)
+        valabels = Index(VALABELS)
         count_changelabel = 0
         for i in range(S):
             input_col = va_input_names[i]
@@ -319,310 +826,142 @@ class InterVA5:
                 "If the change is undesirable, please change in the input "
                 "to match standard InterVA5 input format.")
             va_input_names = valabels
-        pb_ncol = probbaseV5.shape[1]
-        probbaseV5[:, 17:pb_ncol][probbaseV5[:, 17:pb_ncol] == "I"] = 1
-        probbaseV5[:, 17:pb_ncol][probbaseV5[:, 17:pb_ncol] == "A+"] = 0.8
-        probbaseV5[:, 17:pb_ncol][probbaseV5[:, 17:pb_ncol] == "A"] = 0.5
-        probbaseV5[:, 17:pb_ncol][probbaseV5[:, 17:pb_ncol] == "A-"] = 0.2
-        probbaseV5[:, 17:pb_ncol][probbaseV5[:, 17:pb_ncol] == "B+"] = 0.1
-        probbaseV5[:, 17:pb_ncol][probbaseV5[:, 17:pb_ncol] == "B"] = 0.05
-        probbaseV5[:, 17:pb_ncol][probbaseV5[:, 17:pb_ncol] == "B-"] = 0.02
-        probbaseV5[:, 17:pb_ncol][probbaseV5[:, 17:pb_ncol] == "B -"] = 0.02
-        probbaseV5[:, 17:pb_ncol][probbaseV5[:, 17:pb_ncol] == "C+"] = 0.01
-        probbaseV5[:, 17:pb_ncol][probbaseV5[:, 17:pb_ncol] == "C"] = 0.005
-        probbaseV5[:, 17:pb_ncol][probbaseV5[:, 17:pb_ncol] == "C-"] = 0.002
-        probbaseV5[:, 17:pb_ncol][probbaseV5[:, 17:pb_ncol] == "D+"] = 0.001
-        probbaseV5[:, 17:pb_ncol][probbaseV5[:, 17:pb_ncol] == "D"] = 5e-04
-        probbaseV5[:, 17:pb_ncol][probbaseV5[:, 17:pb_ncol] == "D-"] = 1e-04
-        probbaseV5[:, 17:pb_ncol][probbaseV5[:, 17:pb_ncol] == "E"] = 1e-05
-        probbaseV5[:, 17:pb_ncol][probbaseV5[:, 17:pb_ncol] == "N"] = 0
-        probbaseV5[:, 17:pb_ncol][probbaseV5[:, 17:pb_ncol] == ""] = 0
-        probbaseV5[0, 0:17] = 0
-        Sys_Prior = copy(to_numeric(probbaseV5[0, :]))
-        D = len(Sys_Prior)
-        self.hiv = self.hiv.lower()
-        self.malaria = self.malaria.lower()
-        hlv_set = ["h", "l", "v"]
-        if self.hiv not in hlv_set or self.malaria not in hlv_set:
-            raise IOError("error: the HIV and Malaria indicator "
-                          "should be one of the three: 'h', 'l', 'v'")
-        if self.hiv == "h":
-            Sys_Prior[22] = 0.05
-        if self.hiv == "l":
-            Sys_Prior[22] = 0.005
-        if self.hiv == "v":
-            Sys_Prior[22] = 1e-05
-        if self.malaria == "h":
-            Sys_Prior[24] = 0.05
-            Sys_Prior[44] = 0.05
-        if self.malaria == "l":
-            Sys_Prior[24] = 0.005
-            Sys_Prior[44] = 1e-05
-        if self.malaria == "v":
-            Sys_Prior[24] = 1e-05
-            Sys_Prior[44] = 1e-05
-
-        ID_list = [nan for _ in range(N)]
-        VA_result = [[] for _ in range(N)]
-        if self.write and not self.append:
-            header = ["ID", "MALPREV", "HIVPREV", "PREGSTAT", "PREGLIK",
-                      "CAUSE1", "LIK1", "CAUSE2", "LIK2", "CAUSE3", "LIK3",
-                      "INDET", "COMCAT", "COMNUM"]
-            if self.output == "extended":
-                header = header + list(self.causetextV5.iloc[:, 0])
-            with open(self.filename + ".csv", "w", newline="") as write_obj:
-                csv_writer = writer(write_obj)
-                csv_writer.writerow(header)
-        nd = max(1, round(N/100))
-        np = max(1, round(N/10))
-
-        if self.write:
-            logger.info("\nThe following records are incomplete and "
-                        "excluded from further processing:\n")
-
-        first_pass = []
-        second_pass = []
-        list_checked_data = []
-        list_dem_group = []
-
-        for i in range(N):
-            if self.gui_ctrl["break"]:
-                raise RuntimeError
-            k = i + 1
+        return va_input_names
+
+    def _rescore_chunks(self, checked_chunks: list, chunk_kwargs: dict,
+                        N: int) -> Iterator[dict]:
+        """Run _rescore_chunk() on the output of the data checks saved by
+        the last run and yield the outputs in the order of the chunks."""
+
+        n_done = 0
+        for checked in checked_chunks:
+            chunk_out = _rescore_chunk(
+                checked, probbaseV5=chunk_kwargs["probbaseV5"],
+                cause_prior=chunk_kwargs["cause_prior"],
+                prob_names=chunk_kwargs["prob_names"],
+                malaria=chunk_kwargs["malaria"], hiv=chunk_kwargs["hiv"],
+                scoring=chunk_kwargs["scoring"])
+            for k in range(len(chunk_out["ID"])):
+                self._report_progress(n_done + k + 1, N)
+            n_done = n_done + len(chunk_out["ID"])
+            yield chunk_out
+
+    def _iter_input(self):
+        """Yield the VA input as pandas DataFrames with at most chunksize
+        records."""
+
+        va_input = self.va_input
+        chunksize = self.chunksize
+        if isinstance(va_input, DataFrame):
+            n_jobs = self._n_workers()
+            if chunksize is None and n_jobs > 1:
+                # split the records into shards for the worker processes
+                chunksize = max(1, ceil(va_input.shape[0] / (4 * n_jobs)))
+            if chunksize is None:
+                va_chunks = [va_input]
+            else:
+                va_chunks = (va_input.iloc[i:(i + chunksize)]
+                             for i in range(0, va_input.shape[0],
+                                            chunksize))
+        elif isinstance(va_input, str) and va_input[-8:] == ".parquet":
+            va_chunks = _read_parquet_chunks(va_input, chunksize)
+        elif isinstance(va_input, str):
+            va_chunks = read_csv(va_input, chunksize=chunksize)
+        else:
+            va_chunks = iter(va_input)
+        renamed = False
+        for va_chunk in va_chunks:
+            if "i183o" in va_chunk.columns:
+                va_chunk = va_chunk.rename(columns={"i183o": "i183a"})
+                if not renamed and self.verbose:
+                    print("Due to the inconsistent names in the early "
+                          "version of InterVA5, the indicator 'i183o' has "
+                          "been renamed as 'i183a'.")
+                    renamed = True
+            yield va_chunk
+
+    def _n_workers(self) -> int:
+        """Return the number of worker processes used by run()."""
+
+        if self.n_jobs is None:
+            return 1
+        if self.n_jobs == -1:
+            return cpu_count() or 1
+        if not isinstance(self.n_jobs, int) or self.n_jobs < 1:
+            raise ArgumentException(
+                "n_jobs must be None, -1, or a positive integer")
+        return self.n_jobs
+
+    def _report_progress(self, k: int, N: Union[int, None]) -> None:
+        """Report progress after the k-th record has been processed."""
+
+        if self.gui_ctrl["break"]:
+            raise RuntimeError
+        if self._cancel is not None and self._cancel.is_set():
+            raise RuntimeError("run cancelled")
+        self._progress = (k, N)
+        if N is None:
+            return
+        if self.verbose:
+            nd = max(1, round(N/100))
+            np = max(1, round(N/10))
             if k % nd == 0:
                 print(".", end="")
             if k % np == 0:
                 print(round(k/N * 100), "% completed", sep="")
             if k == N:
                 print("100% completed")
-            index_current = str(id_inputs.iloc[i])
-            va_data[i, :][va_data[i, :] == "n"] = "0"
-            va_data[i, :][va_data[i, :] == "N"] = "0"
-            va_data[i, :][va_data[i, :] == "y"] = "1"
-            va_data[i, :][va_data[i, :] == "Y"] = "1"
-            for j in range(va_data.shape[1]):
-                if va_data[i, j] != "0" and va_data[i, j] != "1":
-                    va_data[i, j] = nan
-
-            input_current = copy(va_data[i, :])
-            input_current[:][input_current[:] == "0"] = 0
-            input_current[:][input_current[:] == "1"] = 1
-
-            input_current[0] = 0
-            if nansum(input_current[5:12]) < 1:
-                if self.write:
-                    logger.info(index_current +
-                                " Error in age indicator: Not Specified")
-                if self.openva_app:
-                    progress = int(100 * k / N)
-                    self.openva_app.emit(progress)
-                continue
-            if nansum(input_current[3:5]) < 1:
-                if self.write:
-                    logger.info(index_current +
-                                " Error in sex indicator: Not Specified")
-                if self.openva_app:
-                    progress = int(100 * k / N)
-                    self.openva_app.emit(progress)
-                continue
-            if nansum(input_current[20:328]) < 1:
-                if self.write:
-                    logger.info(index_current +
-                                " Error in indicators: No symptoms specified")
-                if self.openva_app:
-                    progress = int(100 * k / N)
-                    self.openva_app.emit(progress)
-                continue
-
-            input_current = Series(input_current, index=va_input_names)
-            tmp = datacheck5(va_input=input_current, va_id=index_current,
-                             probbase=pb_for_datacheck)
-
-            list_dem_group.append(_get_dem_groups(tmp["output"]))
-
-            if self.return_checked_data:
-                list_checked_data.append(
-                    [id_inputs[i]] + list(tmp["output"][1:S]))
-
-            input_current = copy(tmp["output"])
-            first_pass.append(tmp["first_pass"])
-            second_pass.append(tmp["second_pass"])
-
-            subst_vector = array([nan for _ in range(S)])
-            subst_vector[probbaseV5[:, 5] == "N"] = 0
-            subst_vector[probbaseV5[:, 5] == "Y"] = 1
-
-            new_input = array([0 for _ in range(S)])
-            for y in range(1, S):
-                if not isna(input_current[y]):
-                    if input_current[y] == subst_vector[y]:
-                        new_input[y] = 1
-
-            input_current[input_current == 0] = 1
-            input_current[0] = 0
-            input_current[isna(input_current)] = 0
-            reproductiveAge = 0
-            preg_state = " "
-            lik_preg = " "
-            if input_current[4] == 1 and (input_current[16:19].any() == 1):
-                reproductiveAge = 1
-            prob = copy(Sys_Prior[17:D])
-            temp = where(new_input[1:len(input_current)] == 1)[0]
-            for jj in range(len(temp)):
-                temp_sub = temp[jj]
-                for j in range(17, D):
-                    prob[j-17] = prob[j-17] * probbaseV5[temp_sub + 1, j]
-                if nansum(prob[0:3]) > 0:
-                    prob[0:3] = prob[0:3] / nansum(prob[0:3])
-                if nansum(prob[3:64]) > 0:
-                    prob[3:64] = prob[3:64] / nansum(prob[3:64])
-                if nansum(prob[64:70]) > 0:
-                    prob[64:70] = prob[64:70] / nansum(prob[64:70])
-
-            prob_names = self.causetextV5.iloc[:, 0].copy()
-            prob_A = copy(prob[0:3])
-            prob_B = copy(prob[3:64])
-            prob_C = copy(prob[64:70])
-
-            # Determine Preg_State and Likelihood
-            if nansum(prob_A) == 0 or reproductiveAge == 0:
-                preg_state = "n/a"
-                lik_preg = " "
-            if nanmax(prob_A) < 0.1 and reproductiveAge == 1:
-                preg_state = "indeterminate"
-                lik_preg = " "
-            if where(prob_A == nanmax(prob_A))[0][0] == 0 and \
-                    prob_A[0] >= 0.1 and reproductiveAge == 1:
-                preg_state = "Not pregnant or recently delivered"
-                lik_preg = round(prob_A[0]/nansum(prob_A) * 100)
-            if where(prob_A == nanmax(prob_A))[0][0] == 1 and \
-                    prob_A[1] >= 0.1 and reproductiveAge == 1:
-                preg_state = "Pregnancy ended within 6 weeks of death"
-                lik_preg = round(prob_A[1]/nansum(prob_A) * 100)
-            if where(prob_A == nanmax(prob_A))[0][0] == 2 and \
-                    prob_A[2] >= 0.1 and reproductiveAge == 1:
-                preg_state = "Pregnant at death"
-                lik_preg = round(prob_A[2]/nansum(prob_A) * 100)
-
-            # Determine the output of InterVA
-            prob_temp = copy(prob_B)
-            prob_temp_names = prob_names.iloc[3:64].copy()
-            top3 = []
-            cause1 = lik1 = cause2 = lik2 = cause3 = lik3 = None
-            indet = 0
-            if nanmax(prob_temp) < 0.4:
-                cause1 = lik1 = cause2 = lik2 = cause3 = lik3 = " "
-                indet = 100
-            if nanmax(prob_temp) >= 0.4:
-                max1_loc = where(prob_temp == nanmax(prob_temp))[0][0]
-                lik1 = round(nanmax(prob_temp) * 100)
-                cause1 = prob_temp_names.iloc[max1_loc]
-                prob_temp = delete(prob_temp, max1_loc)
-                prob_temp_names.drop(prob_temp_names.index
-                                     [max1_loc], inplace=True)
-                top3.append(lik1)
-
-                max2_loc = where(prob_temp == nanmax(prob_temp))[0][0]
-                lik2 = round(nanmax(prob_temp) * 100)
-                cause2 = prob_temp_names.iloc[max2_loc]
-                if nanmax(prob_temp) < 0.5 * nanmax(prob_B):
-                    lik2 = cause2 = " "
-                prob_temp = delete(prob_temp, max2_loc)
-                prob_temp_names.drop(prob_temp_names.index[max2_loc],
-                                     inplace=True)
-                top3.append(lik2)
-
-                max3_loc = where(prob_temp == nanmax(prob_temp))[0][0]
-                lik3 = round(nanmax(prob_temp) * 100)
-                cause3 = prob_temp_names.iloc[max3_loc]
-                if nanmax(prob_temp) < 0.5 * nanmax(prob_B):
-                    lik3 = cause3 = " "
-                top3.append(lik3)
-                top3 = array([int(x) if x != " " else 0 for x in top3])
-                indet = round(100 - nansum(top3))
-
-            # Determine the Circumstances of Mortality CATegory (COMCAT)
-            # and probability
-            prob_C_names = prob_names[64:70]
-            comcat = ""
-            comnum = None
-            if nansum(prob_C) > 0:
-                prob_C = prob_C / nansum(prob_C)
-            if nanmax(prob_C) < 0.5:
-                comcat = "Multiple"
-                comnum = " "
-            if nanmax(prob_C) >= 0.5:
-                comcat = prob_C_names.iloc[where(prob_C == nanmax(prob_C))[0][0]]
-                comnum = round(nanmax(prob_C) * 100)
-
-            ID_list[i] = index_current
-            combined_prob = Series(concatenate((prob_A, prob_B, prob_C)),
-                                   index=prob_names)
-            VA_result[i] = InterVA5._va5(index_current, self.malaria, self.hiv,
-                                         preg_state, lik_preg, cause1, lik1,
-                                         cause2, lik2, cause3, lik3, indet,
-                                         comcat, comnum,
-                                         wholeprob=combined_prob)
-            if self.output == "classic":
-                InterVA5._save_va5(VA_result[i].copy(),
-                                   filename=self.filename,
-                                   write=self.write)
-            if self.output == "extended":
-                InterVA5._save_va5_prob(VA_result[i].copy(),
-                                        filename=self.filename,
-                                        write=self.write)
-            if self.openva_app:
-                progress = int(100 * k / N)
+        if self.openva_app:
+            progress = int(100 * k / N)
+            if progress != self._emitted:
                 self.openva_app.emit(progress)
-        if self.write:
-            logger.info("\nThe following data discrepancies were identified "
-                        "and handled:\n")
-            for j in range(len(first_pass)):
-                item = first_pass[j]
-                if item:
-                    for k in item:
-                        logger.info(k)
-            logger.info("\nSecond pass\n")
-            for j in range(len(second_pass)):
-                item = second_pass[j]
-                if item:
-                    for k in item:
-                        logger.info(k)
-        chdir(global_dir)
-        if not self.return_checked_data:
-            self.checked_data = "return_checked_data = False"
-        else:
-            self.checked_data = DataFrame(list_checked_data)
-            self.checked_data.columns = va_input_names
-
-        ID_list = Series(ID_list, name="ID")
-        nan_indices = where(ID_list.isna())[0]
-        ID_list.drop(nan_indices, inplace=True)
-
-        if len(ID_list) > 0:
-            VA_result = DataFrame(VA_result)
-            VA_result.columns = ["ID", "MALPREV", "HIVPREV", "PREGSTAT",
-                                 "PREGLIK", "CAUSE1", "LIK1", "CAUSE2", "LIK2",
-                                 "CAUSE3", "LIK3", "INDET", "COMCAT", "COMNUM",
-                                 "WHOLEPROB"]
-            VA_result.drop(nan_indices, axis=0, inplace=True)
-        else:
-            # TODO: add get_errors() function (similar to pyinsilicova)
-            warnings.warn(
-                "NO VALID VA RECORDS (datacheck procedure invalidated all "
-                "deaths)!  Check error log for more details."
-            )
-            VA_result = None
-
-        if len(list_dem_group) > 0:
-            dem_group = DataFrame(list_dem_group)
-            self.dem_group = dem_group.set_index("ID")
-
-        self.results = {"ID": ID_list,
-                        "VA5": VA_result,
-                        "Malaria": self.malaria,
-                        "HIV": self.hiv,
-                        "checked_data": self.checked_data}
+                self._emitted = progress
+
+    def _map_chunks(self, va_chunks: Iterable, chunk_kwargs: dict,
+                    N: Union[int, None]) -> Iterator[dict]:
+        """Run _run_chunk() on each chunk and yield the outputs in the
+        order of the chunks.  If n_jobs > 1, then the chunks are run in a
+        pool of worker processes, which receive chunk_kwargs (including the
+        compiled probbase) only once, when they start."""
+
+        n_jobs = self._n_workers()
+        n_done = 0
+        if n_jobs == 1:
+            for va_chunk in va_chunks:
+                start = n_done
+                chunk_out = _run_chunk(
+                    va_chunk,
+                    progress=lambda k: self._report_progress(start + k, N),
+                    **chunk_kwargs)
+                n_done = n_done + len(chunk_out["ID"])
+                yield chunk_out
+            return
+
+        pending = deque()
+        executor = ProcessPoolExecutor(max_workers=n_jobs,
+                                       initializer=_init_worker,
+                                       initargs=(chunk_kwargs,))
+        try:
+            va_chunks = iter(va_chunks)
+            while True:
+                # keep a bounded number of chunks in flight
+                while len(pending) < 2 * n_jobs:
+                    va_chunk = next(va_chunks, None)
+                    if va_chunk is None:
+                        break
+                    pending.append(
+                        executor.submit(_run_chunk_in_worker, va_chunk))
+                if len(pending) == 0:
+                    break
+                chunk_out = pending.popleft().result()
+                for k in range(len(chunk_out["ID"])):
+                    self._report_progress(n_done + k + 1, N)
+                n_done = n_done + len(chunk_out["ID"])
+                yield chunk_out
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
 
     def get_hiv(self) -> str:
         """Get HIV parameter."""
@@ -664,6 +1003,8 @@ class InterVA5:
         va_df = self.va_input
         if isinstance(va_df, str) and va_df[-4:] == ".csv":
             va_df = read_csv(va_df)
+        elif isinstance(va_df, str) and va_df[-8:] == ".parquet":
+            va_df = read_parquet(va_df)
         return va_df.loc[:, "ID"]
 
     # def plot_csmf(self, top: int = 10, file: str = None) -> None:
@@ -690,19 +1031,10 @@ class InterVA5:
             print("No results found.  Check error log.  It is likely that "
                   "all records failed the data consistency checks.")
             return None
-        va = self.results["VA5"]
-        set_option("display.max_rows", None)
-        set_option("display.max_columns", None)
+        va, prob, causenames = get_propensities(self.results)
 
         # for future compatibility with non-standard input
-        causenames = causeindex = []
-        for i in range(va.shape[0]):
-            # if va.loc[i, "WHOLEPROB"] is not None:
-            #     causenames = va.loc[i, "WHOLEPROB"].index
-            if va.iloc[i]["WHOLEPROB"] is not None:
-                causenames = va.iloc[i]["WHOLEPROB"].index
-                causeindex = [x for x in range(len(causenames))]
-                break
+        causeindex = [x for x in range(len(causenames))]
         include_probAC = False
 
         if self.groupcode:
@@ -730,8 +1062,7 @@ class InterVA5:
             causenames = causenames.delete([0, 1, 2, 64, 65, 66, 67, 68, 69])
             include_probAC = True
 
-        causetextV5_horizontal = DataFrame(CAUSETEXTV5)
-        self.causetextV5 = causetextV5_horizontal.transpose()
+        self.causetextV5 = get_asset("causetext")
         if groupcode:
             temp_names = ["" for _ in range(len(causenames))]
             for i in range(len(causenames)):
@@ -747,65 +1078,9 @@ class InterVA5:
         if len(va) < 1:
             print("No va5 object found")
             return None
-        # Initialize the population distribution
-        dist = None
-        for i in range(len(va)):
-            if va.iloc[i, 14] is not None:
-                # dist = [[0 for _ in range(len(va.iloc[i, 14]))]]
-                dist = array([0] * len(va.iloc[i, 14]))
-                break
-        # what if dist is still None at this point? ex dataset 2?
-        undeter = 0
-
         # Pick not simply the top # causes,
         # but the top # causes reported by InterVA5
-        for i in range(len(va)):
-            if va.iloc[i, 14] is None:  # wholeprob exists
-                continue
-            this_dist_copy = va.iloc[i, 14].copy()
-            this_dist = this_dist_copy.to_numpy()
-            if include_probAC:
-                this_dist[0:3] = 0
-                this_dist[64:70] = 0
-            if max(this_dist) < 0.4:
-                if isclose(sum(this_dist), 0):
-                    this_undeter = 1
-                else:
-                    this_undeter = sum(this_dist)
-                undeter = undeter + this_undeter
-            else:
-                cutoff_3 = Decimal(this_dist[argsort(-this_dist)][2])
-                cutoff_2 = Decimal(this_dist[argsort(-this_dist)][1])
-                cutoff_1 = Decimal(this_dist[argsort(-this_dist)][0])
-                cutoff_1_halved = cutoff_1 / Decimal('2')
-                cutoff_pt1 = cutoff_3.max(cutoff_1_halved)
-                cutoff_pt2 = cutoff_2.max(cutoff_1_halved)
-                cutoff = cutoff_pt1.min(cutoff_pt2)
-                adj_cutoff = cutoff - Decimal(1e-15)
-
-                undeter = undeter + sum(
-                    this_dist[where(this_dist < adj_cutoff)[0]])
-                this_dist[where(this_dist < adj_cutoff)[0]] = 0
-
-                temp_len = len(this_dist[where(this_dist > 0)[0]])
-                close_indices = []
-                for j in range(temp_len):
-                    val = Decimal(
-                        this_dist[where(this_dist > 0)[0]][j]) - cutoff
-                    if abs(val) < 4e-29:
-                        close_indices.append(where(this_dist > 0)[0][j])
-
-                close_indices.sort(reverse=True)
-                for k in close_indices:
-                    undeter = undeter + this_dist[k]
-                    this_dist[k] = 0
-
-                if va.iloc[i, 14] is not None:
-                    # if i == 0:
-                    #     dist = this_dist
-                    # else:
-                    #     dist = dist + this_dist
-                    dist = dist + this_dist
+        dist, undeter = _csmf_dist(prob, include_probAC, interva_rule=True)
 
         dist = Series(dist)
         dist_cod = None
@@ -853,8 +1128,6 @@ class InterVA5:
         :type filename: string
         """
 
-        set_option("display.max_rows", None)
-        set_option("display.max_columns", None)
         csmf = self.get_csmf(top=top, groupcode=groupcode)
         filename = filename + ".csv"
         csmf.to_csv(filename, header=False)
@@ -873,57 +1146,9 @@ class InterVA5:
         :rtype: pandas DataFrame
         """
 
-        VA5 = self.results["VA5"]
-        num_indiv = VA5.shape[0]
-        cod_list = [[] for _ in range(num_indiv)]
-        column_names = []
-        if top == 0 or top is None:
-            column_names = VA5.loc[0, "WHOLEPROB"].iloc[3:64].index
-        else:
-            for i in range(top):
-                name = "CAUSE" + str(i+1)
-                column_names.append(name)
-                if include_propensities:
-                    prob = "PROPENSITY" + str(i+1) + ""
-                    column_names.append(prob)
-
-        for indiv in range(num_indiv):
-            # wholeprob = VA5.loc[indiv, "WHOLEPROB"]
-            wholeprob = VA5.iloc[indiv]["WHOLEPROB"]
-            prob_B = wholeprob.iloc[3:64].copy()
-
-            if top == 0 or top is None:
-                cod_list[indiv] = prob_B
-            if top > 0:
-                prob_temp = prob_B.to_numpy()
-                prob_temp_names = prob_B.index
-                for cause_num in range(top):
-                    if cause_num == 0:
-                        max_loc = where(prob_temp == nanmax(prob_temp))[0][0]
-                        cause = cod_list[indiv] = [prob_temp_names[max_loc]]
-                        if include_propensities:
-                            if cause == " ":
-                                cod_list[indiv].append(" ")
-                            else:
-                                cod_list[indiv].append(nanmax(prob_temp))
-                        prob_temp = delete(prob_temp, max_loc)
-                    if cause_num > 0:
-                        max_loc = where(prob_temp == nanmax(prob_temp))[0][0]
-                        cause = ""
-                        if nanmax(prob_temp) < 0.5 * nanmax(prob_B):
-                            cause = " "
-                        else:
-                            cause = prob_temp_names[max_loc]
-                        cod_list[indiv].append(cause)
-                        if include_propensities:
-                            if cause == " ":
-                                cod_list[indiv].append(" ")
-                            else:
-                                cod_list[indiv].append(nanmax(prob_temp))
-                        prob_temp = delete(prob_temp, max_loc)
-        cod_df = DataFrame(cod_list, columns=column_names)
-        cod_df.insert(loc=0, column='ID', value=self.results["ID"])
-        return cod_df
+        _, propensities, cause_names = get_propensities(self.results)
+        return _indiv_cod(propensities, cause_names, self.results["ID"],
+                          top=top, include_propensities=include_propensities)
 
     def write_indiv_prob(self, top: int = 0,
                          include_propensities: bool = False,
@@ -943,44 +1168,493 @@ class InterVA5:
         :type filename: string
         """
 
-        set_option("display.max_rows", None)
-        set_option("display.max_columns", None)
-        indiv_prob = self.get_indiv_prob(top, include_propensities)
+        _, propensities, cause_names = get_propensities(self.results)
+        ids = asarray(self.results["ID"])
         filename = filename + ".csv"
-        indiv_prob.to_csv(filename, index=False)
-
+        # the rows are written a block at a time, so that the whole table
+        # of causes (of object dtype) is never built at once
+        with open(filename, "w", newline="") as f:
+            for start in range(0, max(len(ids), 1), INDIV_PROB_BLOCK):
+                stop = start + INDIV_PROB_BLOCK
+                indiv_prob = _indiv_cod(
+                    propensities[start:stop], cause_names, ids[start:stop],
+                    top=top, include_propensities=include_propensities)
+                indiv_prob.to_csv(f, index=False, header=(start == 0))
+
+
+# number of records written at a time by InterVA5.write_indiv_prob()
+INDIV_PROB_BLOCK = 10000
+# engines that calculate the propensities (see the scoring parameter)
+SCORING_ENGINES = {"sequential": score_batch, "log": score_batch_log}
+# pregnancy status of the causes of the A block (see _interpret_record())
+PREG_STATES = ["Not pregnant or recently delivered",
+               "Pregnancy ended within 6 weeks of death", "Pregnant at death"]
+# columns of InterVA5.results["VA5"] (besides WHOLEPROB)
+VA5_COLUMNS = ["ID", "MALPREV", "HIVPREV", "PREGSTAT", "PREGLIK", "CAUSE1",
+               "LIK1", "CAUSE2", "LIK2", "CAUSE3", "LIK3", "INDET", "COMCAT",
+               "COMNUM"]
+# outputs of _check_records() kept to score the records again
+CHECKED_KEYS = ["ID", "valid_index", "symptoms", "reproductive_age",
+                "first_pass", "second_pass", "dem_group", "checked_data"]
+
+
+def _run_chunk(va_chunk: DataFrame, va_input_names: Index,
+               probbaseV5: CompiledProbbase, cause_prior: ndarray,
+               prob_names: Series, malaria: str, hiv: str,
+               return_checked_data: bool, cache_checked: bool = False,
+               scoring: str = "sequential",
+               datacheck_cache: Union[DatacheckCache, None] = None,
+               progress: Union[Callable, None] = None) -> dict:
+    """Check and score one chunk of VA records (progress, if given, is
+    called with the number of records processed so far in the chunk).
+
+    Returns a dictionary of lists with one element per record: (ID) the
+    record ID or, for records excluded from processing, the error message;
+    (VA5) the result (an empty list for excluded records); and for the
+    valid records: (prob) the propensities as an array with one row per
+    record, (first_pass) and (second_pass) messages from the data checks,
+    (dem_group) a DataFrame with the ID, age, sex and detailed age, and
+    (checked_data) the checked data (if return_checked_data is True).  It
+    also includes (timings) the wall and CPU time of each stage and (counts)
+    the record counts described in interva.metrics.COUNTS.  If cache_checked
+    is True, it also includes (checked) the output of the data checks needed
+    by _rescore_chunk().  If
+    datacheck_cache is given, the records found in it are not checked again,
+    and (new_checks) has the cache entries of the other records (which are
+    added to the cache by run(), so that the worker processes do not need to
+    share the cache).
+    """
 
-def get_example_input() -> DataFrame:
+    if va_chunk.shape[1] != len(va_input_names):
+        raise IOError(
+            "error: invalid data input format. Number of values incorrect")
+    timings = new_timings()
+    with timed(timings, "recode"):
+        codes = recode(va_chunk)
+        valid = validity_masks(codes)
+    with timed(timings, "datacheck"):
+        checked = _check_records(va_chunk.iloc[:, 0], codes, valid,
+                                 va_input_names, probbaseV5,
+                                 return_checked_data, datacheck_cache,
+                                 progress)
+    with timed(timings, "scoring"):
+        prob_all = _score_records(checked["symptoms"], probbaseV5,
+                                  cause_prior, scoring)
+    with timed(timings, "interpretation"):
+        chunk_out = _interpret_records(checked, prob_all, prob_names,
+                                       malaria, hiv)
+    chunk_out["timings"] = timings
+    chunk_out["counts"] = _count_records(codes, valid, checked)
+    chunk_out["new_checks"] = checked["new_checks"]
+    if cache_checked:
+        chunk_out["checked"] = {key: checked[key] for key in CHECKED_KEYS}
+        chunk_out["checked"]["counts"] = chunk_out["counts"]
+    return chunk_out
+
+
+def _rescore_chunk(checked: dict, probbaseV5: CompiledProbbase,
+                   cause_prior: ndarray, prob_names: Series, malaria: str,
+                   hiv: str, scoring: str = "sequential") -> dict:
+    """Score a chunk of VA records again (e.g., with the priors of other HIV
+    and malaria levels) from the output of the data checks saved by
+    _run_chunk(), and return the same output as _run_chunk()."""
+
+    timings = new_timings()
+    with timed(timings, "scoring"):
+        prob_all = _score_records(checked["symptoms"], probbaseV5,
+                                  cause_prior, scoring)
+    with timed(timings, "interpretation"):
+        chunk_out = _interpret_records(checked, prob_all, prob_names,
+                                       malaria, hiv)
+    chunk_out["timings"] = timings
+    chunk_out["counts"] = dict(checked["counts"])
+    chunk_out["new_checks"] = {}
+    chunk_out["checked"] = checked
+    return chunk_out
+
+
+def _count_records(codes: ndarray, valid: dict, checked: dict) -> dict:
+    """Return the number of records in a chunk, the number of valid
+    records, the number of records excluded for missing age, sex or
+    symptoms, and the number of values changed by the data checks."""
+
+    counts = new_counts()
+    counts["records"] = codes.shape[0]
+    counts["valid"] = len(checked["valid_index"])
+    counts["rejected_age"] = int((~valid["age"]).sum())
+    counts["rejected_sex"] = int((valid["age"] & ~valid["sex"]).sum())
+    counts["rejected_symptoms"] = int(
+        (valid["age"] & valid["sex"] & ~valid["symptoms"]).sum())
+    rows = [i for i, _ in checked["valid_index"]]
+    before = codes[rows, 1:].astype(float64)
+    before[codes[rows, 1:] == MISSING] = nan
+    after = checked["input"]
+    changed = (before != after) & ~(isnan(before) & isnan(after))
+    counts["datacheck_modifications"] = int(changed.sum())
+    counts["datacheck_cached"] = checked["n_cached"]
+    return counts
+
+
+def _check_records(id_inputs: Series, codes: ndarray, valid: dict,
+                   va_input_names: Index, probbaseV5: CompiledProbbase,
+                   return_checked_data: bool,
+                   datacheck_cache: Union[DatacheckCache, None] = None,
+                   progress: Union[Callable, None] = None) -> dict:
+    """Run the data checks on the valid records of a chunk (recoded with
+    recode() and validity_masks()), or take their output from
+    datacheck_cache.
+
+    Returns a dictionary with (ID) the error message for each excluded
+    record (and an empty string for the valid records), (valid_index) the
+    position and ID of each valid record, (input) the checked data of the
+    valid records as a float array (without the ID column), (symptoms) a
+    SymptomMatrix (sparse boolean matrix) indicating which of these values
+    are the substantive value of the symptom, (reproductive_age) a boolean
+    array indicating if each valid record is from a woman of reproductive
+    age, the (first_pass), (second_pass), (dem_group) and (checked_data)
+    lists described in _run_chunk(), (new_checks) the cache entries of the
+    records that were checked (if datacheck_cache is given), and (n_cached)
+    the number of records found in datacheck_cache.
     """
-    Get an example input.
 
-    :return: 200 records of sample input.
-    :rtype: pandas.DataFrame
+    n_chunk = codes.shape[0]
+    S = codes.shape[1]
+
+    ID_list = ["" for _ in range(n_chunk)]
+    first_pass = []
+    second_pass = []
+    list_checked_data = []
+    valid_index = []
+    valid_input = []
+    new_checks = {}
+    n_cached = 0
+
+    for i in range(n_chunk):
+        index_current = str(id_inputs.iloc[i])
+        if not valid["age"][i]:
+            ID_list[i] = (index_current +
+                          " Error in age indicator: Not Specified")
+        elif not valid["sex"][i]:
+            ID_list[i] = (index_current +
+                          " Error in sex indicator: Not Specified")
+        elif not valid["symptoms"][i]:
+            ID_list[i] = (index_current +
+                          " Error in indicators: No symptoms specified")
+        else:
+            checked_values, record_first, record_second, new_check = \
+                _check_record(codes[i], index_current, va_input_names,
+                              probbaseV5, datacheck_cache)
+            if new_check is None:
+                n_cached = n_cached + 1
+            elif new_check[0] is not None:
+                new_checks[new_check[0]] = new_check[1]
+            first_pass.append(record_first)
+            second_pass.append(record_second)
+
+            if return_checked_data:
+                list_checked_data.append(
+                    [id_inputs.iloc[i]] + list(checked_values))
+
+            valid_index.append((i, index_current))
+            valid_input.append(checked_values)
+        if progress is not None:
+            progress(i + 1)
+
+    if len(valid_input) > 0:
+        checked_input = array(valid_input, dtype=float64)
+    else:
+        checked_input = empty((0, S - 1))
+    reproductive_age = _reproductive_age(checked_input)
+    checked_frame = DataFrame(checked_input, columns=va_input_names[1:S])
+    checked_frame.insert(0, "ID", [x for _, x in valid_index])
+    dem_group = _get_dem_groups_frame(checked_frame)
+    dem_group["detailed_age"] = _get_age_group_all_frame(checked_frame).array
+    return {"ID": ID_list,
+            "valid_index": valid_index,
+            "input": checked_input,
+            "symptoms": SymptomMatrix.from_dense(
+                checked_input == probbaseV5.subst[1:S]),
+            "reproductive_age": reproductive_age,
+            "first_pass": first_pass,
+            "second_pass": second_pass,
+            "dem_group": dem_group,
+            "checked_data": list_checked_data,
+            "new_checks": new_checks,
+            "n_cached": n_cached}
+
+
+def _check_record(codes: ndarray, va_id: str, va_input_names: Index,
+                  probbaseV5: CompiledProbbase,
+                  datacheck_cache: Union[DatacheckCache, None] = None
+                  ) -> tuple:
+    """Run the data checks on one valid record (a row recoded with recode()),
+    or take their output from datacheck_cache.
+
+    Returns the checked values (an object array with 0, 1 and NaN, without
+    the ID column), the first and second pass messages, and a tuple with the
+    cache key (None without datacheck_cache) and the cache entry of the
+    record, or None if the record was found in datacheck_cache.
     """
 
-    example_input_bytes = get_data(__name__, "data/randomva5.csv")
-    example_input = read_csv(BytesIO(example_input_bytes))
-    return example_input
+    key = None
+    if datacheck_cache is not None:
+        key = DatacheckCache.key(probbaseV5.key, va_id, codes[1:])
+        entry = datacheck_cache.get(key)
+        if entry is not None:
+            return to_object(entry[0]), list(entry[1]), list(entry[2]), None
+    input_current = Series(to_object(codes), index=va_input_names)
+    tmp = datacheck5(va_input=input_current, va_id=va_id,
+                     probbase=probbaseV5.datacheck)
+    checked_values = tmp["output"].to_numpy()[1:]
+    entry = None
+    if key is not None:
+        entry = make_entry(array(checked_values, dtype=float64),
+                           tmp["first_pass"], tmp["second_pass"])
+    return checked_values, tmp["first_pass"], tmp["second_pass"], (key, entry)
+
+
+def _reproductive_age(checked_input: ndarray) -> ndarray:
+    """Return a boolean array indicating which records (rows of the checked
+    values, without the ID column) are from women of reproductive age."""
+
+    # reproductive age: i019b and at least one of i022l, i022m, i022n
+    # are not missing
+    return (~isnan(checked_input[:, 3]) &
+            (~isnan(checked_input[:, 15:18])).any(axis=1))
+
+
+def _score_records(symptoms: SymptomMatrix, probbaseV5: CompiledProbbase,
+                   cause_prior: ndarray,
+                   scoring: str = "sequential") -> ndarray:
+    """Return the propensities (one row per record) of the symptoms
+    returned by _check_records(), calculated with the scoring engine
+    ("sequential" or "log")."""
+
+    return SCORING_ENGINES[scoring](symptoms, probbaseV5.likelihood,
+                                    cause_prior)
+
+
+def _interpret_records(checked: dict, prob_all: ndarray, prob_names: Series,
+                       malaria: str, hiv: str) -> dict:
+    """Assign the pregnancy status, the top causes and the circumstances of
+    mortality of the valid records from their propensities, and return the
+    chunk output described in _run_chunk()."""
+
+    ID_list = list(checked["ID"])
+    VA_result = [[] for _ in range(len(ID_list))]
+    valid_index = checked["valid_index"]
+    reproductive_age = checked["reproductive_age"]
+
+    prob_matrix = empty((len(valid_index), prob_all.shape[1]))
+    prob_B_names = prob_names.iloc[3:64].to_numpy()
+    prob_C_names = prob_names.iloc[64:70].to_numpy()
+    for k, ((i, index_current), prob, reproductiveAge) in enumerate(zip(
+            valid_index, prob_all, reproductive_age)):
+        assigned = _interpret_record(prob, reproductiveAge, prob_B_names,
+                                     prob_C_names)
+        ID_list[i] = index_current
+        prob_matrix[k] = assigned[-1]
+        VA_result[i] = InterVA5._va5(index_current, malaria, hiv,
+                                     *assigned[:-1])
+
+    return {"ID": ID_list,
+            "VA5": VA_result,
+            "prob": prob_matrix,
+            "first_pass": checked["first_pass"],
+            "second_pass": checked["second_pass"],
+            "dem_group": checked["dem_group"],
+            "checked_data": checked["checked_data"]}
+
+
+def _interpret_record(prob: ndarray, reproductiveAge: bool,
+                      prob_B_names: ndarray, prob_C_names: ndarray) -> tuple:
+    """Assign the pregnancy status, the top causes and the circumstances of
+    mortality of one record from its propensities.  Returns the fields of
+    InterVA5._va5() after hivprev (preg_state, lik_preg, cause1, ..., comcat,
+    comnum) followed by the propensities with the circumstances of mortality
+    normalized."""
+
+    preg_state = " "
+    lik_preg = " "
+    prob_A = prob[0:3]
+    prob_B = prob[3:64]
+    prob_C = prob[64:70]
+
+    # Determine Preg_State and Likelihood
+    sum_A = nansum(prob_A)
+    max_A = nanmax(prob_A)
+    if sum_A == 0 or reproductiveAge == 0:
+        preg_state = "n/a"
+        lik_preg = " "
+    if max_A < 0.1 and reproductiveAge == 1:
+        preg_state = "indeterminate"
+        lik_preg = " "
+    max_A_loc = where(prob_A == max_A)[0][0]
+    if prob_A[max_A_loc] >= 0.1 and reproductiveAge == 1:
+        preg_state = PREG_STATES[max_A_loc]
+        lik_preg = round(prob_A[max_A_loc]/sum_A * 100)
+
+    # Determine the output of InterVA
+    max_B = nanmax(prob_B)
+    top3 = []
+    cause1 = lik1 = cause2 = lik2 = cause3 = lik3 = None
+    indet = 0
+    if max_B < 0.4:
+        cause1 = lik1 = cause2 = lik2 = cause3 = lik3 = " "
+        indet = 100
+    if max_B >= 0.4:
+        # (the causes already chosen are set to -inf)
+        prob_temp = copy(prob_B)
+        causes = []
+        for k in range(3):
+            max_temp = nanmax(prob_temp)
+            max_loc = where(prob_temp == max_temp)[0][0]
+            lik = round(max_temp * 100)
+            cause = prob_B_names[max_loc]
+            if k > 0 and max_temp < 0.5 * max_B:
+                lik = cause = " "
+            prob_temp[max_loc] = -inf
+            causes.extend((cause, lik))
+            top3.append(lik)
+        cause1, lik1, cause2, lik2, cause3, lik3 = causes
+        top3 = array([int(x) if x != " " else 0 for x in top3])
+        indet = round(100 - nansum(top3))
+
+    # Determine the Circumstances of Mortality CATegory (COMCAT)
+    # and probability
+    comcat = ""
+    comnum = None
+    sum_C = nansum(prob_C)
+    if sum_C > 0:
+        prob_C = prob_C / sum_C
+    max_C = nanmax(prob_C)
+    if max_C < 0.5:
+        comcat = "Multiple"
+        comnum = " "
+    if max_C >= 0.5:
+        comcat = prob_C_names[where(prob_C == max_C)[0][0]]
+        comnum = round(max_C * 100)
+
+    return (preg_state, lik_preg, cause1, lik1, cause2, lik2, cause3, lik3,
+            indet, comcat, comnum, concatenate((prob_A, prob_B, prob_C)))
+
+
+def _causetext(groupcode: bool = False) -> DataFrame:
+    """Return the cause text table with one column: the names of the causes,
+    preceded by their group codes if groupcode is True."""
+
+    causetext = get_asset("causetext")
+    if groupcode:
+        # adding groupcode to cause
+        for i in range(3, 64):
+            cause = str(causetext.iloc[i, 0])
+            code = str(causetext.iloc[i, 1])
+            causetext.iloc[i, 1] = code + " " + cause
+        causetext.drop(causetext.columns[0], axis=1, inplace=True)
+    else:
+        causetext.drop(causetext.columns[1], axis=1, inplace=True)
+    return causetext
+
+
+# returned by next() when a run has no more chunks (see InterVA5._drive)
+_END_OF_RUN = object()
+
+
+def _run_logger() -> Logger:
+    """Return a new logger for the error log of one run.  The logger is not
+    registered with the logging module (so that concurrent runs do not share
+    it and it is freed after the run), but its messages are also passed to
+    the handlers of the module logger."""
+
+    logger = Logger(__name__, INFO)
+    logger.parent = getLogger(__name__)
+    return logger
+
+
+def _chunk_results(chunk_out: dict, va_input_names: Index,
+                   prob_names: Series, malaria: str, hiv: str,
+                   return_checked_data: bool) -> Results:
+    """Return the results of one chunk (the output of _run_chunk()) yielded
+    by InterVA5.iter_results()."""
+
+    valid = [i for i, va_result in enumerate(chunk_out["VA5"])
+             if len(va_result) > 0]
+    VA_result = None
+    if len(valid) > 0:
+        VA_result = DataFrame([chunk_out["VA5"][i] for i in valid],
+                              columns=VA5_COLUMNS)
+    if return_checked_data:
+        checked_data = DataFrame(chunk_out["checked_data"],
+                                 columns=va_input_names)
+    else:
+        checked_data = "return_checked_data = False"
+    return Results({"ID": Series([chunk_out["ID"][i] for i in valid],
+                                 name="ID", dtype=object),
+                    "VA5": VA_result,
+                    "propensities": chunk_out["prob"],
+                    "cause_names": Index(prob_names),
+                    "Malaria": malaria,
+                    "HIV": hiv,
+                    "checked_data": checked_data,
+                    "dem_group": chunk_out["dem_group"].set_index(
+                        "ID").drop(columns="detailed_age"),
+                    "excluded": [va_id for va_id, va_result in
+                                 zip(chunk_out["ID"], chunk_out["VA5"])
+                                 if len(va_result) == 0],
+                    "first_pass": chunk_out["first_pass"],
+                    "second_pass": chunk_out["second_pass"],
+                    "timings": chunk_out["timings"],
+                    "counts": chunk_out["counts"]})
+
+
+def _new_records(va_chunks: Iterable,
+                 id_index: IDIndex) -> Iterator[DataFrame]:
+    """Yield the records of each chunk that are not in id_index (skipping
+    the chunks without new records)."""
+
+    for va_chunk in va_chunks:
+        va_chunk = id_index.new_records(va_chunk)
+        if va_chunk.shape[0] > 0:
+            yield va_chunk
+
 
+def _read_parquet_chunks(path: str, chunksize: int) -> Iterator[DataFrame]:
+    """Yield the records of a Parquet file as pandas DataFrames with at most
+    chunksize records."""
 
-def get_probbase(version: str = "19") -> DataFrame:
+    try:
+        from pyarrow.parquet import ParquetFile
+    except ImportError:
+        raise ImportError("Reading Parquet input requires the pyarrow "
+                          "package (pip install pyarrow).")
+    parquet_file = ParquetFile(path)
+    for batch in parquet_file.iter_batches(batch_size=chunksize):
+        yield batch.to_pandas()
+
+
+# arguments shared by all chunks in a worker process (see _init_worker)
+_worker_kwargs: dict = {}
+
+
+def _init_worker(chunk_kwargs: dict) -> None:
+    """Store the arguments of _run_chunk() that are shared by all chunks
+    when a worker process starts."""
+
+    _worker_kwargs.update(chunk_kwargs)
+
+
+def _run_chunk_in_worker(va_chunk: DataFrame) -> dict:
+    """Run _run_chunk() in a worker process."""
+
+    return _run_chunk(va_chunk, **_worker_kwargs)
+
+
+def get_example_input() -> DataFrame:
     """
-    Get the probbase (the source of the data consistency checks).
+    Get an example input.
 
-    :param version: Probbase version
-    :type version: str
     :return: 200 records of sample input.
     :rtype: pandas.DataFrame
     """
 
-    if version == "19":
-        probbase_bytes = get_data(__name__, "data/probbaseV5_19.csv")
-        probbase = read_csv(BytesIO(probbase_bytes))
-        # note: version 19 does not have first row included in v18
-    else:
-        probbase_xls = get_data("interva", "data/probbase.xls")
-        probbase = read_excel(probbase_xls)
-        # note: drop first row so it matches the input
-        probbase.drop([probbase.index[0]], inplace=True)
-
-    return probbase
+    return get_asset("example_input")
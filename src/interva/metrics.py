@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+"""
+interva.metrics
+-------------------
+
+This module contains the helpers used by InterVA5.run() to measure the
+elapsed (wall) and CPU time of each stage of the pipeline and to count the
+records that are processed.
+"""
+
+from __future__ import annotations
+from typing import Iterable, Iterator
+from contextlib import contextmanager
+from time import perf_counter, thread_time
+
+# stages of InterVA5.run(), in the order in which they are run
+STAGES = ["load", "recode", "datacheck", "scoring", "interpretation",
+          "write", "assembly"]
+# record counts reported for each chunk and for the whole run
+COUNTS = ["records", "valid", "rejected_age", "rejected_sex",
+          "rejected_symptoms", "datacheck_modifications", "datacheck_cached"]
+
+
+def new_timings() -> dict:
+    """Return a dictionary with zero wall and CPU time for each stage."""
+
+    return {stage: {"wall": 0.0, "cpu": 0.0} for stage in STAGES}
+
+
+def new_counts() -> dict:
+    """Return a dictionary with a zero count for each item in COUNTS."""
+
+    return {name: 0 for name in COUNTS}
+
+
+@contextmanager
+def timed(timings: dict, stage: str):
+    """Add the wall and CPU time (in seconds) spent in the with block to
+    timings[stage].  The CPU time is that of the current thread, so that runs
+    in other threads of the process are not counted."""
+
+    wall = perf_counter()
+    cpu = thread_time()
+    try:
+        yield
+    finally:
+        timings[stage]["wall"] += perf_counter() - wall
+        timings[stage]["cpu"] += thread_time() - cpu
+
+
+def timed_iter(iterable: Iterable, timings: dict,
+               stage: str) -> Iterator:
+    """Yield the items of iterable, adding the time spent producing them
+    (e.g., reading chunks of the input) to timings[stage]."""
+
+    iterator = iter(iterable)
+    while True:
+        with timed(timings, stage):
+            item = next(iterator, StopIteration)
+        if item is StopIteration:
+            return
+        yield item
+
+
+def add_to(total: dict, values: dict) -> None:
+    """Add the timings or the counts in values to those in total."""
+
+    for key, value in values.items():
+        if isinstance(value, dict):
+            add_to(total[key], value)
+        else:
+            total[key] += value
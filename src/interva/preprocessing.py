@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+
+"""
+interva.preprocessing
+-------------------
+
+This module recodes the raw VA input into the numeric form used by the
+data checks and the scoring.
+"""
+
+from __future__ import annotations
+from pandas import DataFrame
+from numpy import full, int8, nan, ndarray
+
+# code for the values that are neither "yes" nor "no"
+MISSING = -1
+# positions of the indicators used to check if a record is valid
+AGE_COLUMNS = slice(5, 12)
+SEX_COLUMNS = slice(3, 5)
+SYMPTOM_COLUMNS = slice(20, 328)
+
+
+def recode(va_data: DataFrame) -> ndarray:
+    """Return the VA input as an int8 matrix with 1 for "y"/"Y"/"1", 0 for
+    "n"/"N"/"0", and MISSING for any other value.  The first (ID) column is
+    set to 0.
+
+    :param va_data: the VA input
+    :type va_data: pandas DataFrame
+    :return: the recoded VA input
+    :rtype: numpy ndarray
+    """
+
+    codes = full(va_data.shape, MISSING, dtype=int8)
+    codes[va_data.isin(["n", "N", "0"]).to_numpy()] = 0
+    codes[va_data.isin(["y", "Y", "1"]).to_numpy()] = 1
+    codes[:, 0] = 0
+    return codes
+
+
+def validity_masks(codes: ndarray) -> dict:
+    """Return boolean masks indicating which records have an age indicator
+    (age), a sex indicator (sex), and at least one symptom (symptoms).
+
+    :param codes: VA input recoded with recode()
+    :type codes: numpy ndarray
+    :return: the masks with one value for each record
+    :rtype: dict
+    """
+
+    return {"age": (codes[:, AGE_COLUMNS] == 1).any(axis=1),
+            "sex": (codes[:, SEX_COLUMNS] == 1).any(axis=1),
+            "symptoms": (codes[:, SYMPTOM_COLUMNS] == 1).any(axis=1)}
+
+
+def to_object(codes: ndarray) -> ndarray:
+    """Return the recoded VA input as an object array with the integers 0 and
+    1 and NaN for missing values (the form expected by the data checks)."""
+
+    values = codes.astype(object)
+    values[codes == MISSING] = nan
+    return values
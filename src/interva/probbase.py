@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+
+"""
+interva.probbase
+-------------------
+
+This module contains the compiled (numeric) form of the probbase and the
+cache that lets InterVA5 instances share it.
+"""
+
+from __future__ import annotations
+from typing import Union
+from collections import OrderedDict
+from hashlib import sha256
+from threading import Lock
+from pandas import DataFrame
+from numpy import array, concatenate, float64, full, nan, ndarray, zeros
+
+from interva.registry import get_asset
+
+# numeric values of the likelihood codes used in the probbase
+LIKELIHOOD_VALUES = {"I": 1, "A+": 0.8, "A": 0.5, "A-": 0.2, "B+": 0.1,
+                     "B": 0.05, "B-": 0.02, "B -": 0.02, "C+": 0.01,
+                     "C": 0.005, "C-": 0.002, "D+": 0.001, "D": 5e-04,
+                     "D-": 1e-04, "E": 1e-05, "N": 0, "": 0}
+# maximum number of compiled probbases kept in the cache
+CACHE_SIZE = 8
+
+_cache: OrderedDict = OrderedDict()
+_version_keys: dict = {}
+_cache_lock = Lock()
+
+
+class CompiledProbbase:
+    """Numeric form of the symptom-cause-information (probbase) used by
+    InterVA5.  Instances are built once per probbase and shared (read-only)
+    between runs, see compile_probbase().
+
+    :param probbase: the probbase with 354 rows (the first one holds the
+    unconditional priors) and 87 columns.
+    :type probbase: pandas DataFrame or numpy ndarray
+    :param key: content hash of the probbase
+    :type key: str
+    """
+
+    def __init__(self, probbase: Union[DataFrame, ndarray], key: str):
+
+        pb_df = DataFrame(probbase).copy()
+        pb_for_datacheck = pb_df.fillna(".")
+        pb_for_datacheck.iloc[:, 1] = ""
+        pb = pb_df.to_numpy()
+
+        self.key = key
+        self.version = pb[0, 2]
+        self.datacheck = pb_for_datacheck.to_numpy(dtype=str)
+        subst = full(pb.shape[0], nan)
+        subst[pb[:, 5] == "N"] = 0
+        subst[pb[:, 5] == "Y"] = 1
+        self.subst = subst
+        values = array(
+            [LIKELIHOOD_VALUES.get(x, x) if isinstance(x, str) else x
+             for x in pb[:, 17:].ravel()],
+            dtype=float64).reshape(pb.shape[0], pb.shape[1] - 17)
+        self.sys_prior = concatenate((zeros(17), values[0]))
+        self.likelihood = values[1:]
+        for x in (self.datacheck, self.subst, self.sys_prior,
+                  self.likelihood):
+            x.setflags(write=False)
+
+    def __repr__(self):
+        return (f"interva.probbase.CompiledProbbase(version = {self.version}, "
+                f"key = {self.key})")
+
+    def prior(self, hiv: str, malaria: str) -> ndarray:
+        """Return the prior probabilities of the 70 causes for the given
+        HIV and malaria levels ("h", "l", or "v")."""
+
+        sys_prior = self.sys_prior.copy()
+        if hiv == "h":
+            sys_prior[22] = 0.05
+        if hiv == "l":
+            sys_prior[22] = 0.005
+        if hiv == "v":
+            sys_prior[22] = 1e-05
+        if malaria == "h":
+            sys_prior[24] = 0.05
+            sys_prior[44] = 0.05
+        if malaria == "l":
+            sys_prior[24] = 0.005
+            sys_prior[44] = 1e-05
+        if malaria == "v":
+            sys_prior[24] = 1e-05
+            sys_prior[44] = 1e-05
+        return sys_prior[17:]
+
+
+def probbase_key(probbase: Union[DataFrame, ndarray]) -> str:
+    """Return a content hash identifying a probbase."""
+
+    values = DataFrame(probbase).to_numpy(dtype=str)
+    digest = sha256(str(values.shape).encode())
+    digest.update(values.tobytes())
+    return digest.hexdigest()
+
+
+def compile_probbase(sci: Union[DataFrame, ndarray, None] = None,
+                     version: str = "19") -> CompiledProbbase:
+    """Return the compiled probbase, building it only if it is not already
+    in the cache (which holds the CACHE_SIZE most recently used ones).
+
+    :param sci: an array containing the symptom-cause-information
+    (aka Probbase).  If None, then the probbase distributed with the package
+    is used.
+    :type sci: pandas DataFrame or numpy ndarray
+    :param version: version of the package probbase (only used if sci is
+    None)
+    :type version: str
+    :return: the compiled probbase
+    :rtype: CompiledProbbase
+    """
+
+    if sci is None:
+        with _cache_lock:
+            key = _version_keys.get(version)
+            if key in _cache:
+                _cache.move_to_end(key)
+                return _cache[key]
+        # (the probbase is only read, so the registry copy is not needed)
+        sci = get_asset("probbase_19" if version == "19" else
+                        "probbase_xls", copy=False)
+    else:
+        valid_sci = True
+        if not isinstance(sci, DataFrame) and not isinstance(sci, ndarray):
+            valid_sci = False
+        elif sci.shape[0] != 354 or sci.shape[1] != 87:
+            valid_sci = False
+        if not valid_sci:
+            raise IOError(
+                "Error: Invalid SCI (must be Pandas DataFrame or "
+                "Numpy ndarray with 354 rows and 87 columns).")
+        version = None
+
+    key = probbase_key(sci)
+    with _cache_lock:
+        compiled = _cache.get(key)
+    if compiled is None:
+        compiled = CompiledProbbase(sci, key)
+    with _cache_lock:
+        _cache[key] = compiled
+        _cache.move_to_end(key)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+        if version is not None:
+            _version_keys[version] = key
+    return compiled
+
+
+def clear_probbase_cache() -> None:
+    """Remove all compiled probbases from the cache."""
+
+    with _cache_lock:
+        _cache.clear()
+        _version_keys.clear()
+
+
+def get_probbase(version: str = "19") -> DataFrame:
+    """
+    Get the probbase (the source of the data consistency checks).
+
+    :param version: Probbase version
+    :type version: str
+    :return: the probbase (a copy, see interva.registry).
+    :rtype: pandas.DataFrame
+    """
+
+    if version == "19":
+        return get_asset("probbase_19")
+    return get_asset("probbase_xls")
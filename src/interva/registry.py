@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+"""
+interva.registry
+-------------------
+
+This module contains the registry of the data files distributed with the
+package.  Each file is parsed once per process (the first time that it is
+used) and callers get a copy, so that changing it does not change the
+registry.  prewarm() parses the files ahead of time (e.g., before forking
+worker processes, so that they share the parsed data).
+"""
+
+from __future__ import annotations
+from typing import Callable, Iterable, Union
+from threading import Lock
+from pandas import DataFrame, read_csv, read_excel
+from pkgutil import get_data
+from io import BytesIO
+
+from interva.data.causetext import CAUSETEXTV5_INDEX, CAUSETEXTV5_ROWS
+from interva.exceptions import ArgumentException
+
+_assets: dict = {}
+_assets_lock = Lock()
+
+
+def _read_example_input() -> DataFrame:
+    return read_csv(BytesIO(get_data("interva", "data/randomva5.csv")))
+
+
+def _read_probbase_19() -> DataFrame:
+    # note: version 19 does not have first row included in v18
+    return read_csv(BytesIO(get_data("interva", "data/probbaseV5_19.csv")))
+
+
+def _read_probbase_xls() -> DataFrame:
+    probbase = read_excel(get_data("interva", "data/probbase.xls"))
+    # note: drop first row so it matches the input
+    probbase.drop([probbase.index[0]], inplace=True)
+    return probbase
+
+
+def _make_causetext() -> DataFrame:
+    return DataFrame(list(CAUSETEXTV5_ROWS), index=list(CAUSETEXTV5_INDEX),
+                     columns=["cause", "code"], dtype=object)
+
+
+# loaders of the assets in the registry (name: function parsing the asset)
+ASSETS: dict = {"example_input": _read_example_input,
+                "probbase_19": _read_probbase_19,
+                "probbase_xls": _read_probbase_xls,
+                "causetext": _make_causetext}
+
+
+def get_asset(name: str, copy: bool = True) -> DataFrame:
+    """Return a data file of the package, parsing it only the first time.
+
+    :param name: name of the asset (a key of ASSETS)
+    :type name: str
+    :param copy: If True, a copy is returned.  Otherwise, the object kept in
+    the registry is returned, and it must not be changed.
+    :type copy: bool
+    :return: the parsed data file
+    :rtype: pandas.DataFrame
+    """
+
+    loader: Union[Callable, None] = ASSETS.get(name)
+    if loader is None:
+        raise ArgumentException(
+            f"Unknown asset '{name}' (must be one of {list(ASSETS)})")
+    with _assets_lock:
+        asset = _assets.get(name)
+        if asset is None:
+            asset = _assets[name] = loader()
+    if copy:
+        return asset.copy()
+    return asset
+
+
+def prewarm(names: Union[Iterable[str], None] = None) -> None:
+    """Parse the assets with the given names into the registry (by default,
+    all of them except the probbase of version 18, which is only used when
+    it is requested)."""
+
+    if names is None:
+        names = [name for name in ASSETS if name != "probbase_xls"]
+    for name in names:
+        get_asset(name, copy=False)
+
+
+def clear_registry() -> None:
+    """Remove all parsed assets from the registry."""
+
+    with _assets_lock:
+        _assets.clear()
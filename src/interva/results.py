@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+"""
+interva.results
+-------------------
+
+This module contains the container for the results of InterVA5.run(), which
+stores the propensities of all valid records in a single array.
+"""
+
+from __future__ import annotations
+from typing import Tuple
+from pandas import DataFrame, Index, Series
+from numpy import array, empty, float64, ndarray
+
+from interva.exceptions import ArgumentException
+
+
+class Results(dict):
+    """Dictionary with the results of InterVA5.run().
+
+    The propensities of the valid records are stored as one (N x 70) array
+    under the key "propensities" (with rows in the same order as the VA5
+    DataFrame), and the cause names are stored once under "cause_names".  The
+    WHOLEPROB column of VA5 (a pandas.Series of propensities for each record)
+    is kept for backward compatibility, but it is only built the first time
+    that VA5 is accessed.  Replacing VA5 removes the propensities, so that
+    they always describe the records in VA5.
+    """
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        if key == "VA5" and isinstance(value, DataFrame) and \
+                "WHOLEPROB" not in value.columns and \
+                super().__contains__("propensities"):
+            prob = super().__getitem__("propensities")
+            cause_names = super().__getitem__("cause_names")
+            value["WHOLEPROB"] = Series(
+                [Series(x, index=cause_names) for x in prob],
+                index=value.index, dtype=object)
+        return value
+
+    def __setitem__(self, key, value):
+        if key == "VA5" and value is not super().get("VA5"):
+            self.pop("propensities", None)
+            self.pop("cause_names", None)
+        super().__setitem__(key, value)
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def copy(self) -> Results:
+        return Results(self)
+
+
+def get_propensities(results: dict) -> Tuple[DataFrame, ndarray, Index]:
+    """Return the VA5 DataFrame (without building the WHOLEPROB column), the
+    propensity matrix (one row per record in VA5), and the cause names.
+
+    :param results: the results attribute of InterVA5
+    :type results: dict
+    :return: VA5, the propensities, and the cause names
+    :rtype: tuple
+    """
+
+    if isinstance(results, Results) and "propensities" in results:
+        va5 = dict.__getitem__(results, "VA5")
+        return va5, results["propensities"], results["cause_names"]
+
+    # results assembled by hand, with the propensities in WHOLEPROB
+    va5 = results["VA5"]
+    if "WHOLEPROB" not in va5.columns:
+        raise ArgumentException(
+            "Unexpected va5 format (WHOLEPROB column is missing).  The "
+            "expected format is InterVA5.results['VA5']")
+    if va5.shape[0] == 0:
+        return va5, empty((0, 0)), Index([])
+    prob = array([x.to_numpy() for x in va5["WHOLEPROB"]], dtype=float64)
+    return va5, prob, va5["WHOLEPROB"].iloc[0].index
@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+
+"""
+interva.scoring
+-------------------
+
+This module contains the batch engine that computes the InterVA5
+propensities for many VA records at once, and the same computations for a
+single record (see interva.session).
+"""
+
+from __future__ import annotations
+from typing import Union
+from math import isnan as isnan_scalar
+from numpy import (ndarray, add, array, asarray, errstate, exp, flatnonzero,
+                   float64, floor, inf, isnan, log, maximum, multiply, nan,
+                   nansum, newaxis, sort, tile, where)
+from interva.sparse import SymptomMatrix
+
+# column ranges (within the 70 causes) that are normalized separately:
+# pregnancy status (A), causes of death (B), and circumstances of mortality (C)
+PROB_BLOCKS = ((0, 3), (3, 64), (64, 70))
+# bound on the absolute difference between the propensities computed by
+# score_batch_log() and score_batch() (the largest difference observed on
+# cohorts resampled from the example input is about 1e-14)
+LOG_SCORING_TOLERANCE = 1e-12
+# relative distance from a tie or a cutoff below which score_batch_log()
+# scores a record again with score_batch() (the relative differences between
+# the two engines are below 1e-12)
+TIE_TOLERANCE = 1e-10
+
+
+def score_batch(symptoms: Union[ndarray, SymptomMatrix], likelihood: ndarray,
+                prior: ndarray) -> ndarray:
+    """Calculate the propensities for a batch of VA records.
+
+    The records are scored together, one symptom at a time, so that every
+    record sees exactly the same sequence of floating point operations as
+    the original record-by-record algorithm: the running propensities are
+    multiplied by the likelihoods of each positive symptom (in indicator
+    order) and the A, B, and C blocks are renormalized after each symptom.
+    The output is therefore identical (bit for bit) to scoring the records
+    one at a time.
+
+    :param symptoms: indicators of the symptoms that take their substantive
+    value, with one row per record and one column per row of likelihood.
+    :type symptoms: numpy.ndarray (bool) or interva.sparse.SymptomMatrix
+    :param likelihood: numeric likelihoods with one row per symptom and one
+    column per cause.
+    :type likelihood: numpy.ndarray (float64)
+    :param prior: prior probabilities of the causes.
+    :type prior: numpy.ndarray (float64)
+    :return: propensities with one row per record and one column per cause.
+    :rtype: numpy.ndarray (float64)
+    """
+
+    symptoms = _as_sparse(symptoms)
+    prob = tile(asarray(prior, dtype=float), (symptoms.shape[0], 1))
+    for j, rows in symptoms.columns():
+        prob_j = prob[rows] * likelihood[j]
+        for start, stop in PROB_BLOCKS:
+            block_sum = nansum(prob_j[:, start:stop], axis=1)
+            positive = block_sum > 0
+            prob_j[positive, start:stop] = (
+                prob_j[positive, start:stop] / block_sum[positive, newaxis])
+        prob[rows] = prob_j
+    return prob
+
+
+def score_batch_log(symptoms: Union[ndarray, SymptomMatrix],
+                    likelihood: ndarray, prior: ndarray,
+                    resolve_ties: bool = True) -> ndarray:
+    """Calculate the propensities for a batch of VA records in log space.
+
+    The log-likelihoods of the positive symptoms are summed (with a sparse
+    matrix product, see interva.sparse) and added to the log-priors, and then
+    each of the A, B, and C blocks is normalized once with the log-sum-exp
+    trick.  This gives the same propensities as score_batch() in exact
+    arithmetic (renormalizing a block after each symptom does not change the
+    final proportions), and in floating point the propensities agree within
+    LOG_SCORING_TOLERANCE.  As in score_batch(), a cause with a missing (NaN)
+    likelihood for a positive symptom has a missing propensity, and a block
+    in which all of the causes have zero likelihood is left at zero.
+
+    The likelihoods are decimal fractions, so exact ties are common in the
+    comparisons that assign the causes (e.g., a second cause with exactly
+    half the propensity of the first one), and these ties are decided by
+    the rounding errors of each engine.  If resolve_ties is True, the
+    records with propensities within TIE_TOLERANCE of such a tie or cutoff
+    (see near_ties()) are scored again with score_batch(), so that the
+    causes assigned by InterVA5 are the same as with score_batch().
+
+    :param symptoms: indicators of the symptoms that take their substantive
+    value, with one row per record and one column per row of likelihood.
+    :type symptoms: numpy.ndarray (bool) or interva.sparse.SymptomMatrix
+    :param likelihood: numeric likelihoods with one row per symptom and one
+    column per cause.
+    :type likelihood: numpy.ndarray (float64)
+    :param prior: prior probabilities of the causes.
+    :type prior: numpy.ndarray (float64)
+    :param resolve_ties: score the records with ties again with score_batch()
+    :type resolve_ties: bool
+    :return: propensities with one row per record and one column per cause.
+    :rtype: numpy.ndarray (float64)
+    """
+
+    symptoms = _as_sparse(symptoms)
+    likelihood = asarray(likelihood, dtype=float64)
+    prior = asarray(prior, dtype=float64)
+    missing = isnan(likelihood)
+    zero = likelihood == 0
+    with errstate(divide="ignore", invalid="ignore"):
+        log_likelihood = where(missing | zero, 0, log(likelihood))
+        log_prob = log(prior) + symptoms.dot(log_likelihood)
+    # a zero (or missing) likelihood of a positive symptom gives a zero (or
+    # missing) propensity
+    log_prob[symptoms.dot(zero) > 0] = -inf
+    log_prob[symptoms.dot(missing) > 0] = nan
+
+    prob = tile(prior, (symptoms.shape[0], 1))
+    # (records without positive symptoms keep the prior, which is not
+    # normalized)
+    scored = symptoms.row_counts() > 0
+    for start, stop in PROB_BLOCKS:
+        block = log_prob[:, start:stop]
+        block_max = where(isnan(block), -inf, block).max(axis=1)
+        normalize = scored & (block_max > -inf)
+        shifted = exp(block[normalize] - block_max[normalize, newaxis])
+        prob[normalize, start:stop] = (
+            shifted / nansum(shifted, axis=1)[:, newaxis])
+        # (blocks with zero likelihood for all causes)
+        prob[scored & ~normalize, start:stop] = exp(
+            block[scored & ~normalize])
+
+    if resolve_ties:
+        rows = flatnonzero(near_ties(prob, TIE_TOLERANCE))
+        if len(rows) > 0:
+            prob[rows] = score_batch(symptoms.take_rows(rows), likelihood,
+                                     prior)
+    return prob
+
+
+def score_record(symptoms: ndarray, likelihood: ndarray,
+                 prior: ndarray) -> ndarray:
+    """Calculate the propensities of one VA record.
+
+    This is score_batch() for a single record, without the batch structures:
+    the propensities are multiplied by the likelihoods of each positive
+    symptom (in place) and the A, B, and C blocks are renormalized after
+    each one, so the output is identical (bit for bit) to score_batch().
+
+    :param symptoms: the positive symptoms of the record (rows of
+    likelihood), in increasing order.
+    :type symptoms: numpy.ndarray (int)
+    :param likelihood: numeric likelihoods with one row per symptom and one
+    column per cause.
+    :type likelihood: numpy.ndarray (float64)
+    :param prior: prior probabilities of the causes.
+    :type prior: numpy.ndarray (float64)
+    :return: the propensities of the causes.
+    :rtype: numpy.ndarray (float64)
+    """
+
+    prob = array(prior, dtype=float64)
+    blocks = [prob[start:stop] for start, stop in PROB_BLOCKS]
+    for j in symptoms:
+        multiply(prob, likelihood[j], out=prob)
+        for block in blocks:
+            block_sum = block.sum()
+            if isnan_scalar(block_sum):
+                # (a cause with a missing propensity)
+                block_sum = nansum(block)
+            if block_sum > 0:
+                block /= block_sum
+    return prob
+
+
+def score_record_log(symptoms: ndarray, likelihood: ndarray, prior: ndarray,
+                     resolve_ties: bool = True) -> ndarray:
+    """Calculate the propensities of one VA record in log space.
+
+    This is score_batch_log() for a single record: only the log-likelihoods
+    of the positive symptoms are calculated, and the output is identical to
+    score_batch_log() (including the records scored again with score_record()
+    if resolve_ties is True).
+
+    :param symptoms: the positive symptoms of the record (rows of
+    likelihood), in increasing order.
+    :type symptoms: numpy.ndarray (int)
+    :param likelihood: numeric likelihoods with one row per symptom and one
+    column per cause.
+    :type likelihood: numpy.ndarray (float64)
+    :param prior: prior probabilities of the causes.
+    :type prior: numpy.ndarray (float64)
+    :param resolve_ties: score the record again with score_record() if it
+    has ties (see near_ties())
+    :type resolve_ties: bool
+    :return: the propensities of the causes.
+    :rtype: numpy.ndarray (float64)
+    """
+
+    prior = asarray(prior, dtype=float64)
+    prob = prior.copy()
+    if len(symptoms) == 0:
+        return prob
+    rows = asarray(likelihood, dtype=float64)[symptoms]
+    missing = isnan(rows)
+    zero = rows == 0
+    with errstate(divide="ignore", invalid="ignore"):
+        # (summed in the same order as SymptomMatrix.dot())
+        log_prob = log(prior) + add.reduceat(
+            where(missing | zero, 0, log(rows)), [0], axis=0)[0]
+    log_prob[zero.any(axis=0)] = -inf
+    log_prob[missing.any(axis=0)] = nan
+
+    for start, stop in PROB_BLOCKS:
+        block = log_prob[start:stop]
+        block_max = where(isnan(block), -inf, block).max()
+        if block_max > -inf:
+            shifted = exp(block - block_max)
+            prob[start:stop] = shifted / nansum(shifted)
+        else:
+            prob[start:stop] = exp(block)
+
+    if resolve_ties and near_ties(prob[newaxis])[0]:
+        prob = score_record(symptoms, likelihood, prior)
+    return prob
+
+
+def near_ties(prob: ndarray, tolerance: float = TIE_TOLERANCE) -> ndarray:
+    """Return a boolean array indicating which records have propensities
+    within a relative distance of tolerance of a tie or a cutoff used to
+    assign the pregnancy status, the causes, and the circumstances of
+    mortality (the comparisons of InterVA5.run()).
+
+    :param prob: propensities with one row per record and 70 columns.
+    :type prob: numpy.ndarray (float64)
+    :param tolerance: relative distance
+    :type tolerance: float
+    :return: indicator of the records near a tie or a cutoff
+    :rtype: numpy.ndarray (bool)
+    """
+
+    def close(x, y):
+        return abs(x - y) <= tolerance * maximum(abs(x), abs(y))
+
+    def close_to_half(x):
+        # values that are rounded to percentages
+        return close(x * 100, floor(x * 100) + 0.5)
+
+    with errstate(invalid="ignore", divide="ignore"):
+        # pregnancy status: the largest propensity is compared with 0.1 and,
+        # if it is used, with the second one, and its share of the block is
+        # rounded
+        prob_a = prob[:, 0:3]
+        top_a = _top(prob_a, 2)
+        used = top_a[:, 0] >= 0.1 * (1 - tolerance)
+        near = close(top_a[:, 0], 0.1) | (used & (
+            close(top_a[:, 0], top_a[:, 1]) |
+            close_to_half(top_a[:, 0] / nansum(prob_a, axis=1))))
+        # causes: the largest propensity is compared with 0.4 and, if it is
+        # used, the second and third ones are compared with half of it; the
+        # causes that are reported are compared with the next one (which
+        # could have been chosen instead) and rounded
+        top_b = _top(prob[:, 3:64], 4)
+        near |= close(top_b[:, 0], 0.4)
+        used = top_b[:, 0] >= 0.4 * (1 - tolerance)
+        for k in range(3):
+            if k > 0:
+                near |= used & close(top_b[:, k], 0.5 * top_b[:, 0])
+                used &= top_b[:, k] >= 0.5 * top_b[:, 0] * (1 - tolerance)
+            near |= used & (close(top_b[:, k], top_b[:, k + 1]) |
+                            close_to_half(top_b[:, k]))
+        # circumstances of mortality: the largest share of the block is
+        # compared with 0.5 and, if it is used, with the second one, and
+        # rounded
+        prob_c = prob[:, 64:70]
+        top_c = _top(prob_c, 2) / nansum(prob_c, axis=1)[:, newaxis]
+        used = top_c[:, 0] >= 0.5 * (1 - tolerance)
+        near |= close(top_c[:, 0], 0.5) | (used & (
+            close(top_c[:, 0], top_c[:, 1]) | close_to_half(top_c[:, 0])))
+    return near
+
+
+def _top(values: ndarray, k: int) -> ndarray:
+    """Return the k largest values of each row in decreasing order (NaN
+    values are ignored)."""
+
+    values = where(isnan(values), -inf, values)
+    return -sort(-values, axis=1)[:, 0:k]
+
+
+def _as_sparse(symptoms: Union[ndarray, SymptomMatrix]) -> SymptomMatrix:
+    """Return the symptom indicators as a SymptomMatrix."""
+
+    if isinstance(symptoms, SymptomMatrix):
+        return symptoms
+    return SymptomMatrix.from_dense(symptoms)
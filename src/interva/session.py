@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+
+"""
+interva.session
+-------------------
+
+This module contains a scoring session, which keeps everything that
+InterVA5.run() prepares for a cohort (the compiled probbase, the priors for
+the HIV and malaria levels, and the cause names) so that single records can
+be scored as they arrive (e.g., behind a web service) without creating an
+InterVA5 object for each one.
+"""
+
+from __future__ import annotations
+from typing import Union
+from pandas import DataFrame, Index, Series
+from itertools import repeat
+from numpy import asarray, flatnonzero, float64, fromiter, int8, ndarray
+
+from interva.cache import DatacheckCache
+from interva.data.valabels import VALABELS
+from interva.exceptions import ArgumentException
+from interva.interva5 import (InterVA5, VA5_COLUMNS, _causetext,
+                              _check_record, _interpret_record,
+                              _reproductive_age)
+from interva.preprocessing import MISSING, validity_masks
+from interva.probbase import compile_probbase
+from interva.scoring import score_record, score_record_log
+
+# recoded values of the input (see interva.preprocessing.recode)
+CODES = {"y": 1, "Y": 1, "1": 1, "n": 0, "N": 0, "0": 0}
+# single-record versions of interva.interva5.SCORING_ENGINES
+SCORING_ENGINES = {"sequential": score_record, "log": score_record_log}
+
+
+class ScoringSession:
+    """Score single VA records with the same settings (and results) as
+    InterVA5.run().  The probbase, the priors, and the cause names are
+    prepared once, when the session is created, and score() only recodes,
+    checks, scores and interprets one record.
+
+    :param hiv: likelihood of HIV as a cause of death.  Possible values are
+    "h" (high), "l" (low), and "v" (very low).
+    :type hiv: string
+    :param malaria: likelihood of malaria as a cause of death.  Possible
+    values are "h" (high), "l" (low), and "v" (very low).
+    :type malaria: string
+    :param groupcode: a logical value indicating whether the group code is
+    included in the cause names.
+    :type groupcode: boolean
+    :param sci: an array containing the symptom-cause-information (aka
+    Probbase).  If None, the probbase distributed with the package is used.
+    :type sci: pandas DataFrame or numpy ndarray
+    :param scoring: the engine used to calculate the propensities
+    ("sequential" or "log", see InterVA5).
+    :type scoring: string
+    :param datacheck_cache: a cache of the output of the data checks (see
+    InterVA5).
+    :type datacheck_cache: interva.cache.DatacheckCache
+    :param verbose: a logical value indicating whether the session prints
+    its messages (as InterVA5.run()).
+    :type verbose: boolean
+    """
+
+    def __init__(self, hiv: str, malaria: str, groupcode: bool = False,
+                 sci: Union[DataFrame, ndarray, None] = None,
+                 scoring: str = "sequential",
+                 datacheck_cache: Union[DatacheckCache, None] = None,
+                 verbose: bool = True):
+
+        hiv = hiv.lower()
+        malaria = malaria.lower()
+        hlv_set = ["h", "l", "v"]
+        if hiv not in hlv_set or malaria not in hlv_set:
+            raise IOError("error: the HIV and Malaria indicator "
+                          "should be one of the three: 'h', 'l', 'v'")
+        if scoring not in SCORING_ENGINES:
+            raise IOError("error: scoring should be one of: " +
+                          ", ".join(f"'{x}'" for x in SCORING_ENGINES))
+        self.hiv = hiv
+        self.malaria = malaria
+        self.groupcode = groupcode
+        self.scoring = scoring
+        self.datacheck_cache = datacheck_cache
+        self.verbose = verbose
+        self._renamed = False
+        self._probbase = compile_probbase(sci=sci)
+        self.probbaseV5Version = self._probbase.version
+        self._cause_prior = self._probbase.prior(hiv, malaria)
+        prob_names = _causetext(groupcode).iloc[:, 0].to_numpy()
+        self._prob_B_names = prob_names[3:64]
+        self._prob_C_names = prob_names[64:70]
+        self.cause_names = Index(prob_names)
+        self._va_input_names = Index(VALABELS)
+        self._subst = self._probbase.subst[1:]
+
+    def __repr__(self):
+        return (f"interva.session.ScoringSession(hiv = {self.hiv}, "
+                f"malaria = {self.malaria}, groupcode = {self.groupcode}, "
+                f"probbase version = {self.probbaseV5Version})")
+
+    def score(self, record: Union[dict, Series, ndarray, list]) -> dict:
+        """Check and score one VA record.
+
+        :param record: the record in the InterVA5 input format: a dict or
+        pandas.Series with the standard column names (see
+        interva.data.valabels.VALABELS) as keys, or an array or list with the
+        ID followed by the 353 indicators, in the standard order.  The
+        indicators are "y", "n" or "." (missing), as in the input of
+        InterVA5.
+        :type record: dict, pandas.Series, numpy.ndarray, or list
+        :return: the fields of the record in InterVA5.results["VA5"] (ID,
+        MALPREV, ..., COMNUM, and WHOLEPROB, the propensities of the causes
+        as a pandas.Series), and the messages of the first and second pass
+        of the data checks (first_pass and second_pass).
+        :rtype: dict
+        """
+
+        values = self._values(record)
+        va_id = str(values[0])
+        codes = fromiter(map(CODES.get, values, repeat(MISSING)), dtype=int8,
+                         count=len(values))
+        codes[0] = 0
+        valid = validity_masks(codes.reshape(1, -1))
+        if not valid["age"][0]:
+            raise ArgumentException(
+                va_id + " Error in age indicator: Not Specified")
+        if not valid["sex"][0]:
+            raise ArgumentException(
+                va_id + " Error in sex indicator: Not Specified")
+        if not valid["symptoms"][0]:
+            raise ArgumentException(
+                va_id + " Error in indicators: No symptoms specified")
+
+        checked_values, first_pass, second_pass, new_check = _check_record(
+            codes, va_id, self._va_input_names, self._probbase,
+            self.datacheck_cache)
+        if new_check is not None and new_check[0] is not None:
+            self.datacheck_cache.put(*new_check)
+        checked_input = asarray(checked_values, dtype=float64)
+        # (the record is scored and interpreted directly, without the
+        # structures used for the chunks of InterVA5.run())
+        prob = SCORING_ENGINES[self.scoring](
+            flatnonzero(checked_input == self._subst),
+            self._probbase.likelihood, self._cause_prior)
+        assigned = _interpret_record(
+            prob, _reproductive_age(checked_input.reshape(1, -1))[0],
+            self._prob_B_names, self._prob_C_names)
+        result = dict(zip(VA5_COLUMNS, InterVA5._va5(
+            va_id, self.malaria, self.hiv, *assigned[:-1])))
+        result["WHOLEPROB"] = Series(assigned[-1], index=self.cause_names)
+        result["first_pass"] = first_pass
+        result["second_pass"] = second_pass
+        return result
+
+    def _values(self, record: Union[dict, Series, ndarray, list]) -> list:
+        """Return the values of a record in the standard column order."""
+
+        n_columns = len(self._va_input_names)
+        if isinstance(record, Series):
+            if tuple(record.index) == VALABELS:
+                return record.tolist()
+            # (much faster to look up than the labels of a Series)
+            record = dict(zip(record.index, record.tolist()))
+        if isinstance(record, dict):
+            if len(record) != n_columns:
+                raise ArgumentException(
+                    f"The record must have {n_columns} values (the ID and "
+                    "the indicators)")
+            if "i183o" in record:
+                record = {("i183a" if key == "i183o" else key): value
+                          for key, value in record.items()}
+                if not self._renamed and self.verbose:
+                    print("Due to the inconsistent names in the early "
+                          "version of InterVA5, the indicator 'i183o' has "
+                          "been renamed as 'i183a'.")
+                    self._renamed = True
+            try:
+                return [record[name] for name in VALABELS]
+            except KeyError:
+                # (the column names are not case sensitive)
+                lower = {str(key).lower(): value for key, value in
+                         record.items()}
+            try:
+                return [lower[name.lower()] for name in VALABELS]
+            except KeyError as exc:
+                raise ArgumentException(
+                    f"The record does not have the column {exc}") from None
+        values = list(record)
+        if len(values) != n_columns:
+            raise ArgumentException(
+                f"The record must have {n_columns} values (the ID and the "
+                "indicators)")
+        return values
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+
+"""
+interva.sparse
+-------------------
+
+This module contains the compressed sparse row (CSR) form of the symptom
+indicators used to score the VA records (only a few dozen of the 353
+indicators are positive in a typical record).
+"""
+
+from __future__ import annotations
+from typing import Iterator, Tuple
+from numpy import (ndarray, add, arange, argsort, asarray, concatenate,
+                   cumsum, diff, flatnonzero, float64, int16, int64, nonzero,
+                   repeat, zeros)
+
+
+class SymptomMatrix:
+    """Boolean matrix (one row per record and one column per symptom) stored
+    in compressed sparse row form: the columns of the true values of row i
+    are indices[indptr[i]:indptr[i + 1]], in increasing order.
+
+    :param indptr: start of each row in indices (with n_rows + 1 values)
+    :type indptr: numpy.ndarray (int64)
+    :param indices: columns of the true values
+    :type indices: numpy.ndarray (int16)
+    :param n_columns: number of columns
+    :type n_columns: int
+    """
+
+    def __init__(self, indptr: ndarray, indices: ndarray, n_columns: int):
+
+        self.indptr = asarray(indptr, dtype=int64)
+        self.indices = asarray(indices, dtype=int16)
+        self.n_columns = n_columns
+
+    @classmethod
+    def from_dense(cls, dense: ndarray) -> SymptomMatrix:
+        """Return the sparse form of a (dense) boolean matrix."""
+
+        dense = asarray(dense, dtype=bool)
+        _, columns = nonzero(dense)
+        indptr = concatenate(([0], cumsum(dense.sum(axis=1))))
+        return cls(indptr, columns, dense.shape[1])
+
+    def __repr__(self):
+        return (f"interva.sparse.SymptomMatrix(shape = {self.shape}, "
+                f"nnz = {self.nnz})")
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return len(self.indptr) - 1, self.n_columns
+
+    @property
+    def nnz(self) -> int:
+        """Number of true values."""
+
+        return len(self.indices)
+
+    def row_counts(self) -> ndarray:
+        """Return the number of true values in each row."""
+
+        return diff(self.indptr)
+
+    def to_dense(self) -> ndarray:
+        """Return the matrix as a (dense) boolean array."""
+
+        dense = zeros(self.shape, dtype=bool)
+        dense[self._row_of_values(), self.indices] = True
+        return dense
+
+    def take_rows(self, rows: ndarray) -> SymptomMatrix:
+        """Return the matrix with the given rows."""
+
+        rows = asarray(rows, dtype=int64)
+        starts = self.indptr[rows]
+        counts = self.indptr[rows + 1] - starts
+        indptr = concatenate(([0], cumsum(counts)))
+        # positions of the values of the selected rows in indices
+        offsets = arange(indptr[-1]) - repeat(indptr[:-1], counts)
+        positions = repeat(starts, counts) + offsets
+        return SymptomMatrix(indptr, self.indices[positions], self.n_columns)
+
+    def dot(self, dense: ndarray) -> ndarray:
+        """Return the product of the matrix (as 0 and 1) and a dense array
+        with one row per column of the matrix."""
+
+        dense = asarray(dense)
+        if dense.dtype.kind != "f":
+            dense = dense.astype(float64)
+        product = zeros((self.shape[0],) + dense.shape[1:], dtype=dense.dtype)
+        nonempty = self.row_counts() > 0
+        if self.nnz > 0:
+            product[nonempty] = add.reduceat(dense[self.indices],
+                                             self.indptr[:-1][nonempty],
+                                             axis=0)
+        return product
+
+    def columns(self) -> Iterator[Tuple[int, ndarray]]:
+        """Yield each column with at least one true value (in increasing
+        order) and the rows in which it is true (in increasing order)."""
+
+        order = argsort(self.indices, kind="stable")
+        sorted_columns = self.indices[order]
+        sorted_rows = self._row_of_values()[order]
+        starts = concatenate(
+            ([0], flatnonzero(diff(sorted_columns)) + 1, [self.nnz]))
+        for start, stop in zip(starts[:-1], starts[1:]):
+            if stop > start:
+                yield int(sorted_columns[start]), sorted_rows[start:stop]
+
+    def _row_of_values(self) -> ndarray:
+        """Return the row of each value in indices."""
+
+        return repeat(arange(self.shape[0]), self.row_counts())
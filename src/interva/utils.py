@@ -9,16 +9,104 @@ output from InterVA5 (i.e., the out attribute).
 """
 
 from __future__ import annotations
-from typing import Union, TYPE_CHECKING
-from pandas import DataFrame, Index, Series, isna
-from numpy import append, argsort, delete, nanmax, where, zeros
+from typing import Tuple, Union, TYPE_CHECKING
+from pandas import Categorical, DataFrame, Index, Series, isna
+from numpy import (append, arange, argsort, array, asarray, cumsum,
+                   flatnonzero, float64, full, inf, isnan, maximum, ndarray,
+                   partition, sort, spacing, take_along_axis, unique, where,
+                   zeros)
 from decimal import Decimal
-from math import isclose
 
 from interva.exceptions import ArgumentException
+from interva.results import get_propensities
 if TYPE_CHECKING:
     import interva.interva5
 
+# values of the indicators that are taken as "yes" and "no" (missing values
+# are also taken as "no")
+YES = [1, "y", "Y", "yes", "Yes", "YES"]
+NO = [0, "n", "N", ".", "-", "no", "No", "NO"]
+# age indicators and the age groups they belong to
+AGE_INDICATORS = ["i022a", "i022b", "i022c", "i022d", "i022e", "i022f",
+                  "i022g"]
+AGE_GROUPS = ["adult", "adult", "adult", "child", "child", "child",
+              "neonate"]
+DETAILED_AGE_GROUPS = ["age 65+", "age 50-64", "age 15-49", "age 5-14",
+                       "age 1-4", "age 1-11m", "age 0-27d"]
+# categories of the age and sex columns of InterVA5.dem_group
+AGE_CATEGORIES = ["adult", "child", "neonate", "unknown"]
+DETAILED_AGE_CATEGORIES = DETAILED_AGE_GROUPS + ["unknown"]
+SEX_CATEGORIES = ["female", "male", "unknown"]
+
+
+def _get_dem_groups_frame(va_data: DataFrame,
+                          detailed: bool = False) -> DataFrame:
+    """Retrieve age and sex from all of the VA records at once (see
+    _get_dem_groups).
+
+    :param va_data: VA records (with the ID column and the sex and age
+    indicators)
+    :type va_data: pandas.DataFrame
+    :param detailed: return the detailed age groups
+    :type detailed: bool
+    :return: ID, age and sex (categorical columns) of each record
+    :rtype: pandas.DataFrame
+    """
+
+    if not isinstance(va_data, DataFrame):
+        raise ArgumentException(
+            "The parameter va_data must be a pandas.DataFrame")
+
+    if detailed:
+        va_age = _get_age_group_all_frame(va_data)
+    else:
+        va_age = _get_age_group_frame(va_data)
+    return DataFrame({"ID": va_data["ID"].to_numpy(),
+                      "age": va_age.array,
+                      "sex": _get_sex_group_frame(va_data).array})
+
+
+def _get_sex_group_frame(va_data: DataFrame) -> Series:
+    """Retrieve sex (male/female/unknown) from all of the VA records."""
+
+    male_yes = va_data["i019a"].isin(YES).to_numpy()
+    female_yes = va_data["i019b"].isin(YES).to_numpy()
+    male_no = (va_data["i019a"].isin(NO) | va_data["i019a"].isna()).to_numpy()
+    female_no = (va_data["i019b"].isin(NO) |
+                 va_data["i019b"].isna()).to_numpy()
+    codes = where(male_yes & female_no, 1,
+                  where(female_yes & male_no, 0, 2))
+    return Series(Categorical.from_codes(codes, SEX_CATEGORIES),
+                  index=va_data.index)
+
+
+def _get_age_group_frame(va_data: DataFrame) -> Series:
+    """Retrieve age group from all of the VA records."""
+
+    return _age_groups(va_data, AGE_GROUPS, AGE_CATEGORIES)
+
+
+def _get_age_group_all_frame(va_data: DataFrame) -> Series:
+    """Retrieve detailed age group from all of the VA records."""
+
+    return _age_groups(va_data, DETAILED_AGE_GROUPS, DETAILED_AGE_CATEGORIES)
+
+
+def _age_groups(va_data: DataFrame, groups: list, categories: list) -> Series:
+    """Return the group (in groups) of the only age indicator with a "yes"
+    value of each record, or "unknown" if there is not exactly one."""
+
+    columns = [x for x in AGE_INDICATORS if x in va_data.columns]
+    is_yes = va_data[columns].isin(YES).to_numpy()
+    group_codes = array([categories.index(groups[AGE_INDICATORS.index(x)])
+                         for x in columns] + [len(categories) - 1])
+    only_yes = is_yes.sum(axis=1) == 1
+    first_yes = full(va_data.shape[0], len(columns))
+    if len(columns) > 0:
+        first_yes[only_yes] = is_yes.argmax(axis=1)[only_yes]
+    return Series(Categorical.from_codes(group_codes[first_yes], categories),
+                  index=va_data.index)
+
 
 def _get_dem_groups(va_series: Series, detailed=False) -> dict:
     """Retrieve age and sex from the VA record."""
@@ -151,7 +239,8 @@ def csmf(iva5: interva.interva5.InterVA5,
 
     # if not isinstance(iva5, interva.interva5.InterVA5):
     #     raise ArgumentException(
-    #         "The argument for iva5 must be an instance of the InterVA5 class")
+    #         "The argument for iva5 must be an instance of the InterVA5 "
+    #         "class")
     if len(iva5.results) == 0:
         raise ArgumentException("No results (need to use run() method).")
     if age is not None:
@@ -165,33 +254,46 @@ def csmf(iva5: interva.interva5.InterVA5,
             raise ArgumentException(
                 "The sex parameter must be " + ", ".join(sex_groups))
 
-    va5_results = iva5.results["VA5"]
+    va5_results, prob, cause_names = get_propensities(iva5.results)
     if age is not None or sex is not None:
-        va5_results = _get_cod_with_dem(iva5)
+        # rows of the propensities for the records in each age/sex group
+        va5_rows = DataFrame({"row": arange(va5_results.shape[0])},
+                             index=Index(va5_results["ID"], name="ID"))
+        va5_rows = va5_rows.merge(iva5.dem_group, on="ID")
         if age is not None:
-            age_index = va5_results["age"] == age.lower()
-            va5_results = va5_results[age_index]
+            age_index = va5_rows["age"] == age.lower()
+            va5_rows = va5_rows[age_index]
         if sex is not None:
-            sex_index = va5_results["sex"] == sex.lower()
-            va5_results = va5_results[sex_index]
+            sex_index = va5_rows["sex"] == sex.lower()
+            va5_rows = va5_rows[sex_index]
+        prob = prob[va5_rows["row"].to_numpy()]
 
-    if va5_results.shape[0] == 0:
+    if prob.shape[0] == 0:
         raise ArgumentException("No VA results found.")
 
-    if va5_results.shape[1] != 15 and va5_results.shape[1] != 17:
+    n_columns = va5_results.shape[1] - ("WHOLEPROB" in va5_results.columns)
+    if n_columns != 14:
         raise ArgumentException(
             "Unexpected va5 format (need 15 columns).  The expected format is "
             "InterVA5.results['VA5']")
 
     if interva_rule:
-        dist_cod = _csmf_with_interva_rule(va5_results)
+        dist_cod = _csmf_with_interva_rule(prob, cause_names)
     else:
-        dist_cod = _csmf_without_interva_rule(va5_results, top_aggregate)
+        dist_cod = _csmf_without_interva_rule(prob, cause_names,
+                                              top_aggregate)
 
     if dist_cod is None:
         return None
 
-    dist_cod.sort_values(ascending=False, inplace=True)
+    return _top_csmf(dist_cod, top)
+
+
+def _top_csmf(dist_cod: Series, top: int) -> Series:
+    """Return the top causes of a CSMF (sorted), with the causes tied with
+    the last one and without the causes with a zero CSMF."""
+
+    dist_cod = dist_cod.sort_values(ascending=False)
 
     # show causes with top non-zero values
     show_top = 0
@@ -209,15 +311,104 @@ def csmf(iva5: interva.interva5.InterVA5,
     return top_csmf
 
 
+def stratified_csmf(iva5: interva.interva5.InterVA5,
+                    by: Union[str, Series, list] = ("age", "sex"),
+                    top: Union[int, None] = 10,
+                    interva_rule: bool = False,
+                    top_aggregate: Union[int, None] = None) -> DataFrame:
+    """Return the top causes in the cause-specific mortality fraction (CSMF)
+    of each group of records (e.g., each age and sex group), calculated in
+    one pass over the propensities.
+
+    :param iva5: instance of InterVA5 with results
+    :type iva5: interva.interva5.InterVA5
+    :param by: the variables that define the groups: names of columns of
+    iva5.dem_group ("age" or "sex"), "detailed_age" (the detailed age group
+    of each record, e.g., "age 15-49"), or pandas Series with
+    the record IDs as the index (e.g., the region of each record).  Records
+    with a missing value are grouped together.
+    :type by: str, pandas.Series, or a list of them
+    :param top: number of top causes in the CSMF of each group (see csmf()).
+    If None, all of the causes are included.
+    :type top: Union[int, None]
+    :param interva_rule: If True, only the top 3 causes reported
+    by InterVA are used in the calculation of the CSMF (see csmf()).
+    :type interva_rule: bool
+    :param top_aggregate: Integer indicating how many causes from the top need
+    to go into the summary (only used if interva_rule is False).
+    :type top_aggregate: Union[int, None]
+
+    :return: one row per group and cause, with the group variables, the
+    number of records in the group (n_records), the cause, and its CSMF.
+    :rtype: pandas.DataFrame
+    """
+
+    if len(iva5.results) == 0:
+        raise ArgumentException("No results (need to use run() method).")
+    if iva5.results["VA5"] is None:
+        raise ArgumentException("No VA results found.")
+    va5_results, prob, cause_names = get_propensities(iva5.results)
+    if isinstance(by, (str, Series)):
+        by = [by]
+    groups = {}
+    for variable in by:
+        if isinstance(variable, str):
+            if variable == "detailed_age":
+                # (kept out of dem_group, with the same rows)
+                groups[variable] = iva5._detailed_age.array
+                continue
+            if variable not in iva5.dem_group.columns:
+                raise ArgumentException(
+                    f"'{variable}' is not a column of dem_group (use a "
+                    "pandas.Series for other variables)")
+            # (the rows of dem_group and of the propensities are the same
+            # records)
+            groups[variable] = iva5.dem_group[variable].array
+        elif isinstance(variable, Series) and variable.name is not None:
+            groups[variable.name] = variable.reindex(
+                va5_results["ID"]).to_numpy()
+        else:
+            raise ArgumentException(
+                "The by parameter must include column names of dem_group or "
+                "named pandas.Series")
+    groups = DataFrame(groups)
+
+    cause_index, include_prob_ac = _cause_index(cause_names)
+    if top_aggregate is None:
+        top_aggregate = len(cause_index)
+    rows = []
+    group_rows = groups.groupby(list(groups.columns), observed=True,
+                                dropna=False).indices
+    for key, index in group_rows.items():
+        if not isinstance(key, tuple):
+            key = (key,)
+        dist, undetermined = _csmf_dist(prob[index], include_prob_ac,
+                                        interva_rule=interva_rule,
+                                        top_aggregate=top_aggregate)
+        dist_cod = _normalize_csmf(dist, undetermined, cause_names,
+                                   interva_rule)
+        if top is None:
+            dist_cod = dist_cod.sort_values(ascending=False)
+        else:
+            dist_cod = _top_csmf(dist_cod, top)
+        for cause, value in dist_cod.items():
+            rows.append(key + (len(index), cause, value))
+    return DataFrame(rows, columns=list(groups.columns) +
+                     ["n_records", "cause", "csmf"])
+
+
 def _csmf_without_interva_rule(
-        va5: DataFrame,
+        prob: ndarray,
+        cause_names: Index,
         top_aggregate: Union[bool, int] = None) -> Union[Series, None]:
     """Return top causes in cause-specific mortality fraction (CSMF) without
     applying the InterVA rule for only considering causes with propensities
     above a threshold.
 
-    :param va5: The out["VA5"] attribute from InterVA5
-    :type va5: pandas.DataFrame
+    :param prob: propensities of the causes (columns) for each record (rows)
+    :type prob: numpy.ndarray
+    :param cause_names: names of the causes
+    :type cause_names: pandas.Index
     :param top_aggregate: Integer indicating how many causes from the top need
     to go into the summary.  The rest of the propensities are assigned into
     the category "Undetermined".
@@ -228,104 +419,57 @@ def _csmf_without_interva_rule(
     :rtype: pandas.Series
     """
 
-    va = va5.copy()
-
-    # for future compatibility with non-standard input
-    cause_names = cause_index = []
-    for i in va.index:
-        if va.loc[i, "WHOLEPROB"] is not None:
-            cause_names = va.loc[i, "WHOLEPROB"].index
-            cause_index = [x for x in range(len(cause_names))]
-            break
-    include_prob_ac = False
-    # fix for removing the first 3 preg related death in standard input
-    if ("Not pregnant or recently delivered" in cause_names[0] and
-            "Pregnancy ended within 6 weeks of death" in cause_names[1] and
-            "Pregnant at death" in cause_names[2] and
-            "Culture" in cause_names[64] and
-            "Emergency" in cause_names[65] and
-            "Health" in cause_names[66] and
-            "Inevitable" in cause_names[67] and
-            "Knowledge" in cause_names[68] and
-            "Resources" in cause_names[69]):
-        del cause_index[64:70]
-        del cause_index[0:3]
-        cause_names = cause_names.delete([0, 1, 2, 64, 65, 66, 67, 68, 69])
-        include_prob_ac = True
+    cause_index, include_prob_ac = _cause_index(cause_names)
 
     # Check if there is a valid va object
-    if va.shape[0] < 1:
+    if prob.shape[0] < 1:
         print("No va5 object found")
         return None
 
-    # Initialize the population distribution
-    dist = None
-    for i in va.index:
-        if va.loc[i, "WHOLEPROB"] is not None:
-            dist = zeros(len(va.loc[i, "WHOLEPROB"]))
-            break
     if top_aggregate is None:
         top_aggregate = len(cause_index)
-    undetermined = 0
+    dist, undetermined = _csmf_dist(prob, include_prob_ac,
+                                    interva_rule=False,
+                                    top_aggregate=top_aggregate)
+    return _normalize_csmf(dist, undetermined, cause_names,
+                           interva_rule=False)
 
-    if dist is None:
-        print("No va probability found in input")
-        return None
 
-    # Pick not simply the top # causes,
-    # but the top # causes reported by InterVA5
-    for i in va.index:
-        whole_prob = va.loc[i, "WHOLEPROB"]
-        if whole_prob is None:
-            undetermined = undetermined + 1
-            continue
-        this_dist = whole_prob.copy()
-        this_dist = this_dist.to_numpy()
-        if include_prob_ac:
-            this_dist[0:3] = 0
-            this_dist[64:70] = 0
-        if sum(this_dist) == 0:
-            undetermined = undetermined + 1
-            continue
-        cutoff = this_dist[argsort(-this_dist)[top_aggregate - 1]]
-        undetermined = undetermined + sum(this_dist[this_dist < cutoff])
-        this_dist[this_dist < cutoff] = 0
-        if whole_prob is not None:
-            dist = dist + this_dist
-    if undetermined > 0:
-        dist_cod = append(dist[cause_index], undetermined)
-        dist_cod = dist_cod / sum(dist_cod)
-        cause_names = append(cause_names, "Undetermined")
-        dist_cod = Series(dist_cod, index=cause_names)
-    else:
-        dist_cod = dist[cause_index] / sum(dist[cause_index])
-        dist_cod = Series(dist_cod, index=cause_names)
-
-    return dist_cod
-
-
-def _csmf_with_interva_rule(va5: DataFrame) -> Series:
+def _csmf_with_interva_rule(prob: ndarray, cause_names: Index) -> Series:
     """Return top causes in cause-specific mortality fraction (CSMF) with
     applying the InterVA rule for only considering causes with propensities
     above a threshold.
 
-    :param va5: The out["VA5"] attribute from InterVA5
-    :type va5: pandas.DataFrame
+    :param prob: propensities of the causes (columns) for each record (rows)
+    :type prob: numpy.ndarray
+    :param cause_names: names of the causes
+    :type cause_names: pandas.Index
 
     :return: cause-specific mortality fractions (CSMF) with causes as the
     index.
     :rtype: pandas.Series
     """
 
-    va = va5.copy()
+    cause_index, include_prob_ac = _cause_index(cause_names)
+
+    # Check if there is a valid va object
+    if prob.shape[0] < 1:
+        print("No va5 object found")
+        return None
+    # Pick not simply the top # causes,
+    # but the top # causes reported by InterVA5
+    dist, undetermined = _csmf_dist(prob, include_prob_ac, interva_rule=True)
+    return _normalize_csmf(dist, undetermined, cause_names,
+                           interva_rule=True)
+
+
+def _cause_index(cause_names: Index) -> Tuple[list, bool]:
+    """Return the positions of the causes included in the CSMF and a
+    logical value indicating if the pregnancy status (first 3 causes) and
+    the circumstances of mortality (last 6 causes) are excluded."""
 
     # for future compatibility with non-standard input
-    cause_names = cause_index = []
-    for i in va.index:
-        if va.loc[i, "WHOLEPROB"] is not None:
-            cause_names = va.loc[i, "WHOLEPROB"].index
-            cause_index = [x for x in range(len(cause_names))]
-            break
+    cause_index = [x for x in range(len(cause_names))]
     include_prob_ac = False
 
     # fix for removing the first 3 preg related death in standard input
@@ -340,71 +484,28 @@ def _csmf_with_interva_rule(va5: DataFrame) -> Series:
             "Resources" in cause_names[69]):
         del cause_index[64:70]
         del cause_index[0:3]
-        cause_names = cause_names.delete([0, 1, 2, 64, 65, 66, 67, 68, 69])
         include_prob_ac = True
-
-    # Check if there is a valid va object
-    if va.shape[0] < 1:
-        print("No va5 object found")
-        return None
-    # Initialize the population distribution
-    dist = None
-    for i in va.index:
-        if va.loc[i, "WHOLEPROB"] is not None:
-            dist = zeros(len(va.loc[i, "WHOLEPROB"]))
-            # TODO: this has been changed (to fix bug) in interva5.py
-            break
-    undetermined = 0
-
-    # Pick not simply the top # causes,
-    # but the top # causes reported by InterVA5
-    for i in va.index:
-        whole_prob = va.loc[i, "WHOLEPROB"]
-        if whole_prob is None:
-            continue
-        this_dist = whole_prob.copy()
-        this_dist = this_dist.to_numpy()
-        if include_prob_ac:
-            this_dist[0:3] = 0
-            this_dist[64:70] = 0
-        if max(this_dist) < 0.4:
-            if isclose(sum(this_dist), 0):
-                this_undetermined = 1
-            else:
-                this_undetermined = sum(this_dist)
-            undetermined = undetermined + this_undetermined
+    return cause_index, include_prob_ac
+
+
+def _normalize_csmf(dist: ndarray, undetermined: float, cause_names: Index,
+                    interva_rule: bool) -> Series:
+    """Return the CSMF (with the causes as the index) from the population
+    distribution and the undetermined propensity returned by _csmf_dist()."""
+
+    cause_index, _ = _cause_index(cause_names)
+    cause_names = cause_names[cause_index]
+    if not interva_rule:
+        if undetermined > 0:
+            dist_cod = append(dist[cause_index], undetermined)
+            dist_cod = dist_cod / sum(dist_cod)
+            cause_names = append(cause_names, "Undetermined")
+            dist_cod = Series(dist_cod, index=cause_names)
         else:
-            cutoff_3 = Decimal(this_dist[argsort(-this_dist)][2])
-            cutoff_2 = Decimal(this_dist[argsort(-this_dist)][1])
-            cutoff_1 = Decimal(this_dist[argsort(-this_dist)][0])
-            cutoff_1_halved = cutoff_1 / Decimal('2')
-            cutoff_pt1 = cutoff_3.max(cutoff_1_halved)
-            cutoff_pt2 = cutoff_2.max(cutoff_1_halved)
-            cutoff = cutoff_pt1.min(cutoff_pt2)
-            adj_cutoff = cutoff - Decimal(1e-15)
-
-            undetermined = undetermined + sum(
-                this_dist[where(this_dist < adj_cutoff)[0]])
-            this_dist[where(this_dist < adj_cutoff)[0]] = 0
-
-            temp_len = len(this_dist[where(this_dist > 0)[0]])
-            close_indices = []
-            for j in range(temp_len):
-                val = Decimal(
-                    this_dist[where(this_dist > 0)[0]][j]) - cutoff
-                if abs(val) < 4e-29:
-                    close_indices.append(where(this_dist > 0)[0][j])
-
-            close_indices.sort(reverse=True)
-            for k in close_indices:
-                undetermined = undetermined + this_dist[k]
-                this_dist[k] = 0
-
-            if whole_prob is not None:
-                if i == 0:
-                    dist = this_dist
-                else:
-                    dist = dist + this_dist
+            dist_cod = dist[cause_index] / sum(dist[cause_index])
+            dist_cod = Series(dist_cod, index=cause_names)
+        return dist_cod
+
     dist = Series(dist)
     # Normalize the probability for CODs
     if undetermined > 0:
@@ -422,6 +523,145 @@ def _csmf_with_interva_rule(va5: DataFrame) -> Series:
     return dist_cod
 
 
+def _csmf_dist(
+        prob: ndarray,
+        include_prob_ac: bool,
+        interva_rule: bool = True,
+        top_aggregate: Union[int, None] = None) -> Tuple[ndarray, float]:
+    """Return the (unnormalized) population distribution of the causes and
+    the total propensity assigned to "Undetermined", for the records in the
+    rows of prob.
+
+    With the InterVA rule, only the causes reported by InterVA5 are kept for
+    each record (those within 1e-15 of the cutoff, max(third largest
+    propensity, half of the largest), are moved to "Undetermined" together
+    with the propensities below it), and a record whose largest propensity
+    is below 0.4 is undetermined.  Otherwise, the top_aggregate largest
+    propensities of each record are kept.  The sums are accumulated in the
+    same order as the original record-by-record loop, so the results are
+    identical to it.
+
+    :param prob: propensities of the causes (columns) for each record (rows)
+    :type prob: numpy.ndarray
+    :param include_prob_ac: if True, the pregnancy status (first 3 columns)
+    and circumstances of mortality (last 6 columns) are excluded.
+    :type include_prob_ac: bool
+    :param interva_rule: apply the InterVA rule.
+    :type interva_rule: bool
+    :param top_aggregate: number of top causes kept for each record (only
+    used if interva_rule is False).
+    :type top_aggregate: int
+    :return: the population distribution and the undetermined propensity
+    :rtype: tuple
+    """
+
+    this_dist = array(prob, dtype=float64)
+    if include_prob_ac:
+        this_dist[:, 0:3] = 0
+        this_dist[:, 64:70] = 0
+    n_records, n_causes = this_dist.shape
+    # amounts added to undetermined by each record (in order)
+    undetermined_parts = zeros((n_records, 1))
+    if n_records == 0 or n_causes == 0:
+        return zeros(n_causes), 0
+    if interva_rule:
+        determined = flatnonzero(this_dist.max(axis=1) >= 0.4)
+        undetermined_rows = flatnonzero(this_dist.max(axis=1) < 0.4)
+        row_sum = cumsum(this_dist[undetermined_rows], axis=1)[:, -1]
+        undetermined_parts[undetermined_rows, 0] = where(row_sum == 0, 1,
+                                                         row_sum)
+        this_dist[undetermined_rows] = 0
+        rows = this_dist[determined]
+        top3 = sort(partition(rows, n_causes - 3, axis=1)[:, -3:], axis=1)
+        cutoff = maximum(top3[:, 0], top3[:, 2] / 2)
+        adj_cutoff = cutoff - 1e-15
+        # Records with propensities so close to the adjusted cutoff that the
+        # comparison depends on the Decimal rounding are handled one by one
+        tol = 4 * spacing(cutoff)
+        exact = (abs(rows - adj_cutoff[:, None]) <= tol[:, None]).any(axis=1)
+        below = rows < adj_cutoff[:, None]
+        undetermined_parts[determined, 0] = cumsum(
+            where(below, rows, 0), axis=1)[:, -1]
+        rows[below] = 0
+        # The Decimal cutoff is rounded to the context precision, so the
+        # propensities equal to it are only dropped if the rounding error
+        # is below 4e-29
+        cutoff_values, cutoff_inverse = unique(cutoff, return_inverse=True)
+        drop_equal = array([abs(Decimal(x) - (+Decimal(x))) < 4e-29
+                            for x in cutoff_values], dtype=bool)
+        close = ((rows == cutoff[:, None]) &
+                 drop_equal[cutoff_inverse][:, None])
+        n_close = close.sum(axis=1)
+        rows[close] = 0
+        exact_parts = {}
+        for i in flatnonzero(exact):
+            rows[i], exact_parts[i] = _interva_rule_one(
+                this_dist[determined[i]])
+            n_close[i] = len(exact_parts[i]) - 1
+        n_parts = 1 + n_close.max(initial=0)
+        undetermined_parts = append(
+            undetermined_parts, zeros((n_records, n_parts - 1)), axis=1)
+        undetermined_parts[determined, 1:] = where(
+            arange(n_parts - 1)[None, :] < n_close[:, None],
+            cutoff[:, None], 0)
+        for i, parts in exact_parts.items():
+            undetermined_parts[determined[i]] = 0
+            undetermined_parts[determined[i], 0:len(parts)] = parts
+        this_dist[determined] = rows
+    else:
+        row_sum = cumsum(this_dist, axis=1)[:, -1]
+        empty = flatnonzero(row_sum == 0)
+        nonempty = flatnonzero(row_sum != 0)
+        undetermined_parts[empty, 0] = 1
+        this_dist[empty] = 0
+        rows = this_dist[nonempty]
+        # (top_aggregate)th largest propensity of each record
+        kth = arange(n_causes)[::-1][top_aggregate - 1]
+        cutoff = partition(rows, kth, axis=1)[:, kth]
+        below = rows < cutoff[:, None]
+        undetermined_parts[nonempty, 0] = cumsum(
+            where(below, rows, 0), axis=1)[:, -1]
+        rows[below] = 0
+        this_dist[nonempty] = rows
+    # (sum over axis 0 adds the records one at a time, like the
+    # original loop, and cumsum adds the parts sequentially)
+    dist = this_dist.sum(axis=0)
+    undetermined = cumsum(undetermined_parts.ravel())[-1]
+    return dist, undetermined
+
+
+def _interva_rule_one(this_dist: ndarray) -> Tuple[ndarray, list]:
+    """Apply the InterVA rule to the propensities of one record (with the
+    largest one at least 0.4), using the Decimal arithmetic of the original
+    implementation.  Returns the propensities that are kept and the amounts
+    added to undetermined (in order)."""
+
+    this_dist = this_dist.copy()
+    cutoff_3 = Decimal(this_dist[argsort(-this_dist)][2])
+    cutoff_2 = Decimal(this_dist[argsort(-this_dist)][1])
+    cutoff_1 = Decimal(this_dist[argsort(-this_dist)][0])
+    cutoff_1_halved = cutoff_1 / Decimal('2')
+    cutoff_pt1 = cutoff_3.max(cutoff_1_halved)
+    cutoff_pt2 = cutoff_2.max(cutoff_1_halved)
+    cutoff = cutoff_pt1.min(cutoff_pt2)
+    adj_cutoff = cutoff - Decimal(1e-15)
+
+    parts = [sum(this_dist[where(this_dist < adj_cutoff)[0]])]
+    this_dist[where(this_dist < adj_cutoff)[0]] = 0
+
+    close_indices = []
+    for j in where(this_dist > 0)[0]:
+        val = Decimal(this_dist[j]) - cutoff
+        if abs(val) < 4e-29:
+            close_indices.append(j)
+
+    close_indices.sort(reverse=True)
+    for k in close_indices:
+        parts.append(this_dist[k])
+        this_dist[k] = 0
+    return this_dist, parts
+
+
 def _get_cod_with_dem(iva5: interva.interva5.InterVA5) -> DataFrame:
     """Return VA results with demographics (age/sex) attached.
 
@@ -471,50 +711,54 @@ def get_indiv_cod(iva5: interva.interva5.InterVA5,
         cod = iva5.get_indiv_prob(top=top,
                                   include_propensities=include_propensities)
         return cod
-    else:
-        VA5 = iva5.results["VA5"].copy()
-        num_indiv = VA5.shape[0]
-        cod_list = [[] for _ in range(num_indiv)]
-        column_names = []
-        if top == 0 or top is None:
-            column_names = VA5.loc[0, "WHOLEPROB"].iloc[3:64].index
-        else:
-            for i in range(top):
-                name = "CAUSE" + str(i+1)
-                column_names.append(name)
-                if include_propensities:
-                    prob = "PROPENSITY" + str(i+1) + ""
-                    column_names.append(prob)
-
-        for indiv in range(num_indiv):
-            wholeprob = VA5.loc[indiv, "WHOLEPROB"]
-            prob_B = wholeprob.iloc[3:64].copy()
-
-            if top == 0 or top is None:
-                cod_list[indiv] = prob_B
-            if top > 0:
-                prob_temp = prob_B.to_numpy()
-                prob_temp_names = prob_B.index
-                for cause_num in range(top):
-                    if cause_num == 0:
-                        max_loc = where(prob_temp == nanmax(prob_temp))[0][0]
-                        cause = cod_list[indiv] = [prob_temp_names[max_loc]]
-                        if include_propensities:
-                            if cause == " ":
-                                cod_list[indiv].append(" ")
-                            else:
-                                cod_list[indiv].append(nanmax(prob_temp))
-                                prob_temp = delete(prob_temp, max_loc)
-                    if cause_num > 0:
-                        max_loc = where(prob_temp == nanmax(prob_temp))[0][0]
-                        cause = prob_temp_names[max_loc]
-                        cod_list[indiv].append(cause)
-                        if include_propensities:
-                            if cause == " ":
-                                cod_list[indiv].append(" ")
-                            else:
-                                cod_list[indiv].append(nanmax(prob_temp))
-                        prob_temp = delete(prob_temp, max_loc)
-        cod_df = DataFrame(cod_list, columns=column_names)
-        cod_df.insert(loc=0, column="ID", value=iva5.results["ID"])
+    _, propensities, cause_names = get_propensities(iva5.results)
+    return _indiv_cod(propensities, cause_names, iva5.results["ID"], top=top,
+                      include_propensities=include_propensities,
+                      interva_rule=False)
+
+
+def _indiv_cod(propensities: ndarray, cause_names: Index, ids,
+               top: Union[int, None] = 0,
+               include_propensities: bool = False,
+               interva_rule: bool = True) -> DataFrame:
+    """Return the individual causes of death of the records (rows) of a
+    propensity matrix (see InterVA5.get_indiv_prob and get_indiv_cod).
+
+    The top causes of all records are found at once by sorting each row of
+    the propensities of the 61 causes (3:64) in decreasing order (missing
+    propensities last, and ties in the order of the causes).  With
+    interva_rule, the causes after the first one with a propensity below
+    half of the largest propensity of the record are left blank (" ").
+    """
+
+    prob = propensities[:, 3:64]
+    names = cause_names[3:64]
+    if top == 0 or top is None:
+        cod_df = DataFrame(prob, columns=names)
+        cod_df.insert(loc=0, column="ID", value=asarray(ids))
         return cod_df
+    if top > len(names):
+        raise ArgumentException(
+            f"top must be at most the number of causes ({len(names)})")
+
+    sort_prob = where(isnan(prob), -inf, prob)
+    order = argsort(-sort_prob, axis=1, kind="stable")[:, :top]
+    top_prob = take_along_axis(sort_prob, order, axis=1)
+    top_names = names.to_numpy(dtype=object)[order]
+    if interva_rule:
+        blank = top_prob < 0.5 * top_prob[:, :1]
+        blank[:, 0] = False
+    else:
+        blank = zeros(top_prob.shape, dtype=bool)
+
+    columns = {}
+    for i in range(top):
+        columns["CAUSE" + str(i+1)] = where(blank[:, i], " ", top_names[:, i])
+        if include_propensities:
+            values = take_along_axis(prob, order[:, i:i+1], axis=1)[:, 0]
+            if blank[:, i].any():
+                values = where(blank[:, i], " ", values.astype(object))
+            columns["PROPENSITY" + str(i+1)] = values
+    cod_df = DataFrame(columns, index=range(prob.shape[0]))
+    cod_df.insert(loc=0, column="ID", value=asarray(ids))
+    return cod_df
@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+
+"""
+interva.writers
+-------------------
+
+This module contains the writers used by InterVA5.run() to save the results
+of the VA records (as CSV or Parquet files) as they are assigned.
+"""
+
+from __future__ import annotations
+from typing import Union
+from csv import writer
+from os import path
+from numpy import array, concatenate, float64, ndarray
+from pandas import DataFrame, read_csv
+
+# columns of the VA5 results (without the propensities)
+RESULT_COLUMNS = ["ID", "MALPREV", "HIVPREV", "PREGSTAT", "PREGLIK",
+                  "CAUSE1", "LIK1", "CAUSE2", "LIK2", "CAUSE3", "LIK3",
+                  "INDET", "COMCAT", "COMNUM"]
+# result columns holding integers (" " if there is no value)
+INTEGER_COLUMNS = ["PREGLIK", "LIK1", "LIK2", "LIK3", "INDET", "COMNUM"]
+# suffix of the file listing the IDs of the processed records (see IDIndex)
+ID_INDEX_SUFFIX = "_ids.txt"
+
+
+class CSVWriter:
+    """Write the VA5 results to a CSV file.  The file is kept open while the
+    records are processed and the rows are written in batches.
+
+    :param filename: path of the CSV file
+    :type filename: str
+    :param output: "classic" (without the propensities) or "extended" (with
+    the propensities of all causes)
+    :type output: str
+    :param cause_names: names of the causes (the column names of the
+    propensities)
+    :type cause_names: list
+    :param append: if True, the rows are appended to the file (without a
+    header), otherwise the file is overwritten.
+    :type append: bool
+    :param buffer_size: number of records collected before they are written
+    to the file
+    :type buffer_size: int
+    """
+
+    def __init__(self, filename: str, output: str, cause_names: list,
+                 append: bool = False, buffer_size: int = 1000):
+
+        self.output = output
+        self.buffer_size = max(1, buffer_size)
+        self._rows = []
+        self._prob = []
+        self._file = open(filename, "a" if append else "w", newline="")
+        self._writer = writer(self._file)
+        if not append:
+            header = list(RESULT_COLUMNS)
+            if output == "extended":
+                header = header + list(cause_names)
+            self._writer.writerow(header)
+            self._file.flush()
+
+    def __enter__(self) -> CSVWriter:
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def write(self, row: list, prob: Union[ndarray, None] = None) -> None:
+        """Add the result of one record (and its propensities, for the
+        extended output)."""
+
+        if self.output not in ["classic", "extended"]:
+            return
+        self._rows.append(row)
+        self._prob.append(prob)
+        if len(self._rows) >= self.buffer_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write the buffered rows to the file."""
+
+        if len(self._rows) == 0:
+            return
+        if self.output == "extended":
+            # the rows are written as strings (as numpy formats them)
+            rows = concatenate((array(self._rows), array(self._prob)),
+                               axis=1)
+        else:
+            rows = self._rows
+        self._writer.writerows(rows)
+        self._file.flush()
+        self._rows = []
+        self._prob = []
+
+    def close(self) -> None:
+        """Write the remaining rows and close the file."""
+
+        if self._file.closed:
+            return
+        self.flush()
+        self._file.close()
+
+
+class ParquetWriter:
+    """Write the VA5 results to a Parquet file, with the result columns as
+    strings or integers (missing values, written as " " in the CSV output,
+    are null) and the propensities of the causes as float64 columns.  The
+    rows are written as a new row group each time the buffer is flushed.
+    This requires the pyarrow package.
+
+    :param filename: path of the Parquet file
+    :type filename: str
+    :param cause_names: names of the causes (the column names of the
+    propensities)
+    :type cause_names: list
+    :param buffer_size: number of records collected before they are written
+    to the file
+    :type buffer_size: int
+    """
+
+    def __init__(self, filename: str, cause_names: list,
+                 buffer_size: int = 1000):
+
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("The parquet output requires the pyarrow "
+                              "package (pip install pyarrow).")
+        self._pa = pyarrow
+        self.buffer_size = max(1, buffer_size)
+        self._rows = []
+        self._prob = []
+        fields = []
+        for column in RESULT_COLUMNS:
+            if column in INTEGER_COLUMNS:
+                fields.append(pyarrow.field(column, pyarrow.int64()))
+            else:
+                fields.append(pyarrow.field(column, pyarrow.string()))
+        for name in cause_names:
+            fields.append(pyarrow.field(name, pyarrow.float64()))
+        self.schema = pyarrow.schema(fields)
+        self._writer = pyarrow.parquet.ParquetWriter(filename, self.schema)
+
+    def __enter__(self) -> ParquetWriter:
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def write(self, row: list, prob: ndarray) -> None:
+        """Add the result and the propensities of one record."""
+
+        self._rows.append(row)
+        self._prob.append(prob)
+        if len(self._rows) >= self.buffer_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write the buffered rows to the file as a row group."""
+
+        if len(self._rows) == 0:
+            return
+        columns = []
+        for j, column in enumerate(RESULT_COLUMNS):
+            values = [x[j] for x in self._rows]
+            if column in INTEGER_COLUMNS:
+                values = [None if x == " " else int(x) for x in values]
+            else:
+                values = [str(x) for x in values]
+            columns.append(self._pa.array(values,
+                                          type=self.schema.field(j).type))
+        prob = array(self._prob, dtype=float64).reshape(
+            len(self._rows), len(self.schema) - len(RESULT_COLUMNS))
+        for j in range(prob.shape[1]):
+            columns.append(self._pa.array(prob[:, j]))
+        self._writer.write_table(
+            self._pa.Table.from_arrays(columns, schema=self.schema))
+        self._rows = []
+        self._prob = []
+
+    def close(self) -> None:
+        """Write the remaining rows and close the file."""
+
+        if self._writer is None:
+            return
+        self.flush()
+        self._writer.close()
+        self._writer = None
+
+
+class IDIndex:
+    """IDs of the VA records that have already been processed into a CSV
+    output file, used to process only the new records of an input.  The IDs
+    are kept in a sidecar file (filename + ID_INDEX_SUFFIX, one ID per
+    line), which also lists the records that were excluded by the data
+    checks (and are not in the output).  If the sidecar file does not exist,
+    the IDs are read from the ID column of the output file (if it exists).
+
+    :param filename: path of the output file (without the .csv extension)
+    :type filename: str
+    """
+
+    def __init__(self, filename: str):
+
+        self.path = filename + ID_INDEX_SUFFIX
+        self.ids = set()
+        # IDs of the new records of each chunk, in order, until they are saved
+        self.new_ids = []
+        self._has_index = path.isfile(self.path)
+        if self._has_index:
+            with open(self.path, encoding="utf-8") as f:
+                self.ids = set(line.rstrip("\n") for line in f)
+        elif path.isfile(filename + ".csv"):
+            output_ids = read_csv(filename + ".csv", usecols=["ID"],
+                                  dtype=str, keep_default_na=False)
+            self.ids = set(output_ids["ID"])
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, va_id) -> bool:
+        return str(va_id) in self.ids
+
+    def new_records(self, va_chunk: DataFrame) -> DataFrame:
+        """Return the records of a chunk whose IDs (in the first column) are
+        not in the index, and remember their IDs (see save()).  Chunks without
+        new records are not remembered."""
+
+        va_ids = va_chunk.iloc[:, 0].astype(str)
+        is_new = ~va_ids.isin(self.ids).to_numpy()
+        if is_new.any():
+            self.new_ids.append(va_ids[is_new].tolist())
+        return va_chunk[is_new]
+
+    def save(self, n_chunks: Union[int, None] = None) -> None:
+        """Add the IDs of the new records to the sidecar file (which is
+        created with all of the IDs if it does not exist).
+
+        :param n_chunks: number of chunks (returned by new_records(), oldest
+        first) whose IDs are saved, e.g., 1 after the results of each chunk
+        are written.  If None, the IDs of all of the chunks are saved.
+        :type n_chunks: Union[int, None]
+        """
+
+        if n_chunks is None:
+            n_chunks = len(self.new_ids)
+        saved = [va_id for chunk_ids in self.new_ids[:n_chunks]
+                 for va_id in chunk_ids]
+        with open(self.path, "a" if self._has_index else "w",
+                  encoding="utf-8") as f:
+            if not self._has_index:
+                for va_id in self.ids:
+                    f.write(va_id + "\n")
+            for va_id in saved:
+                f.write(va_id + "\n")
+        self.ids.update(saved)
+        del self.new_ids[:n_chunks]
+        self._has_index = True
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+
+import json
+from os import path
+
+import pytest
+
+from interva.metrics import STAGES
+
+BENCHMARKS = path.join(path.dirname(path.dirname(path.abspath(__file__))),
+                       "benchmarks")
+
+
+@pytest.fixture
+def run_benchmarks(monkeypatch):
+    # (the cohorts are run in new processes, which import the script by name)
+    monkeypatch.syspath_prepend(BENCHMARKS)
+    import run_benchmarks
+    return run_benchmarks
+
+
+def test_benchmarks_smoke(run_benchmarks, tmp_path):
+    baseline = str(tmp_path / "baseline.json")
+    assert run_benchmarks.main(["--sizes", "20", "--baseline", baseline,
+                                "--save"]) == 0
+    with open(baseline) as f:
+        saved = json.load(f)
+    stages = saved["results"]["20"]["stages"]
+    assert list(stages)[:len(STAGES)] == STAGES
+    assert all(stage["seconds"] >= 0 for stage in stages.values())
+    # compared with the saved baseline (no drop in throughput is too large)
+    assert run_benchmarks.main(["--sizes", "20", "--baseline", baseline,
+                                "--threshold", "1"]) == 0
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+
+import pickle
+from numpy import array, array_equal, int8, nan
+
+from interva.cache import DatacheckCache, make_entry
+from interva.preprocessing import MISSING
+
+
+def _entry(value):
+    return make_entry(array([value, nan, 0.0]), ["first"], [])
+
+
+def test_make_entry():
+    codes, first_pass, second_pass = _entry(1.0)
+    assert codes.dtype == int8
+    assert codes.tolist() == [1, MISSING, 0]
+    assert first_pass == ["first"]
+    assert second_pass == []
+
+
+def test_key():
+    codes = array([1, 0, MISSING], dtype=int8)
+    key = DatacheckCache.key("pb", "a", codes)
+    assert key == DatacheckCache.key("pb", "a", codes.copy())
+    assert key != DatacheckCache.key("pb", "b", codes)
+    assert key != DatacheckCache.key("other", "a", codes)
+    assert key != DatacheckCache.key("pb", "a", array([1, 1, MISSING]))
+
+
+def test_get_and_put():
+    cache = DatacheckCache()
+    assert cache.get(b"a") is None
+    cache.put(b"a", _entry(1.0))
+    assert array_equal(cache.get(b"a")[0], _entry(1.0)[0])
+    assert (cache.hits, cache.misses) == (1, 1)
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_eviction():
+    cache = DatacheckCache(max_records=2)
+    cache.update({b"a": _entry(1.0), b"b": _entry(0.0)})
+    # a is used more recently than b
+    cache.get(b"a")
+    cache.put(b"c", _entry(1.0))
+    assert len(cache) == 2
+    assert cache.get(b"b") is None
+    assert cache.get(b"a") is not None
+    assert cache.get(b"c") is not None
+
+
+def test_save_and_load(tmp_path):
+    cache_path = str(tmp_path / "cache.pkl")
+    cache = DatacheckCache(path=cache_path)
+    assert len(cache) == 0
+    cache.update({b"a": _entry(1.0), b"b": _entry(0.0)})
+    cache.save()
+    loaded = DatacheckCache(path=cache_path)
+    assert len(loaded) == 2
+    assert loaded.get(b"b")[0].tolist() == [0, MISSING, 0]
+    assert len(DatacheckCache(max_records=1, path=cache_path)) == 1
+
+
+def test_pickle():
+    cache = DatacheckCache()
+    cache.put(b"a", _entry(1.0))
+    copied = pickle.loads(pickle.dumps(cache))
+    assert copied.get(b"a") is not None
+    copied.put(b"b", _entry(0.0))
+    assert len(cache) == 1
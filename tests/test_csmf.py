@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+from numpy import allclose
+
+from interva.csmf import CSMFAccumulator
+from interva.exceptions import ArgumentException
+from interva.interva5 import InterVA5, get_example_input
+from interva.utils import csmf
+
+va_data = get_example_input()
+iv5out = InterVA5(va_data, hiv="h", malaria="l", write=False, verbose=False)
+iv5out.run()
+prob = iv5out.results["propensities"]
+cause_names = iv5out.results["cause_names"]
+dem_group = iv5out.dem_group
+
+
+def assert_same_csmf(accumulated, expected):
+    assert list(accumulated.index) == list(expected.index)
+    assert allclose(accumulated.to_numpy(), expected.to_numpy(),
+                    rtol=1e-12, atol=1e-15)
+
+
+@pytest.mark.parametrize("interva_rule, top_aggregate",
+                         [(True, None), (False, None), (False, 3)])
+def test_accumulator_matches_csmf(interva_rule, top_aggregate):
+    accumulator = CSMFAccumulator(cause_names, interva_rule=interva_rule,
+                                  top_aggregate=top_aggregate)
+    accumulator.add_results(iv5out)
+    assert accumulator.n_records == prob.shape[0]
+    for age, sex in [(None, None), ("adult", None), (None, "female"),
+                     ("adult", "male")]:
+        expected = csmf(iv5out, top=10, interva_rule=interva_rule,
+                        top_aggregate=top_aggregate, age=age, sex=sex)
+        assert_same_csmf(accumulator.csmf(top=10, age=age, sex=sex),
+                         expected)
+
+
+def test_accumulator_one_record_at_a_time():
+    accumulator = CSMFAccumulator(cause_names)
+    for i in range(prob.shape[0]):
+        accumulator.update(prob[i], dem_group.iloc[i].to_dict())
+    assert accumulator.n_records == prob.shape[0]
+    assert_same_csmf(accumulator.csmf(top=10, age="adult"),
+                     csmf(iv5out, top=10, interva_rule=True, age="adult"))
+
+
+def test_accumulator_merge():
+    accumulator = CSMFAccumulator(cause_names)
+    for start in range(0, prob.shape[0], 60):
+        partial = CSMFAccumulator(cause_names)
+        partial.update(prob[start:(start + 60)],
+                       dem_group.iloc[start:(start + 60)])
+        accumulator.merge(partial)
+    assert accumulator.n_records == prob.shape[0]
+    assert set(accumulator.groups) == set(
+        zip(dem_group["age"], dem_group["sex"]))
+    assert_same_csmf(accumulator.csmf(sex="male"),
+                     csmf(iv5out, interva_rule=True, sex="male"))
+    with pytest.raises(ArgumentException):
+        accumulator.merge(CSMFAccumulator(cause_names, interva_rule=False))
+
+
+def test_accumulator_without_dem_group():
+    accumulator = CSMFAccumulator(cause_names)
+    accumulator.update(prob)
+    assert_same_csmf(accumulator.csmf(),
+                     csmf(iv5out, interva_rule=True))
+    with pytest.raises(ArgumentException):
+        accumulator.csmf(age="adult")
+
+
+def test_accumulator_invalid_input():
+    accumulator = CSMFAccumulator(cause_names)
+    with pytest.raises(ArgumentException):
+        accumulator.csmf()
+    with pytest.raises(ArgumentException):
+        accumulator.update(prob[:, 0:10])
+    with pytest.raises(ArgumentException):
+        accumulator.update(prob, dem_group.iloc[0:10])
@@ -1,13 +1,24 @@
 # -*- coding: utf-8 -*-
 
+import asyncio
 import pytest
-from pandas import read_csv, DataFrame, Series
+from numpy import isnan
+from pandas import (concat, get_option, read_csv, read_parquet, DataFrame,
+                    Series)
 from pkgutil import get_data
-from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO, StringIO
+from logging import getLogger
+from os import getcwd
 from os.path import isfile
+from time import perf_counter
 
+from interva.cache import DatacheckCache
 from interva.interva5 import InterVA5
 from interva.interva5 import get_probbase
+from interva.exceptions import ArgumentException
+from interva.metrics import STAGES
+from interva.preprocessing import recode, to_object
 
 
 @pytest.fixture
@@ -114,7 +125,8 @@ def test_run_correct_VA5_output(example_va_data, example_va_ids):
     comcat_valid_values = [x for x in iv5out.causetextV5.iloc[64:70, 0]]
     comcat_valid_values.append("Multiple")
     assert (va5_output.loc[:, "COMCAT"].isin(comcat_valid_values)).all()
-    assert (va5_output.loc[0, "WHOLEPROB"].index == iv5out.causetextV5.iloc[:, 0]).all()
+    assert (va5_output.loc[0, "WHOLEPROB"].index ==
+            iv5out.causetextV5.iloc[:, 0]).all()
 
 
 def test_run_correct_malaria_output(example_va_data):
@@ -152,6 +164,7 @@ def test_run_correct_checked_data_output_if_true_return(example_va_data):
     checked_data_output = iv5out.results["checked_data"]
     assert isinstance(checked_data_output, DataFrame)
     assert (checked_data_output.columns == va_data.columns).all()
+    assert (checked_data_output["ID"] == va_data["ID"]).all()
 
 
 def test_run_correct_checked_data_output_if_false_return(example_va_data):
@@ -238,7 +251,8 @@ def test_get_csmf_shape(example_va_data):
     assert csmf.shape[0] == 5   # top 5 causes = 5 rows
 
 
-def test_write_csmf(example_va_data):
+def test_write_csmf(example_va_data, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
     va_data = example_va_data
     iv5out = InterVA5(va_data, hiv="h", malaria="l", write=False,
                       directory=".", output="extended")
@@ -278,7 +292,8 @@ def test_get_indiv_prob_top_5(example_va_data):
     assert indiv_prob.shape[1] == 5*2 + 1
 
 
-def test_write_indiv_prob_top_5(example_va_data):
+def test_write_indiv_prob_top_5(example_va_data, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
     va_data = example_va_data
     iv5out = InterVA5(va_data, hiv="h", malaria="l", write=False,
                       directory=".", output="extended")
@@ -291,3 +306,639 @@ def test_write_indiv_prob_top_5(example_va_data):
         rowcount = rowcount + 1
     # account for column headers
     assert rowcount == len(iv5out.results["ID"]) + 1
+
+
+def test_get_indiv_prob_top_causes_match_propensities(example_va_data):
+    iv5out = InterVA5(example_va_data, hiv="h", malaria="l", write=False)
+    iv5out.run()
+    all_prob = iv5out.get_indiv_prob(top=0)
+    indiv_prob = iv5out.get_indiv_prob(top=5, include_propensities=True)
+    for i in range(indiv_prob.shape[0]):
+        record_prob = all_prob.iloc[i, 1:]
+        assert indiv_prob.loc[i, "PROPENSITY1"] == record_prob.max()
+        previous = record_prob.max()
+        for k in range(1, 6):
+            cause = indiv_prob.loc[i, f"CAUSE{k}"]
+            value = indiv_prob.loc[i, f"PROPENSITY{k}"]
+            if cause == " ":
+                assert value == " "
+                continue
+            # each cause is reported with its own propensity, in decreasing
+            # order, and only if it is at least half of the top one
+            assert record_prob[cause] == value
+            assert value <= previous
+            assert value >= 0.5 * record_prob.max()
+            previous = value
+
+
+def test_write_indiv_prob_in_blocks(example_va_data, tmp_path, monkeypatch):
+    iv5out = InterVA5(example_va_data, hiv="h", malaria="l", write=False)
+    iv5out.run()
+    monkeypatch.setattr("interva.interva5.INDIV_PROB_BLOCK", 7)
+    iv5out.write_indiv_prob(top=3, include_propensities=True,
+                            filename=str(tmp_path / "indiv_prob"))
+    written = read_csv(tmp_path / "indiv_prob.csv")
+    expected = iv5out.get_indiv_prob(top=3, include_propensities=True)
+    expected.to_csv(tmp_path / "expected.csv", index=False)
+    assert written.equals(read_csv(tmp_path / "expected.csv"))
+
+
+# chunked processing tests
+def _run_and_read(va_input, directory, chunksize):
+    iv5out = InterVA5(va_input, hiv="h", malaria="l", write=True,
+                      directory=str(directory), output="extended",
+                      return_checked_data=True, chunksize=chunksize)
+    iv5out.run()
+    with open(directory / "VA5_result.csv") as f:
+        csv_output = f.read()
+    with open(directory / "errorlogV5.txt") as f:
+        log_output = f.readlines()[1:]
+    return iv5out, csv_output, log_output
+
+
+@pytest.fixture
+def single_run(example_va_data, tmp_path_factory):
+    directory = tmp_path_factory.mktemp("single")
+    return _run_and_read(example_va_data, directory, None)
+
+
+@pytest.mark.parametrize("source", ["data_frame", "csv", "iterator"])
+def test_run_chunksize_matches_single_run(example_va_data, single_run,
+                                          tmp_path, source):
+    va_input = example_va_data
+    if source == "csv":
+        va_input = str(tmp_path / "va_input.csv")
+        example_va_data.to_csv(va_input, index=False)
+    elif source == "iterator":
+        va_input = (example_va_data.iloc[i:i + 30]
+                    for i in range(0, example_va_data.shape[0], 30))
+    chunked = _run_and_read(va_input, tmp_path, 17)
+    single_iv5out, single_csv, single_log = single_run
+    chunked_iv5out, chunked_csv, chunked_log = chunked
+    assert chunked_csv == single_csv
+    assert chunked_log == single_log
+    single_va5 = single_iv5out.results["VA5"]
+    chunked_va5 = chunked_iv5out.results["VA5"]
+    assert chunked_va5.drop(columns="WHOLEPROB").equals(
+        single_va5.drop(columns="WHOLEPROB"))
+    for single_prob, chunked_prob in zip(single_va5["WHOLEPROB"],
+                                         chunked_va5["WHOLEPROB"]):
+        assert chunked_prob.equals(single_prob)
+    assert chunked_iv5out.dem_group.equals(single_iv5out.dem_group)
+    assert chunked_iv5out.results["checked_data"].equals(
+        single_iv5out.results["checked_data"])
+    assert chunked_iv5out.n_records == example_va_data.shape[0]
+
+
+def test_run_chunksize_no_data_input(example_va_data):
+    iv5out = InterVA5(iter([]), hiv="h", malaria="l", write=False,
+                      directory=".", chunksize=10)
+    with pytest.raises(IOError):
+        iv5out.run()
+
+
+@pytest.mark.parametrize("chunksize", [None, 40])
+def test_run_n_jobs_matches_single_run(example_va_data, single_run, tmp_path,
+                                       chunksize):
+    iv5out = InterVA5(example_va_data, hiv="h", malaria="l", write=True,
+                      directory=str(tmp_path), filename="parallel",
+                      output="extended", return_checked_data=True,
+                      chunksize=chunksize, n_jobs=2)
+    iv5out.run()
+    with open(tmp_path / "parallel.csv") as f:
+        parallel_csv = f.read()
+    single_iv5out, single_csv, single_log = single_run
+    assert parallel_csv == single_csv
+    assert iv5out.results["VA5"].drop(columns="WHOLEPROB").equals(
+        single_iv5out.results["VA5"].drop(columns="WHOLEPROB"))
+    assert iv5out.results["checked_data"].equals(
+        single_iv5out.results["checked_data"])
+
+
+@pytest.mark.parametrize("n_jobs", [0, -2, 1.5])
+def test_run_invalid_n_jobs(example_va_data, n_jobs):
+    iv5out = InterVA5(example_va_data, hiv="h", malaria="l", write=False,
+                      directory=".", n_jobs=n_jobs)
+    with pytest.raises(ArgumentException):
+        iv5out.run()
+
+
+@pytest.mark.parametrize("write_buffer_size", [1, 7])
+def test_run_write_buffer_size(example_va_data, single_run, tmp_path,
+                               write_buffer_size):
+    iv5out = InterVA5(example_va_data, hiv="h", malaria="l", write=True,
+                      directory=str(tmp_path), output="extended",
+                      write_buffer_size=write_buffer_size)
+    iv5out.run()
+    with open(tmp_path / "VA5_result.csv") as f:
+        csv_output = f.read()
+    single_iv5out, single_csv, single_log = single_run
+    assert csv_output == single_csv
+
+
+def test_run_parquet_output(example_va_data, single_run, tmp_path):
+    pytest.importorskip("pyarrow")
+    iv5out = InterVA5(example_va_data, hiv="h", malaria="l", write=True,
+                      directory=str(tmp_path), output="parquet")
+    iv5out.run()
+    parquet_output = read_parquet(tmp_path / "VA5_result.parquet")
+    single_iv5out, single_csv, single_log = single_run
+    single_va5 = single_iv5out.results["VA5"]
+    assert parquet_output.shape == (single_va5.shape[0], 84)
+    assert (parquet_output["ID"] == single_va5["ID"]).all()
+    assert (parquet_output["CAUSE1"] == single_va5["CAUSE1"]).all()
+    assert (parquet_output.iloc[:, 14:].to_numpy() ==
+            single_iv5out.results["propensities"]).all()
+
+
+@pytest.mark.parametrize("chunksize", [None, 40])
+def test_run_parquet_input(example_va_data, single_run, tmp_path, chunksize):
+    pytest.importorskip("pyarrow")
+    va_input = str(tmp_path / "va_input.parquet")
+    example_va_data.to_parquet(va_input)
+    parquet_input = _run_and_read(va_input, tmp_path, chunksize)
+    single_iv5out, single_csv, single_log = single_run
+    assert parquet_input[1] == single_csv
+
+
+def test_run_parquet_output_append(example_va_data, tmp_path):
+    iv5out = InterVA5(example_va_data, hiv="h", malaria="l", write=True,
+                      directory=str(tmp_path), output="parquet", append=True)
+    with pytest.raises(IOError):
+        iv5out.run()
+
+
+# metrics tests
+def test_run_metrics(example_va_data):
+    va_data = example_va_data
+    va_data.iloc[0, 5:12] = "n"
+    va_data.iloc[1, 3:5] = "."
+    va_data.iloc[2, 20:328] = "n"
+    events = []
+    iv5out = InterVA5(va_data, hiv="h", malaria="l", write=False,
+                      chunksize=50, metrics=events.append, verbose=False)
+    iv5out.run()
+    assert [x["event"] for x in events] == ["chunk"] * 4 + ["run"]
+    assert iv5out.results["counts"] == events[-1]["counts"]
+    assert iv5out.results["timings"] == events[-1]["timings"]
+    counts = iv5out.results["counts"]
+    assert counts["records"] == 200
+    assert counts["valid"] == 197
+    assert counts["rejected_age"] == 1
+    assert counts["rejected_sex"] == 1
+    assert counts["rejected_symptoms"] == 1
+    assert sum(x["counts"]["valid"] for x in events[:-1]) == 197
+    timings = iv5out.results["timings"]
+    assert set(timings) == set(STAGES) | {"total"}
+    assert timings["datacheck"]["wall"] > 0
+    assert timings["total"]["wall"] >= timings["datacheck"]["wall"]
+
+
+def test_run_metrics_datacheck_modifications(example_va_data):
+    iv5out = InterVA5(example_va_data, hiv="h", malaria="l", write=False,
+                      return_checked_data=True, verbose=False)
+    iv5out.run()
+    before = DataFrame(to_object(recode(example_va_data))).iloc[:, 1:]
+    after = iv5out.results["checked_data"].iloc[:, 1:]
+    before = before.to_numpy(dtype=float)
+    after = after.to_numpy(dtype=float)
+    changed = (before != after) & ~(isnan(before) & isnan(after))
+    n_changed = iv5out.results["counts"]["datacheck_modifications"]
+    assert n_changed == changed.sum()
+    assert n_changed > 0
+
+
+def test_run_verbose_false(example_va_data, capsys):
+    iv5out = InterVA5(example_va_data, hiv="h", malaria="l", write=False,
+                      verbose=False)
+    iv5out.run()
+    assert capsys.readouterr().out == ""
+
+
+# re-scoring tests
+def _read_last_log(directory):
+    # (without the header, which has the date)
+    with open(directory / "errorlogV5.txt") as f:
+        return f.readlines()[1:]
+
+
+@pytest.mark.parametrize("chunksize", [None, 40])
+def test_run_rescore_matches_new_run(example_va_data, tmp_path, chunksize):
+    va_data = example_va_data
+    va_data.iloc[0, 5:12] = "n"
+    iv5out = InterVA5(va_data.copy(), hiv="h", malaria="l", write=True,
+                      directory=str(tmp_path), output="extended",
+                      return_checked_data=True, chunksize=chunksize,
+                      verbose=False, cache_checked=True)
+    iv5out.run()
+    with open(tmp_path / "VA5_result.csv") as f:
+        first_csv = f.read()
+    iv5out.set_hiv("v")
+    iv5out.set_malaria("h")
+    iv5out.run()
+    assert iv5out.results["timings"]["datacheck"]["wall"] == 0
+    with open(tmp_path / "VA5_result.csv") as f:
+        rescored_csv = f.read()
+    assert rescored_csv != first_csv
+
+    new_directory = tmp_path / "new"
+    new_iv5out = InterVA5(va_data.copy(), hiv="v", malaria="h", write=True,
+                          directory=str(new_directory), output="extended",
+                          return_checked_data=True, chunksize=chunksize,
+                          verbose=False)
+    new_iv5out.run()
+    with open(new_directory / "VA5_result.csv") as f:
+        assert f.read() == rescored_csv
+    assert _read_last_log(new_directory) == _read_last_log(tmp_path)
+    assert iv5out.results["VA5"].drop(columns="WHOLEPROB").equals(
+        new_iv5out.results["VA5"].drop(columns="WHOLEPROB"))
+    assert (iv5out.results["propensities"] ==
+            new_iv5out.results["propensities"]).all()
+    assert iv5out.results["checked_data"].equals(
+        new_iv5out.results["checked_data"])
+    assert iv5out.dem_group.equals(new_iv5out.dem_group)
+    assert iv5out.results["counts"] == new_iv5out.results["counts"]
+
+
+def test_run_rescore_checks_modified_input(example_va_data):
+    iv5out = InterVA5(example_va_data, hiv="h", malaria="l", write=False,
+                      verbose=False, cache_checked=True)
+    iv5out.run()
+    iv5out.set_hiv("v")
+    iv5out.va_input.iloc[0, 5:12] = "n"
+    iv5out.run()
+    assert iv5out.results["timings"]["datacheck"]["wall"] > 0
+    assert iv5out.results["counts"]["rejected_age"] == 1
+
+
+def test_run_without_cache_checked(example_va_data):
+    # (the output of the data checks is not kept by default)
+    iv5out = InterVA5(example_va_data, hiv="h", malaria="l", write=False,
+                      verbose=False)
+    iv5out.run()
+    assert iv5out._checked is None
+    iv5out.set_hiv("v")
+    iv5out.run()
+    assert iv5out.results["timings"]["datacheck"]["wall"] > 0
+
+
+# scoring engine tests
+def test_run_log_scoring_matches_single_run(example_va_data, single_run,
+                                            tmp_path):
+    iv5out = InterVA5(example_va_data, hiv="h", malaria="l", write=True,
+                      directory=str(tmp_path), output="classic",
+                      scoring="log", verbose=False)
+    iv5out.run()
+    single_iv5out, single_csv, single_log = single_run
+    assert iv5out.results["VA5"].drop(columns="WHOLEPROB").equals(
+        single_iv5out.results["VA5"].drop(columns="WHOLEPROB"))
+    assert abs(iv5out.results["propensities"] -
+               single_iv5out.results["propensities"]).max() <= 1e-12
+
+
+def test_run_invalid_scoring(example_va_data):
+    iv5out = InterVA5(example_va_data, hiv="h", malaria="l", write=False,
+                      scoring="fast")
+    with pytest.raises(IOError):
+        iv5out.run()
+
+
+# data check cache tests
+@pytest.mark.parametrize("n_jobs", [None, 2])
+def test_run_datacheck_cache_matches_single_run(example_va_data, single_run,
+                                                tmp_path, n_jobs):
+    cache_path = str(tmp_path / "datacheck_cache.pkl")
+    for k in range(2):
+        directory = tmp_path / f"run{k}"
+        iv5out = InterVA5(example_va_data, hiv="h", malaria="l", write=True,
+                          directory=str(directory), output="extended",
+                          return_checked_data=True, chunksize=70,
+                          n_jobs=n_jobs, datacheck_cache=cache_path,
+                          verbose=False)
+        iv5out.run()
+        with open(directory / "VA5_result.csv") as f:
+            csv_output = f.read()
+        single_iv5out, single_csv, single_log = single_run
+        assert csv_output == single_csv
+        assert _read_last_log(directory) == single_log
+        assert iv5out.results["checked_data"].equals(
+            single_iv5out.results["checked_data"])
+        assert iv5out.dem_group.equals(single_iv5out.dem_group)
+        n_cached = iv5out.results["counts"]["datacheck_cached"]
+        assert n_cached == (0 if k == 0 else 200)
+
+
+def test_run_datacheck_cache_checks_modified_records(example_va_data):
+    cache = DatacheckCache()
+    iv5out = InterVA5(example_va_data.copy(), hiv="h", malaria="l",
+                      write=False, datacheck_cache=cache, verbose=False)
+    iv5out.run()
+    assert len(cache) == 200
+    va_data = example_va_data.copy()
+    va_data.iloc[0, 20:30] = "y"
+    new_iv5out = InterVA5(va_data, hiv="h", malaria="l", write=False,
+                          datacheck_cache=cache, verbose=False)
+    new_iv5out.run()
+    assert new_iv5out.results["counts"]["datacheck_cached"] == 199
+    assert len(cache) == 201
+
+
+# incremental processing tests
+def test_run_incremental_matches_single_run(example_va_data, tmp_path):
+    va_data = example_va_data
+    va_data.iloc[0, 5:12] = "n"
+    single_directory = tmp_path / "single"
+    single_iv5out = InterVA5(va_data, hiv="h", malaria="l", write=True,
+                             directory=str(single_directory),
+                             output="extended", verbose=False)
+    single_iv5out.run()
+    with open(single_directory / "VA5_result.csv") as f:
+        single_csv = f.read()
+
+    increments = [va_data.iloc[0:80], va_data.iloc[0:150], va_data]
+    for va_input in increments:
+        iv5out = InterVA5(va_input.copy(), hiv="h", malaria="l", write=True,
+                          directory=str(tmp_path), output="extended",
+                          incremental=True, verbose=False)
+        iv5out.run()
+    assert iv5out.results["counts"]["records"] == 50
+    assert iv5out.results["VA5"].shape[0] == 50
+    with open(tmp_path / "VA5_result.csv") as f:
+        assert f.read() == single_csv
+    with open(tmp_path / "VA5_result_ids.txt") as f:
+        assert len(f.readlines()) == 200
+    # the record without age is only logged once
+    with open(tmp_path / "errorlogV5.txt") as f:
+        log_output = f.read()
+    assert log_output.count("Error in age indicator") == 1
+
+    iv5out.run()
+    assert iv5out.n_records == 0
+    assert iv5out.results["VA5"] is None
+
+
+def test_run_incremental_from_existing_output(example_va_data, tmp_path):
+    iv5out = InterVA5(example_va_data.iloc[0:100], hiv="h", malaria="l",
+                      write=True, directory=str(tmp_path), verbose=False)
+    iv5out.run()
+    iv5out = InterVA5(example_va_data, hiv="h", malaria="l", write=True,
+                      directory=str(tmp_path), incremental=True,
+                      verbose=False)
+    iv5out.run()
+    assert iv5out.n_records == 100
+    output = read_csv(tmp_path / "VA5_result.csv")
+    assert output["ID"].tolist() == example_va_data["ID"].tolist()
+    # running without incremental replaces the output and the ID index
+    iv5out = InterVA5(example_va_data.iloc[0:10], hiv="h", malaria="l",
+                      write=True, directory=str(tmp_path), verbose=False)
+    iv5out.run()
+    assert not isfile(tmp_path / "VA5_result_ids.txt")
+
+
+def test_run_incremental_after_failed_run(example_va_data, single_run,
+                                          tmp_path):
+    def fail_after_two_chunks(event):
+        if event["event"] == "chunk":
+            n_chunks.append(event)
+            if len(n_chunks) == 2:
+                raise RuntimeError("failed run")
+
+    # (the ID index exists after the first run)
+    iv5out = InterVA5(example_va_data.iloc[0:30], hiv="h", malaria="l",
+                      write=True, directory=str(tmp_path), output="extended",
+                      incremental=True, verbose=False)
+    iv5out.run()
+    n_chunks = []
+    iv5out = InterVA5(example_va_data, hiv="h", malaria="l", write=True,
+                      directory=str(tmp_path), output="extended",
+                      chunksize=30, incremental=True,
+                      metrics=fail_after_two_chunks, verbose=False)
+    with pytest.raises(RuntimeError):
+        iv5out.run()
+    with open(tmp_path / "VA5_result_ids.txt") as f:
+        assert len(f.readlines()) == 90
+    iv5out = InterVA5(example_va_data, hiv="h", malaria="l", write=True,
+                      directory=str(tmp_path), output="extended",
+                      chunksize=30, incremental=True, verbose=False)
+    iv5out.run()
+    assert iv5out.n_records == 110
+    with open(tmp_path / "VA5_result.csv") as f:
+        assert f.read() == single_run[1]
+
+
+def test_run_incremental_without_write(example_va_data):
+    iv5out = InterVA5(example_va_data, hiv="h", malaria="l", write=False,
+                      incremental=True)
+    with pytest.raises(IOError):
+        iv5out.run()
+
+
+# streaming tests
+def test_iter_results_matches_single_run(example_va_data, single_run,
+                                         tmp_path):
+    va_input = example_va_data.copy()
+    va_input.iloc[0, 5:12] = "."
+    iv5out = InterVA5(va_input, hiv="h", malaria="l", write=True,
+                      directory=str(tmp_path), output="extended",
+                      return_checked_data=True, chunksize=17)
+    chunks = list(iv5out.iter_results())
+    assert len(chunks) == 12
+    assert iv5out.results == {}
+    assert chunks[0]["excluded"] == [
+        va_input.iloc[0, 0] + " Error in age indicator: Not Specified"]
+    assert sum(len(chunk["excluded"]) for chunk in chunks) == 1
+    assert sum(chunk["counts"]["records"] for chunk in chunks) == 200
+
+    single_iv5out = single_run[0]
+    single_va5 = single_iv5out.results["VA5"].iloc[1:]
+    va5 = concat([chunk["VA5"] for chunk in chunks], ignore_index=True)
+    assert va5.drop(columns="WHOLEPROB").equals(
+        single_va5.drop(columns="WHOLEPROB").reset_index(drop=True))
+    for prob, single_prob in zip(va5["WHOLEPROB"], single_va5["WHOLEPROB"]):
+        assert prob.equals(single_prob)
+    for chunk in chunks:
+        assert list(chunk["ID"]) == list(chunk["VA5"]["ID"])
+        assert list(chunk["dem_group"].index) == list(chunk["ID"])
+        assert chunk["checked_data"].shape == (chunk["VA5"].shape[0], 354)
+
+    csv_output = read_csv(tmp_path / "VA5_result.csv")
+    single_csv = read_csv(StringIO(single_run[1]))
+    assert csv_output.equals(single_csv.iloc[1:].reset_index(drop=True))
+
+
+def test_iter_results_stop_early(example_va_data, tmp_path):
+    cwd = getcwd()
+    iv5out = InterVA5(example_va_data, hiv="h", malaria="l", write=True,
+                      directory=str(tmp_path), chunksize=50)
+    chunks = iv5out.iter_results()
+    first = next(chunks)
+    assert getcwd() == cwd
+    assert first["VA5"].shape[0] == 50
+    chunks.close()
+    assert getcwd() == cwd
+    # the records of the first chunk were written
+    assert read_csv(tmp_path / "VA5_result.csv").shape[0] == 50
+
+
+# asynchronous run tests
+def test_gui_ctrl_not_shared(example_va_data):
+    first = InterVA5(example_va_data, hiv="h", malaria="l", write=False)
+    second = InterVA5(example_va_data, hiv="h", malaria="l", write=False)
+    first.gui_ctrl["break"] = True
+    assert second.gui_ctrl == {"break": False}
+
+
+def test_openva_app_progress_emitted_once(example_va_data):
+    class App:
+        def __init__(self):
+            self.emitted = []
+
+        def emit(self, progress):
+            self.emitted.append(progress)
+
+    app = App()
+    iv5out = InterVA5(example_va_data, hiv="h", malaria="l", write=False,
+                      openva_app=app, verbose=False)
+    iv5out.run()
+    assert app.emitted == sorted(set(app.emitted))
+    assert app.emitted[-1] == 100
+
+
+def test_run_async_matches_single_run(example_va_data, single_run,
+                                      tmp_path):
+    reports = []
+    iv5out = InterVA5(example_va_data, hiv="h", malaria="l", write=True,
+                      directory=str(tmp_path), output="extended",
+                      return_checked_data=True, chunksize=50)
+    asyncio.run(iv5out.run_async(progress=lambda k, n: reports.append((k, n)),
+                                 progress_interval=0.05))
+    assert iv5out.results["VA5"].drop(columns="WHOLEPROB").equals(
+        single_run[0].results["VA5"].drop(columns="WHOLEPROB"))
+    with open(tmp_path / "VA5_result.csv") as f:
+        assert f.read() == single_run[1]
+    assert reports[-1] == (200, 200)
+    assert len(reports) < 200
+    assert reports == sorted(set(reports))
+
+
+def test_run_async_cancel(example_va_data):
+    iv5out = InterVA5(example_va_data, hiv="h", malaria="l", write=False,
+                      verbose=False)
+
+    async def run_and_cancel():
+        task = asyncio.create_task(iv5out.run_async())
+        await asyncio.sleep(0.5)
+        task.cancel()
+        await task
+
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(run_and_cancel())
+    assert 0 < iv5out._progress[0] < example_va_data.shape[0]
+    assert iv5out.results == {}
+
+
+def test_aiter_results(example_va_data):
+    iv5out = InterVA5(example_va_data, hiv="h", malaria="l", write=False,
+                      verbose=False, chunksize=80)
+
+    async def collect():
+        progress = []
+        chunks = []
+        async for chunk in iv5out.aiter_results(
+                progress=lambda k, n: progress.append(k)):
+            chunks.append(chunk)
+        return chunks, progress
+
+    chunks, progress = asyncio.run(collect())
+    assert [chunk["VA5"].shape[0] for chunk in chunks] == [80, 80, 40]
+    assert progress[-1] == 200
+
+
+def test_aiter_results_break_with_workers(example_va_data):
+    iv5out = InterVA5(example_va_data, hiv="h", malaria="l", write=False,
+                      verbose=False, chunksize=25, n_jobs=2)
+
+    async def tick(gaps):
+        last = perf_counter()
+        while True:
+            await asyncio.sleep(0.01)
+            gaps.append(perf_counter() - last)
+            last = perf_counter()
+
+    async def first_chunk():
+        chunks = iv5out.aiter_results()
+        async for chunk in chunks:
+            break
+        gaps = []
+        ticker = asyncio.create_task(tick(gaps))
+        await asyncio.sleep(0)
+        start = perf_counter()
+        # (the worker processes are shut down without blocking the loop)
+        await chunks.aclose()
+        closing = perf_counter() - start
+        await asyncio.sleep(0.05)
+        ticker.cancel()
+        return chunk, gaps, closing
+
+    chunk, gaps, closing = asyncio.run(first_chunk())
+    assert chunk["VA5"].shape[0] == 25
+    assert max(gaps, default=0) < max(0.25, closing / 2)
+    assert iv5out._cancel is None
+
+
+# concurrent run tests
+def test_run_keeps_working_directory(example_va_data, tmp_path):
+    cwd = getcwd()
+    directories = []
+    iv5out = InterVA5(example_va_data, hiv="h", malaria="l", write=True,
+                      directory=str(tmp_path / "output"), chunksize=100,
+                      metrics=lambda x: directories.append(getcwd()))
+    iv5out.run()
+    assert directories == [cwd] * 3
+    assert isfile(tmp_path / "output" / "VA5_result.csv")
+    assert isfile(tmp_path / "output" / "errorlogV5.txt")
+
+
+def test_run_removes_log_handler(example_va_data, tmp_path):
+    module_logger = getLogger("interva.interva5")
+    handlers = list(module_logger.handlers)
+    for _ in range(2):
+        iv5out = InterVA5(example_va_data.head(20), hiv="h", malaria="l",
+                          write=True, directory=str(tmp_path))
+        iv5out.run()
+    assert module_logger.handlers == handlers
+    with open(tmp_path / "errorlogV5.txt") as f:
+        assert f.read().count("Error & warning log built") == 1
+
+
+def test_run_relative_input_path(example_va_data, tmp_path):
+    example_va_data.head(20).to_csv(tmp_path / "va_input.csv", index=False)
+    iv5out = InterVA5("va_input.csv", hiv="h", malaria="l", write=True,
+                      directory=str(tmp_path))
+    iv5out.run()
+    assert iv5out.results["VA5"].shape[0] == 20
+
+
+def test_run_concurrent_threads(example_va_data, single_run, tmp_path):
+    def run_in(directory):
+        return _run_and_read(example_va_data, directory, 50)
+
+    directories = [tmp_path / str(i) for i in range(4)]
+    for directory in directories:
+        directory.mkdir()
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        outputs = list(executor.map(run_in, directories))
+    for iv5out, csv_output, log_output in outputs:
+        assert csv_output == single_run[1]
+        assert log_output == single_run[2]
+        assert iv5out.results["VA5"].drop(columns="WHOLEPROB").equals(
+            single_run[0].results["VA5"].drop(columns="WHOLEPROB"))
+
+
+def test_get_csmf_keeps_pandas_options(example_va_data, tmp_path):
+    iv5out = InterVA5(example_va_data.head(20), hiv="h", malaria="l",
+                      write=False)
+    iv5out.run()
+    max_rows = get_option("display.max_rows")
+    iv5out.write_csmf(filename=str(tmp_path / "csmf"))
+    assert get_option("display.max_rows") == max_rows
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+from threading import Thread
+from time import perf_counter, sleep
+
+from interva.metrics import (COUNTS, STAGES, add_to, new_counts, new_timings,
+                             timed, timed_iter)
+
+
+def test_timed_adds_to_stage():
+    timings = new_timings()
+    with timed(timings, "scoring"):
+        sleep(0.01)
+    with timed(timings, "scoring"):
+        sleep(0.01)
+    assert timings["scoring"]["wall"] >= 0.02
+    assert timings["load"] == {"wall": 0.0, "cpu": 0.0}
+
+
+def test_timed_excludes_other_threads():
+    def busy():
+        start = perf_counter()
+        while perf_counter() - start < 0.3:
+            pass
+
+    timings = new_timings()
+    thread = Thread(target=busy)
+    with timed(timings, "scoring"):
+        thread.start()
+        thread.join()
+    assert timings["scoring"]["wall"] >= 0.3
+    assert timings["scoring"]["cpu"] < 0.1
+
+
+def test_timed_iter():
+    timings = new_timings()
+
+    def slow_chunks():
+        for i in range(3):
+            sleep(0.01)
+            yield i
+
+    assert list(timed_iter(slow_chunks(), timings, "load")) == [0, 1, 2]
+    assert timings["load"]["wall"] >= 0.03
+
+
+def test_add_to():
+    total_timings = new_timings()
+    total_counts = new_counts()
+    for _ in range(2):
+        timings = new_timings()
+        timings["datacheck"]["wall"] = 1.5
+        add_to(total_timings, timings)
+        counts = new_counts()
+        counts["valid"] = 3
+        add_to(total_counts, counts)
+    assert total_timings["datacheck"]["wall"] == 3.0
+    assert total_counts["valid"] == 6
+    assert set(total_timings) == set(STAGES)
+    assert set(total_counts) == set(COUNTS)
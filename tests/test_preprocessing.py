@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+
+from numpy import isnan, nan
+from pandas import DataFrame
+
+from interva.interva5 import get_example_input
+from interva.preprocessing import MISSING, recode, to_object, validity_masks
+
+va_data = get_example_input()
+
+
+def test_recode_values():
+    va_input = DataFrame({"ID": ["d1", "d2"],
+                          "a": ["y", "N"],
+                          "b": ["Y", "-"],
+                          "c": [".", "n"],
+                          "d": ["1", "0"],
+                          "e": [1, nan]})
+    codes = recode(va_input)
+    assert codes.dtype == "int8"
+    assert codes.tolist() == [[0, 1, 1, MISSING, 1, MISSING],
+                              [0, 0, MISSING, 0, 0, MISSING]]
+
+
+def test_recode_does_not_modify_input():
+    va_input = va_data.copy()
+    recode(va_input)
+    assert va_input.equals(va_data)
+
+
+def test_validity_masks():
+    va_input = va_data.iloc[0:3].copy()
+    va_input.iloc[0, 5:12] = "n"
+    va_input.iloc[1, 3:5] = "."
+    va_input.iloc[2, 20:328] = "n"
+    valid = validity_masks(recode(va_input))
+    assert valid["age"].tolist() == [False, True, True]
+    assert valid["sex"].tolist() == [True, False, True]
+    assert valid["symptoms"].tolist() == [True, True, False]
+
+
+def test_to_object():
+    values = to_object(recode(va_data.iloc[0:1]))[0]
+    assert values[0] == 0
+    assert all(isinstance(x, int) or isnan(x) for x in values)
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+from numpy import isnan
+
+from interva.interva5 import InterVA5, get_example_input
+from interva.probbase import (CACHE_SIZE, CompiledProbbase,
+                              clear_probbase_cache, compile_probbase,
+                              get_probbase, probbase_key)
+
+
+def test_compile_probbase_default():
+    compiled = compile_probbase()
+    assert isinstance(compiled, CompiledProbbase)
+    assert compiled.version == "probbase v19 20210720"
+    assert compiled.likelihood.shape == (353, 70)
+    assert compiled.sys_prior.shape == (87,)
+    assert compiled.subst.shape == (354,)
+    assert compiled.datacheck.shape == (354, 87)
+    assert isnan(compiled.subst[0])
+    assert set(compiled.subst[1:]) <= {0, 1}
+
+
+def test_compile_probbase_is_cached():
+    assert compile_probbase() is compile_probbase()
+    assert compile_probbase(sci=get_probbase()) is compile_probbase()
+
+
+def test_compile_probbase_read_only():
+    compiled = compile_probbase()
+    with pytest.raises(ValueError):
+        compiled.likelihood[0, 0] = 1
+
+
+def test_compile_probbase_custom_sci():
+    probbase = get_probbase().copy()
+    probbase.iloc[1, 20] = "I"
+    compiled = compile_probbase(sci=probbase)
+    assert compiled.key == probbase_key(probbase)
+    assert compiled.key != compile_probbase().key
+    assert compiled.likelihood[0, 3] == 1
+    assert compile_probbase(sci=probbase.to_numpy()) is compiled
+
+
+def test_compile_probbase_invalid_sci():
+    with pytest.raises(IOError):
+        compile_probbase(sci=get_probbase().iloc[1:, :])
+
+
+def test_compile_probbase_lru_eviction():
+    clear_probbase_cache()
+    first = compile_probbase()
+    probbase = get_probbase()
+    for i in range(CACHE_SIZE):
+        modified = probbase.copy()
+        modified.iloc[1, 2] = f"modified {i}"
+        compile_probbase(sci=modified)
+    assert compile_probbase() is not first
+
+
+def test_prior():
+    compiled = compile_probbase()
+    prior = compiled.prior("h", "l")
+    assert prior.shape == (70,)
+    assert prior[22 - 17] == 0.05
+    assert prior[24 - 17] == 0.005
+    assert prior[44 - 17] == 1e-05
+    assert compiled.prior("v", "v")[22 - 17] == 1e-05
+
+
+def test_run_with_ndarray_sci():
+    va_data = get_example_input().head(10)
+    iv5out = InterVA5(va_data, hiv="h", malaria="l", write=False,
+                      sci=get_probbase().to_numpy())
+    iv5out.run()
+    assert iv5out.results["VA5"].shape[0] == 10
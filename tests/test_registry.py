@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+from pandas import DataFrame, read_csv
+from pkgutil import get_data
+from io import BytesIO
+
+from interva import registry
+from interva.data.causetext import CAUSETEXTV5
+from interva.data.valabels import VALABELS
+from interva.exceptions import ArgumentException
+from interva.interva5 import get_example_input
+from interva.registry import ASSETS, clear_registry, get_asset, prewarm
+
+
+def test_valabels_match_example_input():
+    va_data = read_csv(BytesIO(get_data("interva", "data/randomva5.csv")))
+    assert list(VALABELS) == list(va_data.columns)
+
+
+def test_causetext_table():
+    assert get_asset("causetext").equals(DataFrame(CAUSETEXTV5).transpose())
+
+
+def test_get_asset_parses_once(monkeypatch):
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return DataFrame({"a": [1, 2]})
+
+    monkeypatch.setitem(ASSETS, "test_asset", loader)
+    monkeypatch.delitem(registry._assets, "test_asset", raising=False)
+    first = get_asset("test_asset")
+    second = get_asset("test_asset")
+    assert len(calls) == 1
+    assert first.equals(second)
+    assert first is not second
+    assert get_asset("test_asset", copy=False) is get_asset(
+        "test_asset", copy=False)
+    registry._assets.pop("test_asset")
+
+
+def test_get_asset_returns_copies():
+    va_data = get_example_input()
+    va_data.iloc[0, 1] = "changed"
+    assert get_example_input().iloc[0, 1] != "changed"
+
+
+def test_get_asset_exception():
+    with pytest.raises(ArgumentException):
+        get_asset("unknown")
+
+
+def test_prewarm_and_clear():
+    clear_registry()
+    assert registry._assets == {}
+    prewarm(["example_input", "causetext"])
+    assert set(registry._assets) == {"example_input", "causetext"}
+    prewarm()
+    assert "probbase_19" in registry._assets
+    assert "probbase_xls" not in registry._assets
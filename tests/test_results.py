@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+from numpy import array, array_equal
+from pandas import DataFrame
+
+from interva.interva5 import InterVA5, get_example_input
+from interva.results import Results, get_propensities
+from interva.utils import csmf
+
+va_data = get_example_input()
+
+
+@pytest.fixture
+def iv5out():
+    out = InterVA5(va_data, hiv="h", malaria="l", write=False)
+    out.run()
+    return out
+
+
+def test_propensities_shape(iv5out):
+    results = iv5out.results
+    assert isinstance(results, Results)
+    assert results["propensities"].shape == (va_data.shape[0], 70)
+    assert (results["cause_names"] == iv5out.causetextV5.iloc[:, 0]).all()
+
+
+def test_wholeprob_is_built_lazily(iv5out):
+    results = iv5out.results
+    assert "WHOLEPROB" not in dict.get(results, "VA5").columns
+    va5 = results["VA5"]
+    assert "WHOLEPROB" in va5.columns
+    assert va5.columns[-1] == "WHOLEPROB"
+    wholeprob = array([x.to_numpy() for x in va5["WHOLEPROB"]])
+    assert array_equal(wholeprob, results["propensities"], equal_nan=True)
+    assert (va5.loc[0, "WHOLEPROB"].index == results["cause_names"]).all()
+    assert results["VA5"] is va5
+
+
+def test_get_propensities_from_wholeprob(iv5out):
+    va5, prob, cause_names = get_propensities(iv5out.results)
+    hand_made = {"VA5": iv5out.results["VA5"]}
+    va5_2, prob_2, cause_names_2 = get_propensities(hand_made)
+    assert array_equal(prob, prob_2, equal_nan=True)
+    assert (cause_names == cause_names_2).all()
+
+
+def test_replacing_va5_drops_propensities(iv5out):
+    va5 = iv5out.results["VA5"]
+    expected = csmf(iv5out, top=10, interva_rule=True)
+    iv5out.results["VA5"] = va5.copy()
+    assert "propensities" not in iv5out.results
+    assert csmf(iv5out, top=10, interva_rule=True).equals(expected)
+
+
+def test_copy_is_results(iv5out):
+    results_copy = iv5out.results.copy()
+    assert isinstance(results_copy, Results)
+    assert isinstance(results_copy["VA5"], DataFrame)
+    assert "WHOLEPROB" in results_copy["VA5"].columns
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+from numpy import (array, array_equal, copy, isnan, nan, nanmax, nansum,
+                   random, zeros)
+from pandas import to_numeric
+
+from interva.interva5 import InterVA5, get_example_input, get_probbase
+from interva.scoring import (LOG_SCORING_TOLERANCE, near_ties, score_batch,
+                             score_batch_log, score_record, score_record_log)
+from interva.sparse import SymptomMatrix
+
+va_data = get_example_input()
+iv5out = InterVA5(va_data, hiv="h", malaria="l", write=False)
+iv5out.run()
+
+
+@pytest.fixture
+def likelihood_and_prior():
+    probbase = get_probbase().to_numpy()
+    values = {"I": 1, "A+": 0.8, "A": 0.5, "A-": 0.2, "B+": 0.1, "B": 0.05,
+              "B-": 0.02, "B -": 0.02, "C+": 0.01, "C": 0.005, "C-": 0.002,
+              "D+": 0.001, "D": 5e-04, "D-": 1e-04, "E": 1e-05, "N": 0,
+              "": 0}
+    for key, value in values.items():
+        probbase[:, 17:][probbase[:, 17:] == key] = value
+    probbase[0, 0:17] = 0
+    prior = to_numeric(probbase[0, 17:]).astype(float)
+    likelihood = probbase[1:, 17:].astype(float)
+    return likelihood, prior
+
+
+def score_one(symptoms, likelihood, prior):
+    """Original record-by-record scoring loop."""
+    prob = copy(prior)
+    for s in symptoms.nonzero()[0]:
+        for j in range(70):
+            prob[j] = prob[j] * likelihood[s, j]
+        if nansum(prob[0:3]) > 0:
+            prob[0:3] = prob[0:3] / nansum(prob[0:3])
+        if nansum(prob[3:64]) > 0:
+            prob[3:64] = prob[3:64] / nansum(prob[3:64])
+        if nansum(prob[64:70]) > 0:
+            prob[64:70] = prob[64:70] / nansum(prob[64:70])
+    return prob
+
+
+def test_score_batch_matches_record_by_record(likelihood_and_prior):
+    likelihood, prior = likelihood_and_prior
+    rng = random.default_rng(5)
+    symptoms = rng.random((50, likelihood.shape[0])) < 0.1
+    batch = score_batch(symptoms, likelihood, prior)
+    expected = array([score_one(x, likelihood, prior) for x in symptoms])
+    assert batch.shape == (50, 70)
+    assert array_equal(batch, expected, equal_nan=True)
+
+
+def test_score_batch_no_symptoms(likelihood_and_prior):
+    likelihood, prior = likelihood_and_prior
+    symptoms = zeros((3, likelihood.shape[0]), dtype=bool)
+    batch = score_batch(symptoms, likelihood, prior)
+    assert (batch == prior).all()
+
+
+def test_score_batch_no_records(likelihood_and_prior):
+    likelihood, prior = likelihood_and_prior
+    symptoms = zeros((0, likelihood.shape[0]), dtype=bool)
+    assert score_batch(symptoms, likelihood, prior).shape == (0, 70)
+
+
+def test_run_wholeprob_sums_to_one():
+    wholeprob = iv5out.results["VA5"].loc[0, "WHOLEPROB"].to_numpy()
+    assert nansum(wholeprob[3:64]) == pytest.approx(1)
+
+
+def test_score_batch_log_within_tolerance(likelihood_and_prior):
+    likelihood, prior = likelihood_and_prior
+    rng = random.default_rng(5)
+    symptoms = rng.random((200, likelihood.shape[0])) < 0.05
+    expected = score_batch(symptoms, likelihood, prior)
+    batch = score_batch_log(symptoms, likelihood, prior, resolve_ties=False)
+    assert array_equal(isnan(batch), isnan(expected))
+    assert nanmax(abs(batch - expected)) <= LOG_SCORING_TOLERANCE
+
+
+def test_score_batch_log_resolves_ties(likelihood_and_prior):
+    likelihood, prior = likelihood_and_prior
+    rng = random.default_rng(5)
+    symptoms = rng.random((200, likelihood.shape[0])) < 0.05
+    expected = score_batch(symptoms, likelihood, prior)
+    batch = score_batch_log(symptoms, likelihood, prior)
+    assert nanmax(abs(batch - expected)) <= LOG_SCORING_TOLERANCE
+    ties = near_ties(batch)
+    assert array_equal(batch[ties], expected[ties], equal_nan=True)
+
+
+def test_score_batch_log_no_symptoms(likelihood_and_prior):
+    likelihood, prior = likelihood_and_prior
+    symptoms = zeros((3, likelihood.shape[0]), dtype=bool)
+    batch = score_batch_log(symptoms, likelihood, prior)
+    assert (batch == prior).all()
+
+
+def test_score_batch_log_zero_and_missing_likelihood(likelihood_and_prior):
+    likelihood, prior = likelihood_and_prior
+    likelihood = likelihood.copy()
+    likelihood[0, 0:3] = 0
+    likelihood[0, 10] = nan
+    symptoms = zeros((1, likelihood.shape[0]), dtype=bool)
+    symptoms[0, [0, 5]] = True
+    expected = score_batch(symptoms, likelihood, prior)
+    batch = score_batch_log(symptoms, likelihood, prior)
+    assert (batch[0, 0:3] == 0).all()
+    assert isnan(batch[0, 10])
+    assert array_equal(isnan(batch), isnan(expected))
+    assert nanmax(abs(batch - expected)) <= LOG_SCORING_TOLERANCE
+
+
+def test_near_ties():
+    prob = zeros((4, 70))
+    prob[:, 64] = 1
+    # second cause with exactly half the propensity of the first one
+    prob[0, 3:6] = [0.5, 0.25, 0.1]
+    # largest propensity at the cutoff for reporting a cause
+    prob[1, 3:6] = [0.4, 0.1, 0.05]
+    # no tie: the largest propensity is below the cutoff, so the order of
+    # the others does not matter
+    prob[2, 3:6] = [0.3, 0.2, 0.2]
+    # no tie
+    prob[3, 3:6] = [0.6, 0.27, 0.13]
+    assert near_ties(prob).tolist() == [True, True, False, False]
+
+
+def test_score_batch_sparse_input(likelihood_and_prior):
+    likelihood, prior = likelihood_and_prior
+    rng = random.default_rng(4)
+    symptoms = rng.random((100, likelihood.shape[0])) < 0.05
+    sparse = SymptomMatrix.from_dense(symptoms)
+    assert array_equal(score_batch(sparse, likelihood, prior),
+                       score_batch(symptoms, likelihood, prior),
+                       equal_nan=True)
+    assert array_equal(score_batch_log(sparse, likelihood, prior),
+                       score_batch_log(symptoms, likelihood, prior),
+                       equal_nan=True)
+
+
+def test_score_record_matches_batch(likelihood_and_prior):
+    likelihood, prior = likelihood_and_prior
+    likelihood = likelihood.copy()
+    likelihood[7, 10] = nan
+    rng = random.default_rng(6)
+    symptoms = rng.random((100, likelihood.shape[0])) < 0.1
+    symptoms[0:10, 7] = True
+    symptoms[10] = False
+    sparse = SymptomMatrix.from_dense(symptoms)
+    batch = score_batch(sparse, likelihood, prior)
+    batch_log = score_batch_log(sparse, likelihood, prior)
+    for i, x in enumerate(symptoms):
+        rows = x.nonzero()[0]
+        assert array_equal(score_record(rows, likelihood, prior), batch[i],
+                           equal_nan=True)
+        assert array_equal(score_record_log(rows, likelihood, prior),
+                           batch_log[i], equal_nan=True)
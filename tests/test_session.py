@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from interva.cache import DatacheckCache
+from interva.exceptions import ArgumentException
+from interva.interva5 import InterVA5, get_example_input
+from interva.session import ScoringSession
+
+va_data = get_example_input()
+iv5out = InterVA5(va_data, hiv="h", malaria="l", write=False, verbose=False)
+iv5out.run()
+va5 = iv5out.results["VA5"].set_index("ID")
+session = ScoringSession(hiv="h", malaria="l")
+
+
+def test_score_matches_run():
+    for i in range(va_data.shape[0]):
+        result = session.score(va_data.iloc[i])
+        expected = va5.loc[result["ID"]]
+        for column in va5.columns:
+            if column == "WHOLEPROB":
+                assert (result[column] == expected[column]).all()
+            else:
+                assert result[column] == expected[column]
+
+
+def test_score_input_types():
+    record = va_data.iloc[0]
+    expected = session.score(record)
+    from_list = session.score(record.tolist())
+    from_dict = session.score({k.upper(): v for k, v in record.items()})
+    for result in (from_list, from_dict):
+        assert result["CAUSE1"] == expected["CAUSE1"]
+        assert (result["WHOLEPROB"] == expected["WHOLEPROB"]).all()
+
+
+def test_score_data_check_messages():
+    result = session.score(va_data.iloc[0])
+    assert isinstance(result["first_pass"], list)
+    assert isinstance(result["second_pass"], list)
+
+
+def test_score_invalid_record():
+    record = va_data.iloc[0].copy()
+    record.iloc[5:12] = "."
+    with pytest.raises(ArgumentException, match="age indicator"):
+        session.score(record)
+    with pytest.raises(ArgumentException):
+        session.score(record.tolist()[:-1])
+
+
+def test_score_datacheck_cache():
+    cache = DatacheckCache()
+    cached_session = ScoringSession(hiv="h", malaria="l",
+                                    datacheck_cache=cache)
+    first = cached_session.score(va_data.iloc[0])
+    second = cached_session.score(va_data.iloc[0])
+    assert len(cache) == 1
+    assert cache.hits == 1
+    assert first["CAUSE1"] == second["CAUSE1"]
+    assert first["first_pass"] == second["first_pass"]
+
+
+def test_session_exceptions():
+    with pytest.raises(IOError):
+        ScoringSession(hiv="x", malaria="l")
+    with pytest.raises(IOError):
+        ScoringSession(hiv="h", malaria="l", scoring="other")
+
+
+def test_score_renames_i183o(capsys):
+    record = va_data.iloc[0]
+    expected = session.score(record)
+    renamed_session = ScoringSession(hiv="h", malaria="l")
+    old_names = record.rename({"i183a": "i183o"})
+    for old_record in (old_names, old_names.to_dict()):
+        result = renamed_session.score(old_record)
+        assert result["CAUSE1"] == expected["CAUSE1"]
+        assert (result["WHOLEPROB"] == expected["WHOLEPROB"]).all()
+    # (the message is printed once, as in InterVA5.run())
+    assert capsys.readouterr().out.count("'i183o' has been renamed") == 1
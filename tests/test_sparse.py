@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+
+import pickle
+from numpy import arange, array, array_equal, random, zeros
+
+from interva.sparse import SymptomMatrix
+
+rng = random.default_rng(1)
+dense = rng.random((40, 353)) < 0.1
+dense[[3, 17, 39]] = False  # records without positive symptoms
+
+
+def test_from_dense_round_trip():
+    matrix = SymptomMatrix.from_dense(dense)
+    assert matrix.shape == (40, 353)
+    assert matrix.nnz == dense.sum()
+    assert array_equal(matrix.row_counts(), dense.sum(axis=1))
+    assert array_equal(matrix.to_dense(), dense)
+
+
+def test_empty_matrix():
+    matrix = SymptomMatrix.from_dense(zeros((0, 353), dtype=bool))
+    assert matrix.shape == (0, 353)
+    assert matrix.nnz == 0
+    assert matrix.dot(zeros((353, 70))).shape == (0, 70)
+    assert list(matrix.columns()) == []
+
+
+def test_take_rows():
+    matrix = SymptomMatrix.from_dense(dense)
+    rows = array([39, 0, 17, 5, 5])
+    assert array_equal(matrix.take_rows(rows).to_dense(), dense[rows])
+    assert matrix.take_rows(array([], dtype=int)).shape == (0, 353)
+
+
+def test_dot():
+    matrix = SymptomMatrix.from_dense(dense)
+    values = rng.random((353, 70))
+    product = matrix.dot(values)
+    assert abs(product - dense.astype(float) @ values).max() < 1e-12
+    assert (product[[3, 17, 39]] == 0).all()
+    assert array_equal(matrix.dot(values[:, 0] > 0.5),
+                       dense @ (values[:, 0] > 0.5).astype(float))
+
+
+def test_columns():
+    matrix = SymptomMatrix.from_dense(dense)
+    columns = list(matrix.columns())
+    expected = arange(353)[dense.any(axis=0)]
+    assert [j for j, _ in columns] == expected.tolist()
+    for j, rows in columns:
+        assert array_equal(rows, dense[:, j].nonzero()[0])
+
+
+def test_pickle():
+    matrix = SymptomMatrix.from_dense(dense)
+    assert array_equal(pickle.loads(pickle.dumps(matrix)).to_dense(), dense)
@@ -1,12 +1,16 @@
 # -*- coding: utf-8 -*-
 
 import pytest
+from decimal import Decimal
+from math import isclose
 from pandas import concat, DataFrame, Series
-from numpy import nan
+from numpy import (allclose, arange, argsort, array, array_equal, nan,
+                   nextafter, random, sort, where, zeros)
 from interva.interva5 import InterVA5, get_example_input
-from interva.utils import (csmf, get_indiv_cod, _get_age_group,
-                           _get_age_group_all, _get_cod_with_dem,
-                           _get_dem_groups, _get_sex_group)
+from interva.utils import (csmf, get_indiv_cod, stratified_csmf,
+                           _csmf_dist, _get_age_group, _get_age_group_all,
+                           _get_cod_with_dem, _get_dem_groups,
+                           _get_dem_groups_frame, _get_sex_group)
 from interva.exceptions import ArgumentException
 
 va_data = get_example_input()
@@ -92,6 +96,46 @@ def test_get_age_groups_unknown():
 #         csmf("a")
 
 
+def test_get_dem_groups_frame_matches_records():
+    rng = random.default_rng(5)
+    values = array(y + n, dtype=object)
+    records = DataFrame(
+        rng.choice(values, size=(300, 9)),
+        columns=["i019a", "i019b"] + age_indicators)
+    # records with exactly one age group
+    for i in range(0, 300, 3):
+        records.loc[i, age_indicators] = 0
+        records.loc[i, age_indicators[i % 7]] = "y"
+    records.insert(0, "ID", [f"d{i}" for i in range(300)])
+    for detailed in [False, True]:
+        dem_group = _get_dem_groups_frame(records, detailed=detailed)
+        expected = DataFrame([_get_dem_groups(records.iloc[i], detailed)
+                              for i in range(300)])
+        assert dem_group["ID"].tolist() == expected["ID"].tolist()
+        assert dem_group["age"].tolist() == expected["age"].tolist()
+        assert dem_group["sex"].tolist() == expected["sex"].tolist()
+        assert dem_group["age"].dtype == "category"
+        assert dem_group["sex"].dtype == "category"
+
+
+def test_get_dem_groups_frame_exception():
+    with pytest.raises(ArgumentException):
+        _get_dem_groups_frame(Series({"ID": "d1"}))
+
+
+def test_run_dem_group():
+    assert iv5out.dem_group.shape == (200, 2)
+    assert iv5out.dem_group["sex"].dtype == "category"
+    checked = InterVA5(va_data, hiv="h", malaria="l", write=False,
+                       return_checked_data=True, verbose=False)
+    checked.run()
+    checked_data = checked.results["checked_data"]
+    expected = DataFrame([_get_dem_groups(checked_data.iloc[i])
+                          for i in range(checked_data.shape[0])])
+    assert iv5out.dem_group["age"].tolist() == expected["age"].tolist()
+    assert iv5out.dem_group["sex"].tolist() == expected["sex"].tolist()
+
+
 def test_csmf_exception_zero_rows():
     bad_input = InterVA5(va_data, hiv="h", malaria="l", write=False)
     with pytest.raises(ArgumentException):
@@ -133,3 +177,150 @@ def test_get_indiv_cod():
     assert out2.shape[1] == 6
     assert (out3["PROPENSITY5"] != " ").all()
     assert out3.shape[1] == 11
+
+
+def test_get_indiv_cod_without_interva_rule_distinct_causes():
+    out = get_indiv_cod(iv5out, top=5, interva_rule=False,
+                        include_propensities=True)
+    causes = out[[f"CAUSE{k}" for k in range(1, 6)]]
+    assert (causes.nunique(axis=1) == 5).all()
+    propensities = out[[f"PROPENSITY{k}" for k in range(1, 6)]].to_numpy()
+    assert (propensities[:, :-1] >= propensities[:, 1:]).all()
+
+
+def csmf_dist_one_by_one(prob, interva_rule, top_aggregate=None):
+    """Original record-by-record CSMF loop."""
+    dist = zeros(prob.shape[1])
+    undetermined = 0
+    for i in range(prob.shape[0]):
+        this_dist = prob[i].copy()
+        this_dist[0:3] = 0
+        this_dist[64:70] = 0
+        if not interva_rule:
+            if sum(this_dist) == 0:
+                undetermined = undetermined + 1
+                continue
+            cutoff = this_dist[argsort(-this_dist)[top_aggregate - 1]]
+            undetermined = undetermined + sum(this_dist[this_dist < cutoff])
+            this_dist[this_dist < cutoff] = 0
+        elif max(this_dist) < 0.4:
+            if isclose(sum(this_dist), 0):
+                undetermined = undetermined + 1
+            else:
+                undetermined = undetermined + sum(this_dist)
+            continue
+        else:
+            cutoff_3 = Decimal(this_dist[argsort(-this_dist)][2])
+            cutoff_2 = Decimal(this_dist[argsort(-this_dist)][1])
+            cutoff_1 = Decimal(this_dist[argsort(-this_dist)][0])
+            cutoff_1_halved = cutoff_1 / Decimal('2')
+            cutoff = cutoff_3.max(cutoff_1_halved).min(
+                cutoff_2.max(cutoff_1_halved))
+            adj_cutoff = cutoff - Decimal(1e-15)
+            undetermined = undetermined + sum(
+                this_dist[where(this_dist < adj_cutoff)[0]])
+            this_dist[where(this_dist < adj_cutoff)[0]] = 0
+            close_indices = [j for j in where(this_dist > 0)[0]
+                             if abs(Decimal(this_dist[j]) - cutoff) < 4e-29]
+            for k in sorted(close_indices, reverse=True):
+                undetermined = undetermined + this_dist[k]
+                this_dist[k] = 0
+        dist = dist + this_dist
+    return dist, undetermined
+
+
+@pytest.fixture
+def propensities_with_ties():
+    rng = random.default_rng(3)
+    prob = rng.random((240, 70)) ** 12
+    prob[:, 3:64] = prob[:, 3:64] / prob[:, 3:64].sum(axis=1)[:, None]
+    prob[0:30, 3:64] = prob[0:30, 3:64] * 0.3
+    prob[30:60, 3:64] = 0
+    prob[60:90, 3:64] = 0
+    prob[60:90, 10:13] = [0.5, 0.25, 0.25]
+    prob[90:120, 20:23] = 0.45
+    prob[120:150, 5:8] = [0.9, 0.3, 0.3]
+    # propensities next to the cutoff minus 1e-15
+    prob[120:150, 8] = nextafter(0.3 - 1e-15, arange(120, 150) % 3 - 1)
+    prob[150:180, 3:64] = prob[120:150, 3:64]
+    return prob
+
+
+def test_csmf_dist_with_interva_rule(propensities_with_ties):
+    dist, undetermined = _csmf_dist(propensities_with_ties, True,
+                                    interva_rule=True)
+    expected = csmf_dist_one_by_one(propensities_with_ties, True)
+    assert array_equal(dist, expected[0])
+    assert undetermined == expected[1]
+
+
+@pytest.mark.parametrize("top_aggregate", [1, 3, 61])
+def test_csmf_dist_without_interva_rule(propensities_with_ties,
+                                        top_aggregate):
+    dist, undetermined = _csmf_dist(propensities_with_ties, True,
+                                    interva_rule=False,
+                                    top_aggregate=top_aggregate)
+    expected = csmf_dist_one_by_one(propensities_with_ties, False,
+                                    top_aggregate)
+    assert array_equal(dist, expected[0])
+    assert undetermined == expected[1]
+
+
+def test_csmf_matches_get_csmf():
+    get_csmf_out = iv5out.get_csmf(top=70)
+    csmf_out = csmf(iv5out, top=70, interva_rule=True)
+    assert sort(csmf_out.to_numpy()) == pytest.approx(
+        sort(get_csmf_out.to_numpy()))
+
+
+# stratified CSMF tests
+@pytest.mark.parametrize("interva_rule", [True, False])
+def test_stratified_csmf_matches_csmf(interva_rule):
+    result = stratified_csmf(iv5out, by=["age", "sex"], top=5,
+                             interva_rule=interva_rule)
+    assert list(result.columns) == ["age", "sex", "n_records", "cause",
+                                    "csmf"]
+    groups = result.groupby(["age", "sex"], observed=True)
+    assert groups.ngroups == 2
+    for (age, sex), group in groups:
+        expected = csmf(iv5out, top=5, interva_rule=interva_rule, age=age,
+                        sex=sex)
+        assert group["cause"].tolist() == list(expected.index)
+        assert allclose(group["csmf"], expected.to_numpy())
+        assert group["n_records"].iloc[0] == (
+            (iv5out.dem_group["age"] == age) &
+            (iv5out.dem_group["sex"] == sex)).sum()
+
+
+def test_stratified_csmf_user_variable():
+    ids = iv5out.results["VA5"]["ID"]
+    region = Series(["north", "south"] * 100, index=ids, name="region")
+    result = stratified_csmf(iv5out, by=[region, "sex"], top=None)
+    assert list(result.columns[0:2]) == ["region", "sex"]
+    assert result.groupby(["region", "sex"]).ngroups == 4
+    assert result.groupby(["region", "sex"])["csmf"].sum().round(10).eq(
+        1).all()
+    north = result[result["region"] == "north"]
+    assert north["n_records"].drop_duplicates().sum() == 100
+
+
+def test_stratified_csmf_detailed_age():
+    result = stratified_csmf(iv5out, by="detailed_age")
+    assert "detailed_age" not in iv5out.dem_group.columns
+    checked = InterVA5(va_data, hiv="h", malaria="l", write=False,
+                       return_checked_data=True, verbose=False)
+    checked.run()
+    checked_data = checked.results["checked_data"]
+    expected = Series([_get_age_group_all(checked_data.iloc[i])
+                       for i in range(checked_data.shape[0])])
+    assert set(result["detailed_age"]) == set(expected)
+    n_records = result.drop_duplicates("detailed_age").set_index(
+        "detailed_age")["n_records"]
+    assert n_records.to_dict() == expected.value_counts().to_dict()
+
+
+def test_stratified_csmf_exception():
+    with pytest.raises(ArgumentException):
+        stratified_csmf(iv5out, by="region")
+    with pytest.raises(ArgumentException):
+        stratified_csmf(iv5out, by=[Series([1, 2])])
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+from csv import reader
+from numpy import array
+from pandas import DataFrame, read_parquet
+
+from interva.writers import (ID_INDEX_SUFFIX, RESULT_COLUMNS, CSVWriter,
+                             IDIndex, ParquetWriter)
+
+row = ["d1", "l", "h", "n/a", " ", "Sepsis", 60, " ", " ", " ", " ", 40,
+       "Culture", 100]
+prob = array([0.5, 0.25, 1e-05])
+
+
+def read_rows(filename):
+    with open(filename, newline="") as f:
+        return list(reader(f))
+
+
+def test_csv_writer_classic(tmp_path):
+    filename = tmp_path / "out.csv"
+    with CSVWriter(filename, "classic", ["a", "b", "c"],
+                   buffer_size=2) as result_writer:
+        for _ in range(3):
+            result_writer.write(list(row), prob)
+    rows = read_rows(filename)
+    assert rows[0] == RESULT_COLUMNS
+    assert len(rows) == 4
+    assert rows[1] == [str(x) for x in row]
+
+
+def test_csv_writer_extended(tmp_path):
+    filename = tmp_path / "out.csv"
+    with CSVWriter(filename, "extended", ["a", "b", "c"]) as result_writer:
+        result_writer.write(list(row), prob)
+    rows = read_rows(filename)
+    assert rows[0] == RESULT_COLUMNS + ["a", "b", "c"]
+    assert rows[1] == [str(x) for x in row] + ["0.5", "0.25", "1e-05"]
+
+
+def test_csv_writer_append(tmp_path):
+    filename = tmp_path / "out.csv"
+    with CSVWriter(filename, "classic", []) as result_writer:
+        result_writer.write(list(row))
+    with CSVWriter(filename, "classic", [], append=True) as result_writer:
+        result_writer.write(list(row))
+    assert len(read_rows(filename)) == 3
+
+
+def test_csv_writer_buffers_rows(tmp_path):
+    filename = tmp_path / "out.csv"
+    result_writer = CSVWriter(filename, "classic", [], buffer_size=10)
+    result_writer.write(list(row))
+    assert len(read_rows(filename)) == 1
+    result_writer.close()
+    assert len(read_rows(filename)) == 2
+
+
+def test_parquet_writer(tmp_path):
+    pytest.importorskip("pyarrow")
+    filename = tmp_path / "out.parquet"
+    with ParquetWriter(filename, ["a", "b", "c"],
+                       buffer_size=2) as result_writer:
+        for _ in range(3):
+            result_writer.write(list(row), prob)
+    out = read_parquet(filename)
+    assert list(out.columns) == RESULT_COLUMNS + ["a", "b", "c"]
+    assert out.shape[0] == 3
+    assert out["ID"].tolist() == ["d1"] * 3
+    assert out["LIK1"].tolist() == [60] * 3
+    assert out["LIK2"].isna().all()
+    assert out["CAUSE2"].tolist() == [" "] * 3
+    assert out[["a", "b", "c"]].to_numpy().tolist() == [prob.tolist()] * 3
+
+
+def test_id_index_from_output(tmp_path):
+    filename = str(tmp_path / "out")
+    with CSVWriter(filename + ".csv", "classic", ["a", "b", "c"]) as w:
+        w.write(["d1"] + row[1:], prob)
+        w.write(["2"] + row[1:], prob)
+    id_index = IDIndex(filename)
+    assert len(id_index) == 2
+    assert "d1" in id_index
+    assert 2 in id_index
+    va_chunk = DataFrame({"ID": ["d1", "d3", 2, 4], "x": range(4)})
+    assert id_index.new_records(va_chunk)["x"].tolist() == [1, 3]
+    id_index.save()
+    with open(filename + ID_INDEX_SUFFIX) as f:
+        assert sorted(f.read().split()) == ["2", "4", "d1", "d3"]
+    assert len(IDIndex(filename)) == 4
+
+
+def test_id_index_without_output(tmp_path):
+    id_index = IDIndex(str(tmp_path / "out"))
+    assert len(id_index) == 0
+    va_chunk = DataFrame({"ID": ["d1", "d2"]})
+    assert id_index.new_records(va_chunk).shape[0] == 2